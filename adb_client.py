@@ -0,0 +1,305 @@
+# adb_client.py
+# Cliente del protocolo "smart socket" del servidor ADB (puerto 5037).
+# Habla directamente con el servidor local en lugar de lanzar el binario adb
+# por cada comando.
+import asyncio
+import socket
+import struct
+import threading
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5037
+
+# ids de paquete del protocolo shell v2
+SHELL_V2_STDIN = 0
+SHELL_V2_STDOUT = 1
+SHELL_V2_STDERR = 2
+SHELL_V2_EXIT = 3
+SHELL_V2_CLOSE_STDIN = 4
+
+
+class AdbError(Exception):
+    """El servidor ADB respondió FAIL (dispositivo inexistente, servicio no soportado...)."""
+
+
+class AdbClient:
+    """
+    Cliente mínimo del servidor ADB.
+    Cada petición abre un socket TCP nuevo (barato en localhost), así que una
+    instancia puede usarse desde varios hilos a la vez.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._features = {}  # serial -> set de features del dispositivo
+        self._features_lock = threading.Lock()
+
+    # -------------------------
+    # framing
+    # -------------------------
+    def connect(self, timeout=None):
+        """Abre un socket con el servidor. Lanza OSError si no está corriendo."""
+        t = self.timeout if timeout is None else timeout
+        sock = socket.create_connection((self.host, self.port), timeout=t)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def send_request(sock, request):
+        """Envía una petición con prefijo de longitud (4 dígitos hex)."""
+        data = request.encode("utf-8")
+        sock.sendall(b"%04x" % len(data) + data)
+
+    @staticmethod
+    def read_exact(sock, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("conexión cerrada por el servidor ADB")
+            buf += chunk
+        return bytes(buf)
+
+    @classmethod
+    def read_prefixed(cls, sock):
+        """Lee un bloque <4 hex de longitud><datos>."""
+        length = int(cls.read_exact(sock, 4), 16)
+        return cls.read_exact(sock, length) if length else b""
+
+    @classmethod
+    def check_status(cls, sock):
+        """Lee OKAY/FAIL. En FAIL lanza AdbError con el mensaje del servidor."""
+        status = cls.read_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            msg = cls.read_prefixed(sock).decode("utf-8", errors="replace")
+            raise AdbError(msg)
+        raise AdbError(f"respuesta inesperada del servidor: {status!r}")
+
+    @staticmethod
+    def read_all(sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    # -------------------------
+    # servicios host:
+    # -------------------------
+    def host_request(self, request):
+        """Petición host:* que responde con un bloque con longitud (host:version, host:devices...)."""
+        sock = self.connect()
+        try:
+            self.send_request(sock, request)
+            self.check_status(sock)
+            return self.read_prefixed(sock).decode("utf-8", errors="replace")
+        finally:
+            sock.close()
+
+    def devices(self):
+        """Lista de (serial, estado) según host:devices."""
+        out = self.host_request("host:devices")
+        result = []
+        for line in out.splitlines():
+            parts = line.split()
+            if len(parts) >= 2:
+                result.append((parts[0], parts[1]))
+        return result
+
+    def features(self, serial):
+        """Features del dispositivo (cacheadas por serial)."""
+        with self._features_lock:
+            cached = self._features.get(serial)
+        if cached is not None:
+            return cached
+        try:
+            out = self.host_request(f"host-serial:{serial}:features")
+            feats = set(f.strip() for f in out.split(",") if f.strip())
+        except AdbError:
+            feats = set()
+        with self._features_lock:
+            self._features[serial] = feats
+        return feats
+
+    def forget(self, serial):
+        """Olvida la información cacheada de un dispositivo (p.ej. tras reconectarlo)."""
+        with self._features_lock:
+            self._features.pop(serial, None)
+
+    # -------------------------
+    # servicios de dispositivo
+    # -------------------------
+    def open_service(self, serial, service, timeout=None):
+        """
+        Abre host:transport:<serial> y a continuación el servicio indicado
+        ('shell:...', 'exec:...'). Devuelve el socket ya conectado al servicio.
+        """
+        sock = self.connect(timeout)
+        try:
+            self.send_request(sock, f"host:transport:{serial}")
+            self.check_status(sock)
+            self.send_request(sock, service)
+            self.check_status(sock)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def shell(self, serial, command, timeout=None):
+        """
+        Ejecuta `command` con el shell del dispositivo.
+        Devuelve (stdout, stderr, rc) como texto. Con shell v2 se obtienen
+        stderr y código de salida reales; con el protocolo antiguo todo llega
+        por stdout y rc es 0.
+        """
+        if "shell_v2" in self.features(serial):
+            out, err, rc = self._shell_v2(serial, command, timeout)
+        else:
+            sock = self.open_service(serial, f"shell:{command}", timeout)
+            try:
+                out, err, rc = self.read_all(sock), b"", 0
+            finally:
+                sock.close()
+        return (out.decode("utf-8", errors="replace"),
+                err.decode("utf-8", errors="replace"), rc)
+
+    def _shell_v2(self, serial, command, timeout=None):
+        sock = self.open_service(serial, f"shell,v2,raw:{command}", timeout)
+        out, err, rc = bytearray(), bytearray(), 0
+        try:
+            while True:
+                try:
+                    header = self.read_exact(sock, 5)
+                except ConnectionError:
+                    break
+                pid, length = struct.unpack("<BI", header)
+                payload = self.read_exact(sock, length) if length else b""
+                if pid == SHELL_V2_STDOUT:
+                    out += payload
+                elif pid == SHELL_V2_STDERR:
+                    err += payload
+                elif pid == SHELL_V2_EXIT:
+                    rc = payload[0] if payload else 0
+                    break
+        finally:
+            sock.close()
+        return bytes(out), bytes(err), rc
+
+    def exec_out(self, serial, command, timeout=None):
+        """Ejecuta `command` con exec: (sin PTY ni conversión de saltos de línea). Devuelve bytes."""
+        sock = self.open_service(serial, f"exec:{command}", timeout)
+        try:
+            return self.read_all(sock)
+        finally:
+            sock.close()
+
+
+class AsyncAdbClient:
+    """
+    Variante asyncio de AdbClient (mismo protocolo, streams de asyncio) para
+    conducir cientos de dispositivos desde un único event loop.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self._features = {}
+
+    async def connect(self):
+        return await asyncio.open_connection(self.host, self.port)
+
+    @staticmethod
+    async def send_request(writer, request):
+        data = request.encode("utf-8")
+        writer.write(b"%04x" % len(data) + data)
+        await writer.drain()
+
+    @staticmethod
+    async def check_status(reader):
+        try:
+            status = await reader.readexactly(4)
+            if status == b"OKAY":
+                return
+            if status == b"FAIL":
+                length = int(await reader.readexactly(4), 16)
+                msg = (await reader.readexactly(length)).decode("utf-8", errors="replace")
+                raise AdbError(msg)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("conexión cerrada por el servidor ADB")
+        raise AdbError(f"respuesta inesperada del servidor: {status!r}")
+
+    @staticmethod
+    def _close(writer):
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+    async def host_request(self, request):
+        reader, writer = await self.connect()
+        try:
+            await self.send_request(writer, request)
+            await self.check_status(reader)
+            length = int(await reader.readexactly(4), 16)
+            return (await reader.readexactly(length)).decode("utf-8", errors="replace")
+        finally:
+            self._close(writer)
+
+    async def features(self, serial):
+        cached = self._features.get(serial)
+        if cached is None:
+            try:
+                out = await self.host_request(f"host-serial:{serial}:features")
+                cached = set(f.strip() for f in out.split(",") if f.strip())
+            except AdbError:
+                cached = set()
+            self._features[serial] = cached
+        return cached
+
+    async def open_service(self, serial, service):
+        reader, writer = await self.connect()
+        try:
+            await self.send_request(writer, f"host:transport:{serial}")
+            await self.check_status(reader)
+            await self.send_request(writer, service)
+            await self.check_status(reader)
+        except BaseException:
+            self._close(writer)
+            raise
+        return reader, writer
+
+    async def shell(self, serial, command):
+        """Igual que AdbClient.shell: devuelve (stdout, stderr, rc) como texto."""
+        if "shell_v2" in await self.features(serial):
+            reader, writer = await self.open_service(serial, f"shell,v2,raw:{command}")
+            out, err, rc = bytearray(), bytearray(), 0
+            try:
+                while True:
+                    try:
+                        pid, length = struct.unpack("<BI", await reader.readexactly(5))
+                        payload = await reader.readexactly(length) if length else b""
+                    except asyncio.IncompleteReadError:
+                        break
+                    if pid == SHELL_V2_STDOUT:
+                        out += payload
+                    elif pid == SHELL_V2_STDERR:
+                        err += payload
+                    elif pid == SHELL_V2_EXIT:
+                        rc = payload[0] if payload else 0
+                        break
+            finally:
+                self._close(writer)
+        else:
+            reader, writer = await self.open_service(serial, f"shell:{command}")
+            try:
+                out, err, rc = await reader.read(), b"", 0
+            finally:
+                self._close(writer)
+        return (bytes(out).decode("utf-8", errors="replace"),
+                bytes(err).decode("utf-8", errors="replace"), rc)
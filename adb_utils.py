@@ -1,36 +1,221 @@
 # adb_utils.py
 import subprocess
 import shlex
+import socket
+import threading
+import time
+from collections import namedtuple
+from adb_client import AdbClient, AdbError
+from ui_hierarchy import UiHierarchy, UiParseError
 
 # Configuración (modifica si adb/scrcpy no están en PATH)
 ADB_PATH = "adb"
+# Servidor ADB local: si está disponible se le habla por socket en vez de lanzar adb
+USE_ADB_SERVER = True
+ADB_SERVER_HOST = "127.0.0.1"
+ADB_SERVER_PORT = 5037
+# Código de salida cuando un comando supera su timeout (como `timeout` de coreutils)
+TIMEOUT_RC = 124
+# Código de salida de un comando mal formado que no se llega a enviar (como un error de sintaxis de sh)
+SYNTAX_ERROR_RC = 2
+# Código de salida cuando la sesión se rompe con el comando ya enviado: no se sabe si llegó a ejecutarse
+INTERRUPTED_RC = 254
+# Timeout (s) de un comando adb cuando quien llama no da uno (None = sin límite)
+ADB_CMD_TIMEOUT = 300
 
-def run_adb_cmd_raw(cmd_list):
-    """Ejecuta comando (lista) y devuelve stdout, stderr, rc"""
+# Errores de transporte (el comando puede no haber llegado): los únicos que se reintentan
+TRANSIENT_ERRORS = ("device offline", "closed", "connection reset", "broken pipe", "protocol fault",
+                    "sesión cerrada", "no se pudo escribir")
+
+# Resultado de un comando adb: rc TIMEOUT_RC si venció el timeout; attempts cuenta los reintentos.
+# stderr del propio comando solo llega separado por `adb shell` y shell v2; por la sesión
+# persistente de shell_pool o el protocolo shell antiguo va mezclado en stdout y stderr
+# solo trae los errores de transporte/ejecución que añade este código ("error: ...")
+AdbResult = namedtuple("AdbResult", ["stdout", "stderr", "rc", "elapsed", "attempts"])
+
+
+class AdbCommandError(AdbError):
+    """Un comando terminó con rc != 0; `result` es su AdbResult."""
+
+    def __init__(self, command, result):
+        detail = (result.stderr or result.stdout or "").strip()
+        super().__init__(f"{command}: rc {result.rc}" + (f" ({detail})" if detail else ""))
+        self.command = command
+        self.result = result
+
+
+class RetryPolicy:
+    """
+    Reintentos con backoff exponencial solo ante errores de transporte
+    (ver TRANSIENT_ERRORS). Un rc distinto de 0 por el propio comando, un
+    timeout o una sesión rota con el comando ya enviado (INTERRUPTED_RC) no
+    se reintentan: repetirlo no cambiaría el resultado o podría ejecutarlo
+    dos veces.
+    """
+
+    def __init__(self, attempts=3, backoff=0.5, max_backoff=4.0, timeout=None, retry_on=TRANSIENT_ERRORS):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.retry_on = tuple(p.lower() for p in retry_on)
+
+    def is_transient(self, stderr, rc):
+        if rc in (0, TIMEOUT_RC, INTERRUPTED_RC):
+            return False
+        text = (stderr or "").lower()
+        return any(p in text for p in self.retry_on)
+
+    def delay(self, attempt):
+        """Espera antes del reintento número `attempt` (1 = primer reintento)."""
+        return min(self.backoff * (2 ** (attempt - 1)), self.max_backoff)
+
+    def run(self, fn):
+        """Llama fn(timeout) -> (stdout, stderr, rc) según la política. Devuelve AdbResult."""
+        start = time.time()
+        attempt = 1
+        while True:
+            out, err, rc = fn(self.timeout)
+            if attempt >= self.attempts or not self.is_transient(err, rc):
+                return AdbResult(out, err, rc, time.time() - start, attempt)
+            time.sleep(self.delay(attempt))
+            attempt += 1
+
+    def worst_case(self):
+        """Duración máxima de una llamada con todos sus reintentos (None si no hay timeout)."""
+        if self.timeout is None:
+            return None
+        return self.timeout * self.attempts + sum(self.delay(i) for i in range(1, self.attempts))
+
+    def with_timeout(self, timeout):
+        """Copia de la política con otro timeout por llamada."""
+        return RetryPolicy(self.attempts, self.backoff, self.max_backoff, timeout, self.retry_on)
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+NO_RETRY = RetryPolicy(attempts=1)
+
+_client = None
+_device_tracker = None  # device_tracker.DeviceTracker activo (si lo hay)
+_children = {}  # serial -> procesos adb en curso para ese dispositivo (ver kill_adb_children)
+_children_lock = threading.Lock()
+
+def get_adb_client():
+    """Cliente compartido del servidor ADB (se crea al primer uso)."""
+    global _client
+    if _client is None or (_client.host, _client.port) != (ADB_SERVER_HOST, ADB_SERVER_PORT):
+        _client = AdbClient(ADB_SERVER_HOST, ADB_SERVER_PORT)
+    return _client
+
+def _run_via_server(cmd_list, timeout=None):
+    """
+    Atiende por socket los comandos `adb -s <serial> shell|exec-out ...`.
+    Devuelve (stdout, stderr, rc) o None si hay que usar el binario
+    (comando no soportado o servidor no disponible).
+    """
+    if not USE_ADB_SERVER or len(cmd_list) < 5:
+        return None
+    if cmd_list[0] != ADB_PATH or cmd_list[1] != "-s" or cmd_list[3] not in ("shell", "exec-out"):
+        return None
+    serial, service = cmd_list[2], cmd_list[3]
+    # adb une los argumentos con espacios antes de mandarlos al dispositivo
+    command = " ".join(cmd_list[4:])
+    client = get_adb_client()
+    try:
+        if service == "shell":
+            return client.shell(serial, command, timeout)
+        data = client.exec_out(serial, command, timeout)
+        return data.decode("utf-8", errors="replace"), "", 0
+    except socket.timeout:
+        return "", f"error: timeout ({timeout}s)", TIMEOUT_RC
+    except AdbError as e:
+        return "", f"error: {e}", 1
+    except ConnectionRefusedError:
+        # servidor no levantado -> binario adb
+        return None
+    except OSError as e:
+        return "", f"error: {e}", 1
+
+def _child_serial(cmd_list):
+    return cmd_list[2] if len(cmd_list) > 2 and cmd_list[1] == "-s" else None
+
+def kill_adb_children(serial):
+    """Mata los procesos adb en curso para `serial` (p.ej. desde el watchdog). Devuelve cuántos."""
+    with _children_lock:
+        procs = list(_children.get(serial, ()))
+    for p in procs:
+        try:
+            p.kill()
+        except OSError:
+            pass
+    return len(procs)
+
+def run_adb_cmd_raw(cmd_list, timeout=None):
+    """
+    Ejecuta comando (lista) y devuelve stdout, stderr, rc (TIMEOUT_RC si vence
+    `timeout`, por defecto ADB_CMD_TIMEOUT)
+    """
+    if timeout is None:
+        timeout = ADB_CMD_TIMEOUT
+    res = _run_via_server(cmd_list, timeout)
+    if res is not None:
+        return res
     try:
-        p = subprocess.run(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return p.stdout, p.stderr, p.returncode
+        p = subprocess.Popen(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     except FileNotFoundError as e:
         return "", str(e), 127
+    serial = _child_serial(cmd_list)
+    with _children_lock:
+        _children.setdefault(serial, set()).add(p)
+    try:
+        out, err = p.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        p.kill()
+        out, _ = p.communicate()
+        return out or "", f"error: timeout ({timeout}s)", TIMEOUT_RC
+    finally:
+        with _children_lock:
+            procs = _children.get(serial)
+            procs.discard(p)
+            if not procs:
+                del _children[serial]
+    if p.returncode < 0 and not err:
+        err = f"error: proceso adb terminado (señal {-p.returncode})"
+    return out, err, p.returncode
 
-def run_adb_command(serial, command):
+def run_adb(cmd_list, policy=None):
+    """Como run_adb_cmd_raw pero con reintentos (RetryPolicy) y resultado AdbResult."""
+    policy = policy or DEFAULT_RETRY_POLICY
+    return policy.run(lambda timeout: run_adb_cmd_raw(cmd_list, timeout=timeout))
+
+def run_adb_command(serial, command, policy=None):
     """
-    Ejecuta un comando ADB para un dispositivo específico.
+    Ejecuta un comando ADB para un dispositivo específico y devuelve un AdbResult.
     `command` es la parte después de adb -s <serial>
     Ej: "shell pm list packages"
+    Nunca se repite sin -s: con varios dispositivos iría a otro o fallaría igual.
     """
     # shlex.split para respetar comillas si vienen
-    parts = shlex.split(command)
-    full = [ADB_PATH, "-s", serial] + parts
-    out, err, rc = run_adb_cmd_raw(full)
-    if rc != 0:
-        # intentar sin -s si falla (fallback)
-        out2, err2, rc2 = run_adb_cmd_raw([ADB_PATH] + parts)
-        return out2 if out2 else err2
-    return out
+    try:
+        parts = shlex.split(command)
+    except ValueError as e:
+        return AdbResult("", f"error: comando inválido ({e}): {command}", SYNTAX_ERROR_RC, 0.0, 1)
+    return run_adb([ADB_PATH, "-s", serial] + parts, policy)
+
+def set_device_tracker(tracker):
+    """Registra el tracker de dispositivos: list_devices leerá de él sin consultar al servidor."""
+    global _device_tracker
+    _device_tracker = tracker
 
 def list_devices():
     """Lista dispositivos con adb devices"""
+    if _device_tracker is not None and _device_tracker.connected.is_set():
+        return list(_device_tracker.devices())
+    if USE_ADB_SERVER:
+        try:
+            return [serial for serial, state in get_adb_client().devices() if state == "device"]
+        except (OSError, AdbError):
+            pass
     out, err, rc = run_adb_cmd_raw([ADB_PATH, "devices"])
     devices = []
     if out:
@@ -41,47 +226,83 @@ def list_devices():
                     devices.append(parts[0])
     return devices
 
+# Formas de obtener el XML de la UI, en orden de preferencia:
+#   "tty": uiautomator escribe en /dev/tty y exec-out lo trae sin pasar por disco
+#   ruta: dump a fichero + cat + rm, todo en una sola llamada shell
+UI_DUMP_METHODS = ("tty", "/sdcard/ui.xml", "/data/local/tmp/ui.xml", "/storage/emulated/0/ui.xml")
+_ui_dump_method = {}  # serial -> método que funcionó la última vez
+
+def _extract_ui_xml(out):
+    """Recorta el XML de la salida (uiautomator añade 'UI hierchary dumped to: ...')."""
+    if not out:
+        return None
+    start = out.find("<?xml")
+    if start < 0:
+        start = out.find("<hierarchy")
+    end = out.rfind("</hierarchy>")
+    if start < 0 or end < 0:
+        return None
+    return out[start:end + len("</hierarchy>")]
+
+def _read_ui_xml_with(serial, method):
+    if method == "tty":
+        cmd = [ADB_PATH, "-s", serial, "exec-out", "uiautomator", "dump", "/dev/tty"]
+    else:
+        cmd = [ADB_PATH, "-s", serial, "shell",
+               f"uiautomator dump {method} >/dev/null && cat {method}; rm -f {method}"]
+    out, err, rc = run_adb_cmd_raw(cmd)
+    return _extract_ui_xml(out) if rc == 0 else None
+
+def read_ui_xml(serial, log_cb=None):
+    """
+    XML de la UI actual o None. Usa el método que ya funcionó para este
+    dispositivo; solo si falla recorre de nuevo los alternativos (una vez).
+    """
+    known = _ui_dump_method.get(serial)
+    if known is not None:
+        xml = _read_ui_xml_with(serial, known)
+        if xml is not None:
+            return xml
+        _ui_dump_method.pop(serial, None)
+    for method in UI_DUMP_METHODS:
+        if method == known:
+            continue
+        xml = _read_ui_xml_with(serial, method)
+        if xml is not None:
+            _ui_dump_method[serial] = method
+            if log_cb:
+                log_cb(f"[{serial}] Dump de UI vía {method}")
+            return xml
+    if log_cb:
+        log_cb(f"[{serial}] ❌ No se pudo extraer el XML")
+    return None
+
+def dump_ui_hierarchy(serial, log_cb=None):
+    """Jerarquía de UI parseada (ui_hierarchy.UiHierarchy) o None."""
+    xml = read_ui_xml(serial, log_cb)
+    if xml is None:
+        return None
+    try:
+        return UiHierarchy(xml)
+    except UiParseError as e:
+        if log_cb:
+            log_cb(f"[{serial}] ERROR parseando XML de UI: {e}")
+        return None
+
 def dump_ui_xml(serial, log_cb=None):
-    """Extrae el XML de la UI y lo muestra en logs"""
+    """Extrae el XML de la UI y muestra en logs los campos de texto e ids encontrados"""
     try:
-        # Try multiple paths
-        paths = [
-            "/sdcard/ui.xml",
-            "/data/local/tmp/ui.xml",
-            "/storage/emulated/0/ui.xml"
-        ]
-        
-        for path in paths:
-            if log_cb:
-                log_cb(f"[{serial}] Intentando dump en: {path}")
-            
-            out, err, rc = run_adb_cmd_raw([ADB_PATH, "-s", serial, "shell", "uiautomator", "dump", path])
-            
-            if rc == 0:
-                if log_cb:
-                    log_cb(f"[{serial}] ✅ Dump exitoso en {path}")
-                
-                # Leer el contenido
-                content_out, content_err, content_rc = run_adb_cmd_raw([ADB_PATH, "-s", serial, "shell", "cat", path])
-                
-                if content_rc == 0 and content_out:
-                    if log_cb:
-                        log_cb(f"[{serial}] Contenido XML:")
-                        # Mostrar solo las primeras líneas para no saturar
-                        lines = content_out.split('\n')
-                        for line in lines[:20]:  # Primeras 20 líneas
-                            if any(keyword in line.lower() for keyword in ['edittext', 'search', 'text', 'id=']):
-                                log_cb(f"[{serial}] {line.strip()}")
-                    
-                    # Limpiar
-                    run_adb_cmd_raw([ADB_PATH, "-s", serial, "shell", "rm", path])
-                    return True
-                
+        tree = dump_ui_hierarchy(serial, log_cb)
+        if tree is None:
+            return False
         if log_cb:
-            log_cb(f"[{serial}] ❌ No se pudo extraer el XML")
-        return False
-            
+            log_cb(f"[{serial}] ✅ Dump exitoso: {tree.stats}")
+            # Mostrar solo los primeros campos para no saturar
+            shown = [n for n in tree if n.resource_id or "EditText" in n.class_name][:20]
+            for node in shown:
+                log_cb(f"[{serial}] {node.class_name} id={node.resource_id} text={node.text!r}")
+        return True
     except Exception as e:
         if log_cb:
             log_cb(f"[{serial}] ERROR en dump_ui_xml: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,319 @@
+# async_executor.py
+# Variante asyncio de script_executor: las esperas son asyncio.sleep y el I/O
+# ADB va por sockets asyncio al servidor, así un solo event loop conduce
+# cientos de dispositivos sin un hilo por dispositivo.
+# Mismo formato de script y mismo contrato de log_cb que la versión con hilos.
+import asyncio
+import time
+import weakref
+import expressions
+import adb_utils
+from adb_client import AsyncAdbClient, AdbError
+from shell_pool import parse_error
+from script_compiler import compile_script, ScriptCompileError
+from uia_pool import get_uia_cache
+from ui_hierarchy import invalidate_snapshot
+import ui_wait
+from ui_wait import WaitCondition, wait_for_async, wait_for_timeout, record_wait_result
+import watchdog
+from watchdog import DeviceTimeout, action_timeout, handle_timeout
+import tracing
+import script_executor
+from script_executor import (
+    CONTROL_ACTIONS, VARIABLE_ACTIONS, ADB_ACTIONS, UIA_ACTIONS, INPUT_ACTIONS,
+    step_wait, control_flow_next, apply_variable_step, adb_step_command,
+    run_uia_step, connect_uia, new_run_stats, finish_run_stats,
+    plan_input_batch, record_input_batch, check_adb_step, adaptive_wait, step_limit, ScriptTimeout, BATCH_TIMEOUT_MARGIN,
+)
+
+# Dispositivos ejecutándose a la vez en run_fleet (None = todos)
+DEFAULT_MAX_CONCURRENCY = None
+# Granularidad con la que las esperas largas comprueban stop_event
+STOP_POLL_INTERVAL = 0.25
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def _client():
+    # un cliente por event loop (los streams no se comparten entre loops)
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or (client.host, client.port) != (adb_utils.ADB_SERVER_HOST, adb_utils.ADB_SERVER_PORT):
+        client = AsyncAdbClient(adb_utils.ADB_SERVER_HOST, adb_utils.ADB_SERVER_PORT)
+        _clients[loop] = client
+    return client
+
+
+async def _run_shell_once(serial, command):
+    if adb_utils.USE_ADB_SERVER:
+        try:
+            return await _client().shell(serial, command)
+        except AdbError as e:
+            return "", f"error: {e}", 1
+        except ConnectionRefusedError:
+            pass  # servidor no levantado -> binario adb
+        except OSError as e:
+            return "", f"error: {e}", 255
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            adb_utils.ADB_PATH, "-s", serial, "shell", command,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    except FileNotFoundError as e:
+        return "", str(e), 127
+    try:
+        out, err = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        raise
+    return out.decode("utf-8", errors="replace"), err.decode("utf-8", errors="replace"), proc.returncode
+
+
+async def run_shell_async(serial, command, timeout=None, policy=None):
+    """
+    Comando de shell en el dispositivo sin bloquear el loop. Devuelve un
+    adb_utils.AdbResult; reintenta los errores de transporte según `policy`
+    (mismas reglas que shell_pool.run_shell, también para los comandos mal formados).
+    """
+    error = parse_error(command)
+    if error:
+        return adb_utils.AdbResult("", f"error: comando inválido ({error}): {command}", adb_utils.SYNTAX_ERROR_RC, 0.0, 1)
+    policy = policy or adb_utils.DEFAULT_RETRY_POLICY
+    timeout = policy.timeout if timeout is None else timeout
+    start = time.time()
+    attempt = 1
+    while True:
+        try:
+            out, err, rc = await asyncio.wait_for(_run_shell_once(serial, command), timeout)
+        except asyncio.TimeoutError:
+            out, err, rc = "", f"error: timeout ({timeout}s)", adb_utils.TIMEOUT_RC
+        if attempt >= policy.attempts or not policy.is_transient(err, rc):
+            return adb_utils.AdbResult(out, err, rc, time.time() - start, attempt)
+        await asyncio.sleep(policy.delay(attempt))
+        attempt += 1
+
+
+async def _sleep(secs, stop_event):
+    """asyncio.sleep que corta antes si se activa stop_event."""
+    if not stop_event:
+        await asyncio.sleep(secs)
+        return
+    loop = asyncio.get_running_loop()
+    end = loop.time() + secs
+    while not stop_event.is_set():
+        remaining = end - loop.time()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(remaining, STOP_POLL_INTERVAL))
+
+
+async def execute_script_for_device_async(serial, script, log_cb=None, stop_event=None, step_cb=None,
+                                         script_timeout=None, tracer=None):
+    """
+    Equivalente asíncrono de script_executor.execute_script_for_device.
+    stop_event puede ser threading.Event o asyncio.Event (solo se usa is_set()).
+    Las acciones UIA (uiautomator2 es bloqueante) se ejecutan en un hilo aparte.
+    step_cb, los plazos (script_timeout, watchdog.action_timeout), tracer y el
+    resumen devuelto son los mismos que en la versión con hilos.
+    """
+    def log(msg):
+        if log_cb:
+            log_cb(f"[{serial}] {msg}")
+
+    try:
+        program = compile_script(script)
+    except ScriptCompileError as e:
+        log(str(e))
+        return
+    steps = program.steps
+    if script_timeout is None:
+        script_timeout = watchdog.SCRIPT_TIMEOUT
+    deadline = time.time() + script_timeout if script_timeout else None
+    tracer = tracer or tracing.active_tracer()
+
+    def limit(timeout):
+        return step_limit(timeout, deadline)
+
+    d = None
+    if script_executor.ADAPTIVE_WAITS or any(s.get("action") in UIA_ACTIONS or s.get("action") == "wait_for"
+                                             or s.get("adaptive_wait") for s in steps):
+        d = await asyncio.to_thread(connect_uia, serial, log)
+
+    stats = new_run_stats(serial, len(steps))
+    vars_store = {}
+    iterations = {}
+    step_idx = 0
+
+    def eval_expression(expr):
+        return expressions.eval_expression(expr, vars_store)
+
+    def eval_condition(condition):
+        return expressions.eval_condition(condition, vars_store)
+
+    async def poll(condition, timeout, initial_delay=0.0):
+        # una consulta colgada en su hilo no se puede cancelar: plazo más un margen, como en la versión con hilos
+        guard = timeout + action_timeout("wait_for")
+        try:
+            return await asyncio.wait_for(wait_for_async(serial, d, condition, timeout, stop_event, initial_delay),
+                                          guard)
+        except asyncio.TimeoutError:
+            raise DeviceTimeout(f"espera sin respuesta en {guard:g}s") from None
+
+    async def pause(secs, adaptive):
+        # después de esperar la UI ya no es la del snapshot
+        if not adaptive:
+            await _sleep(secs, stop_event)
+        else:
+            start = time.time()
+            met = await poll(ui_wait.settle_condition(), limit(secs), ui_wait.ADAPTIVE_SETTLE)
+            log(f"espera adaptativa: {time.time() - start:.2f}s de {secs:g}s" + ("" if met else " (UI sin estabilizar)"))
+        invalidate_snapshot(serial)
+
+    while step_idx < len(steps):
+        if stop_event and stop_event.is_set():
+            log("Ejecución interrumpida por stop_event.")
+            stats["stopped"] = True
+            break
+        if deadline and time.time() > deadline:
+            log(f"Script superó su plazo de {script_timeout}s.")
+            stats["timed_out"] = True
+            watchdog.get_health_registry().record_timeout(serial, "script", unhealthy=False)
+            break
+
+        step = steps[step_idx]
+        action = step.get("action")
+        log(f"Step {step_idx+1}: {action} -> {step}")
+        trace = tracer.begin_step(serial, step_idx, action)
+        ok = False
+
+        try:
+            batch = plan_input_batch(program, step_idx, eval_expression, log)
+            if batch is not None:
+                trace.action, trace.label = "batch", f"steps {batch.start+1}-{batch.end}"
+                with trace.phase("adb"):
+                    res = await run_shell_async(serial, batch.script,
+                                                timeout=limit(batch.duration + BATCH_TIMEOUT_MARGIN))
+                if res.rc == adb_utils.TIMEOUT_RC:
+                    raise DeviceTimeout(f"lote de pasos {batch.start+1}-{batch.end}: {res.stderr}")
+                failed = stats["failed"]
+                record_input_batch(serial, batch, res, stats, step_cb, log)
+                invalidate_snapshot(serial)
+                ok = stats["failed"] == failed
+                step_idx = batch.end
+                continue
+
+            if action in CONTROL_ACTIONS:
+                step_idx = control_flow_next(program, step_idx, iterations, eval_condition, log)
+                ok = True
+                continue
+
+            if action in VARIABLE_ACTIONS:
+                apply_variable_step(action, step, vars_store, eval_expression, log)
+
+            elif action in ADB_ACTIONS:
+                cmd = adb_step_command(action, step, eval_expression, log)
+                if cmd:
+                    with trace.phase("adb"):
+                        res = await run_shell_async(serial, cmd, timeout=limit(action_timeout(action, step)))
+                    check_adb_step(action, cmd, res, log)
+
+            elif action == "sleep":
+                secs = float(eval_expression(step.get("seconds", 1)))
+                log(f"durmiendo {secs}s")
+                with trace.phase("sleep"):
+                    await pause(secs, adaptive_wait(action, step, secs))
+
+            elif action == "wait_for":
+                condition = WaitCondition.from_step(step, eval_expression)
+                start = time.time()
+                with trace.phase("uia"):
+                    met = await poll(condition, limit(wait_for_timeout(step, eval_expression)))
+                record_wait_result(step, condition, met, time.time() - start, vars_store, log)
+
+            elif action in UIA_ACTIONS:
+                # el hilo no se puede cancelar: si vence se libera el dispositivo y se sigue
+                timeout = limit(action_timeout(action, step))
+                try:
+                    with trace.phase("uia"):
+                        await asyncio.wait_for(asyncio.to_thread(run_uia_step, d, serial, action, step, vars_store,
+                                                                 eval_expression, log), timeout)
+                except asyncio.TimeoutError:
+                    raise DeviceTimeout(f"{action} sin respuesta en {timeout:g}s") from None
+
+            else:
+                log(f"Acción desconocida: {action}")
+
+            if action in INPUT_ACTIONS:
+                invalidate_snapshot(serial)
+            wait = step_wait(action, step)
+            if wait:
+                with trace.phase("sleep"):
+                    await pause(wait, adaptive_wait(action, step, wait))
+            stats["executed"] += 1
+            ok = True
+            if step_cb:
+                step_cb(serial, step_idx, action, True)
+            step_idx += 1
+
+        except ScriptTimeout:
+            log(f"Script superó su plazo de {script_timeout}s.")
+            stats["timed_out"] = True
+            watchdog.get_health_registry().record_timeout(serial, "script", unhealthy=False)
+            break
+
+        except DeviceTimeout as e:
+            handle_timeout(serial, e)
+            log(f"TIMEOUT en step {step_idx+1}: {e}")
+            stats["executed"] += 1
+            stats["failed"] += 1
+            stats["timed_out"] = True
+            if step_cb:
+                step_cb(serial, step_idx, action, False)
+            break
+
+        except Exception as e:
+            log(f"ERROR en step {step_idx+1}: {e}")
+            if action in UIA_ACTIONS and d is not None:
+                # la conexión pudo quedar rota: descartarla y reconectar
+                get_uia_cache().invalidate(serial)
+                d = await asyncio.to_thread(connect_uia, serial, log)
+            stats["executed"] += 1
+            stats["failed"] += 1
+            if step_cb:
+                step_cb(serial, step_idx, action, False)
+            step_idx += 1
+
+        finally:
+            tracer.end_step(trace, ok)
+
+    finish_run_stats(stats)
+    log("Script finalizado.")
+    return stats
+
+
+async def run_fleet_async(serials, script, log_cb=None, stop_event=None, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                          step_cb=None):
+    """Ejecuta el mismo script en todos los seriales dentro del loop actual. Devuelve los resúmenes."""
+    program = compile_script(script)
+    sem = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+    health = watchdog.get_health_registry()
+
+    async def one(serial):
+        if not health.is_healthy(serial):
+            if log_cb:
+                log_cb(f"[{serial}] Omitido: dispositivo no saludable ({health.unhealthy().get(serial)})")
+            return {"serial": serial, "error": "dispositivo no saludable"}
+        if sem is None:
+            return await execute_script_for_device_async(serial, program, log_cb, stop_event, step_cb)
+        async with sem:
+            return await execute_script_for_device_async(serial, program, log_cb, stop_event, step_cb)
+
+    results = await asyncio.gather(*(one(s) for s in serials), return_exceptions=True)
+    for serial, res in zip(serials, results):
+        if isinstance(res, Exception) and log_cb:
+            log_cb(f"[{serial}] ERROR: {res}")
+    return results
+
+
+def run_fleet(serials, script, log_cb=None, stop_event=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, step_cb=None):
+    """Punto de entrada bloqueante: crea un event loop y ejecuta run_fleet_async."""
+    return asyncio.run(run_fleet_async(serials, script, log_cb, stop_event, max_concurrency, step_cb))
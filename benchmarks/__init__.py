@@ -0,0 +1,4 @@
+# benchmarks
+# Banco de pruebas del ejecutor sin teléfonos: un servidor ADB falso (socket),
+# un ejecutable `adb` falso y un dispositivo uiautomator2 simulado, todos con
+# latencia y tasa de fallos configurables. Ver benchmarks/run.py.
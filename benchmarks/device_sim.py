@@ -0,0 +1,113 @@
+# benchmarks/device_sim.py
+# Simulación del lado del dispositivo que comparten el servidor y el adb falsos:
+# interpreta los comandos de shell que manda el ejecutor (input, am, sleep,
+# echo de los lotes, uiautomator dump...) y calcula salida, rc y demora.
+import random
+
+DEFAULT_UI_NODES = 60
+
+
+class DeviceProfile:
+    """
+    latency: segundos por comando (input, am, monkey...), jitter: +- aleatorio
+    failure_rate: probabilidad de rc 1 por comando, drop_rate: probabilidad
+    de cortar la conexión (error de transporte), sleep_scale: factor sobre los
+    `sleep` del dispositivo (0 = no esperar), ui_nodes: nodos del dump de UI.
+    """
+
+    def __init__(self, latency=0.005, jitter=0.0, failure_rate=0.0, drop_rate=0.0, sleep_scale=0.0,
+                 ui_nodes=DEFAULT_UI_NODES, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.sleep_scale = sleep_scale
+        self.ui_nodes = ui_nodes
+        self.rng = random.Random(seed)
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in ("latency", "jitter", "failure_rate", "drop_rate",
+                                               "sleep_scale", "ui_nodes")}
+
+    def command_delay(self):
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def fails(self):
+        return self.failure_rate > 0 and self.rng.random() < self.failure_rate
+
+    def drops(self):
+        return self.drop_rate > 0 and self.rng.random() < self.drop_rate
+
+
+_xml_cache = {}
+
+def ui_xml(nodes=DEFAULT_UI_NODES):
+    """Jerarquía de UI sintética con `nodes` nodos (ids com.bench:id/item_N y un botón 'OK')."""
+    xml = _xml_cache.get(nodes)
+    if xml is None:
+        parts = ['<?xml version="1.0" encoding="UTF-8"?><hierarchy rotation="0">',
+                 '<node index="0" text="" resource-id="" class="android.widget.FrameLayout" '
+                 'package="com.bench" content-desc="" clickable="false" enabled="true" bounds="[0,0][1080,2340]">']
+        for i in range(max(0, nodes - 2)):
+            y = 100 + (i % 40) * 50
+            parts.append(f'<node index="{i}" text="Item {i}" resource-id="com.bench:id/item_{i}" '
+                         f'class="android.widget.TextView" package="com.bench" content-desc="" '
+                         f'clickable="true" enabled="true" bounds="[0,{y}][1080,{y + 48}]"/>')
+        parts.append('<node index="0" text="OK" resource-id="com.bench:id/ok" class="android.widget.Button" '
+                     'package="com.bench" content-desc="ok" clickable="true" enabled="true" '
+                     'bounds="[400,2200][680,2300]"/>')
+        parts.append("</node></hierarchy>")
+        xml = _xml_cache[nodes] = "".join(parts)
+    return xml
+
+
+def simulate(command, profile):
+    """
+    Ejecuta "en el dispositivo" un comando de shell (puede ser un lote de
+    varias líneas). Devuelve (salida, rc, demora_en_segundos); quien llama
+    hace la espera (time.sleep o asyncio.sleep).
+    """
+    out = []
+    rc = 0
+    delay = 0.0
+    for line in command.splitlines():
+        for part in line.split(";"):
+            part = part.strip()
+            if not part:
+                continue
+            word = part.split(None, 1)[0]
+            if word == "sleep":
+                try:
+                    delay += float(part.split()[1]) * profile.sleep_scale
+                except (IndexError, ValueError):
+                    pass
+                rc = 0
+            elif word == "echo":
+                text = part[5:].strip().strip('"').strip("'")
+                out.append(text.replace("$?", str(rc)))
+                rc = 0
+            elif word == "uiautomator":
+                delay += profile.command_delay()
+                if "/dev/tty" in part:
+                    out.append(ui_xml(profile.ui_nodes) + "\nUI hierchary dumped to: /dev/tty")
+                rc = 0
+            elif word == "dumpsys" and " activity" in part:
+                delay += profile.command_delay()
+                out.append("  mResumedActivity: ActivityRecord{1a2b u0 com.bench/.MainActivity t7}")
+                rc = 0
+            elif word == "cat":
+                out.append(ui_xml(profile.ui_nodes))
+                rc = 0
+            elif word in ("rm", "true", ":"):
+                rc = 0
+            else:
+                delay += profile.command_delay()
+                if profile.fails():
+                    out.append(f"Error: fallo simulado en '{part}'")
+                    rc = 1
+                else:
+                    rc = 0
+    text = "\n".join(out)
+    return (text + "\n" if text else ""), rc, delay
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# benchmarks/fake_adb.py
+# Ejecutable `adb` falso para medir el camino por subprocess (sin servidor):
+#   fake_adb.py devices
+#   fake_adb.py -s SERIAL shell|exec-out COMANDO...
+# El perfil del dispositivo se lee de las variables BENCH_ADB_* (ver
+# PROFILE_ENV); run.py las fija y apunta adb_utils.ADB_PATH a este fichero.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.device_sim import DeviceProfile, simulate  # noqa: E402
+
+# atributo de DeviceProfile -> variable de entorno
+PROFILE_ENV = {
+    "latency": "BENCH_ADB_LATENCY", "jitter": "BENCH_ADB_JITTER", "failure_rate": "BENCH_ADB_FAILURE_RATE",
+    "drop_rate": "BENCH_ADB_DROP_RATE", "sleep_scale": "BENCH_ADB_SLEEP_SCALE", "ui_nodes": "BENCH_ADB_UI_NODES",
+}
+DEVICES_ENV = "BENCH_ADB_DEVICES"
+
+
+def profile_env(profile):
+    """Variables de entorno que reproducen `profile` en este ejecutable."""
+    return {env: str(getattr(profile, attr)) for attr, env in PROFILE_ENV.items()}
+
+
+def profile_from_env():
+    values = {}
+    for attr, env in PROFILE_ENV.items():
+        if env in os.environ:
+            values[attr] = int(os.environ[env]) if attr == "ui_nodes" else float(os.environ[env])
+    return DeviceProfile(**values)
+
+
+def main(argv):
+    if argv[:1] == ["devices"]:
+        count = int(os.environ.get(DEVICES_ENV, "1"))
+        sys.stdout.write("List of devices attached\n" + "".join(f"bench-{i:04d}\tdevice\n" for i in range(count)))
+        return 0
+    if len(argv) < 4 or argv[0] != "-s" or argv[2] not in ("shell", "exec-out"):
+        sys.stderr.write(f"fake adb: comando no soportado: {' '.join(argv)}\n")
+        return 1
+    profile = profile_from_env()
+    if profile.drops():
+        sys.stderr.write("error: closed\n")
+        return 1
+    out, rc, delay = simulate(" ".join(argv[3:]), profile)
+    if delay:
+        time.sleep(delay)
+    sys.stdout.write(out)
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,185 @@
+# benchmarks/fake_server.py
+# Servidor ADB falso: habla el protocolo de smart socket que usa adb_client
+# (host:devices, host:track-devices, host-serial:S:features, host:transport:S
+# seguido de shell,v2,raw:, shell: o exec:, incluidas las sesiones exec:sh de
+# shell_pool) y responde con device_sim en lugar de un teléfono.
+# Uso: python -m benchmarks.fake_server --devices 100 --latency 0.005
+# (imprime "PORT <n>" en la primera línea de stdout cuando ya escucha).
+import argparse
+import asyncio
+import re
+import shlex
+import struct
+import sys
+from benchmarks.device_sim import DeviceProfile, simulate, ui_xml
+
+SHELL_V2_STDOUT = 1
+SHELL_V2_EXIT = 3
+# Envoltorio que manda ShellSession.run por la sesión exec:sh (shell_pool.session_payload):
+# el comando va como un único argumento de sh -c entrecomillado con shlex.quote
+_SESSION_CMD = re.compile(rb"sh -c ('(?:[^']|'\"'\"')*'|[^\s']+) </dev/null 2>&1; printf '\\n%s %d\\n' (\S+) \$\?\n")
+
+
+def device_serials(count):
+    return [f"bench-{i:04d}" for i in range(count)]
+
+
+class FakeAdbServer:
+    def __init__(self, serials, profile):
+        self.serials = list(serials)
+        self._known = set(self.serials)
+        self.profile = profile
+        self.requests = 0
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._handle, host, port, limit=1 << 20)
+        return self.server.sockets[0].getsockname()[1]
+
+    # -------------------------
+    # framing
+    # -------------------------
+    @staticmethod
+    async def _read_request(reader):
+        length = int(await reader.readexactly(4), 16)
+        return (await reader.readexactly(length)).decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _okay(writer, payload=None):
+        writer.write(b"OKAY")
+        if payload is not None:
+            data = payload.encode("utf-8")
+            writer.write(b"%04x" % len(data) + data)
+
+    @staticmethod
+    def _fail(writer, msg):
+        data = msg.encode("utf-8")
+        writer.write(b"FAIL" + b"%04x" % len(data) + data)
+
+    def _device_list(self):
+        return "".join(f"{s}\tdevice\n" for s in self.serials)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await self._read_request(reader)
+            self.requests += 1
+            if request == "host:devices":
+                self._okay(writer, self._device_list())
+            elif request == "host:track-devices":
+                self._okay(writer, self._device_list())
+                await writer.drain()
+                await reader.read()  # se mantiene abierto hasta que el cliente cierre
+            elif request.startswith("host-serial:") and request.endswith(":features"):
+                self._okay(writer, "shell_v2,cmd,stat_v2")
+            elif request.startswith("host:transport:"):
+                serial = request[len("host:transport:"):]
+                if serial not in self._known:
+                    self._fail(writer, f"device '{serial}' not found")
+                else:
+                    self._okay(writer)
+                    await self._service(reader, writer, await self._read_request(reader))
+            else:
+                self._fail(writer, f"unknown host service {request}")
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # -------------------------
+    # servicios de dispositivo
+    # -------------------------
+    async def _run(self, command):
+        """(salida, rc) o None si se simula una caída de la conexión."""
+        if self.profile.drops():
+            return None
+        out, rc, delay = simulate(command, self.profile)
+        if delay:
+            await asyncio.sleep(delay)
+        return out, rc
+
+    async def _service(self, reader, writer, service):
+        if service == "exec:sh":
+            self._okay(writer)
+            await self._session(reader, writer)
+        elif service.startswith("shell,v2,raw:"):
+            self._okay(writer)
+            res = await self._run(service[len("shell,v2,raw:"):])
+            if res is not None:
+                out = res[0].encode("utf-8")
+                writer.write(struct.pack("<BI", SHELL_V2_STDOUT, len(out)) + out)
+                writer.write(struct.pack("<BI", SHELL_V2_EXIT, 1) + bytes([res[1] & 0xFF]))
+        elif service.startswith(("shell:", "exec:")):
+            self._okay(writer)
+            command = service.split(":", 1)[1]
+            if command.startswith("uiautomator dump /dev/tty"):
+                await asyncio.sleep(self.profile.command_delay())
+                writer.write((ui_xml(self.profile.ui_nodes) + "\nUI hierchary dumped to: /dev/tty\n").encode("utf-8"))
+            else:
+                res = await self._run(command)
+                if res is not None:
+                    writer.write(res[0].encode("utf-8"))
+        else:
+            self._fail(writer, f"unknown service {service}")
+
+    async def _session(self, reader, writer):
+        buf = bytearray()
+        while True:
+            match = _SESSION_CMD.search(buf)
+            if match is None:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                buf += chunk
+                continue
+            command = shlex.split(match.group(1).decode("utf-8", errors="replace"))[0]
+            marker = match.group(2)
+            del buf[:match.end()]
+            res = await self._run(command)
+            if res is None:
+                return
+            out, rc = res
+            writer.write(out.encode("utf-8") + b"\n" + marker + b" %d\n" % rc)
+            await writer.drain()
+
+
+def profile_args(parser):
+    """Opciones de DeviceProfile comunes a los scripts del banco."""
+    parser.add_argument("--latency", type=float, default=0.005, help="segundos por comando")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--sleep-scale", type=float, default=0.0, help="factor sobre los `sleep` del dispositivo")
+    parser.add_argument("--ui-nodes", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def profile_from_args(args):
+    return DeviceProfile(args.latency, args.jitter, args.failure_rate, args.drop_rate, args.sleep_scale,
+                         args.ui_nodes, args.seed)
+
+
+async def _serve(args):
+    server = FakeAdbServer(device_serials(args.devices), profile_from_args(args))
+    port = await server.start(args.host, args.port)
+    print(f"PORT {port}", flush=True)
+    async with server.server:
+        await server.server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor ADB falso para el banco de pruebas")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 = puerto libre cualquiera")
+    parser.add_argument("--devices", type=int, default=10)
+    profile_args(parser)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
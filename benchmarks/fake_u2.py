@@ -0,0 +1,88 @@
+# benchmarks/fake_u2.py
+# Dispositivo uiautomator2 simulado: la misma superficie que usan
+# script_executor y uia_pool (info, dump_hierarchy, click, send_keys y
+# d(**selector).click_exists/set_text/exists/scroll.to) con latencia y tasa
+# de fallos configurables. install() lo conecta a la caché de uia_pool.
+import threading
+import time
+from benchmarks.device_sim import DeviceProfile, ui_xml
+from uia_pool import get_uia_cache
+
+
+class FakeUiaError(Exception):
+    pass
+
+
+class FakeUiaDevice:
+    def __init__(self, serial, profile=None):
+        self.serial = serial
+        self.profile = profile or DeviceProfile()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _rpc(self, name):
+        # cada llamada jsonrpc al agente: latencia y posible fallo
+        with self._lock:
+            self.calls += 1
+            delay = self.profile.command_delay()
+            fails = self.profile.fails()
+        if delay:
+            time.sleep(delay)
+        if fails:
+            raise FakeUiaError(f"{name}: fallo simulado en {self.serial}")
+
+    @property
+    def info(self):
+        self._rpc("info")
+        return {"currentPackageName": "com.bench", "displayWidth": 1080, "displayHeight": 2340}
+
+    def dump_hierarchy(self):
+        self._rpc("dump_hierarchy")
+        return ui_xml(self.profile.ui_nodes)
+
+    def click(self, x, y):
+        self._rpc("click")
+
+    def send_keys(self, text):
+        self._rpc("send_keys")
+
+    def __call__(self, **selector):
+        return _FakeSelector(self, selector)
+
+
+class _FakeSelector:
+    def __init__(self, device, selector):
+        self.device = device
+        self.selector = selector
+        self.scroll = self
+
+    def click_exists(self, timeout=0):
+        self.device._rpc("click_exists")
+        return True
+
+    def set_text(self, text):
+        self.device._rpc("set_text")
+
+    @property
+    def exists(self):
+        self.device._rpc("exists")
+        return True
+
+    def to(self, **selector):
+        self.device._rpc("scroll.to")
+        return True
+
+
+def install(profile=None, connect_latency=0.0):
+    """Hace que uia_pool conecte a FakeUiaDevice; devuelve el connect anterior (para restaurarlo)."""
+    cache = get_uia_cache()
+    previous = cache.connect
+
+    def connect(serial):
+        if connect_latency:
+            time.sleep(connect_latency)
+        return FakeUiaDevice(serial, profile)
+
+    cache.clear()
+    cache.connect = connect
+    return previous
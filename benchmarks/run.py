@@ -0,0 +1,335 @@
+# benchmarks/run.py
+# Banco de pruebas del ejecutor contra dispositivos simulados.
+# Para cada combinación escenario x nº de dispositivos lanza el script en
+# todos a la vez (hilos o asyncio) y mide pasos/s, latencia por paso
+# (p50/p99, de tracing.Tracer), CPU y memoria del proceso. Los resultados se
+# guardan en JSON para compararlos con una ejecución anterior:
+#   python -m benchmarks.run --devices 1,10,100 --out base.json
+#   python -m benchmarks.run --devices 1,10,100 --compare base.json
+# Transportes: "server" (servidor ADB falso por socket, como en producción)
+# o "binary" (fake_adb.py como ADB_PATH, un proceso por comando).
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import adb_utils  # noqa: E402
+import script_executor  # noqa: E402
+import tracing  # noqa: E402
+from async_executor import execute_script_for_device_async  # noqa: E402
+from script_compiler import compile_script  # noqa: E402
+from shell_pool import get_shell_pool  # noqa: E402
+from ui_hierarchy import get_snapshot_cache  # noqa: E402
+from uia_pool import get_uia_cache  # noqa: E402
+from watchdog import get_health_registry  # noqa: E402
+from benchmarks import fake_u2  # noqa: E402
+from benchmarks.fake_adb import DEVICES_ENV, profile_env  # noqa: E402
+from benchmarks.fake_server import device_serials, profile_args, profile_from_args  # noqa: E402
+from benchmarks.scenarios import SCENARIOS  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FAKE_ADB = os.path.join(ROOT, "benchmarks", "fake_adb.py")
+# Empeoramiento (en %) a partir del cual --compare marca una regresión
+DEFAULT_THRESHOLD = 10.0
+# Campos que identifican un caso al comparar dos ficheros de resultados
+CASE_KEY = ("scenario", "devices", "engine", "transport", "batch")
+
+
+def percentile(values, p):
+    """Percentil p (0-100) por rango más cercano; None si no hay valores."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def _usage():
+    """(cpu propio s, cpu de hijos s, pico de RSS en KB o None)."""
+    if resource is None:
+        return time.process_time(), 0.0, None
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    peak = me.ru_maxrss // 1024 if sys.platform == "darwin" else me.ru_maxrss  # macOS da bytes
+    return me.ru_utime + me.ru_stime, children.ru_utime + children.ru_stime, peak
+
+
+def _current_rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class FakeServerProcess:
+    """benchmarks.fake_server en un proceso aparte (su CPU no cuenta como la del ejecutor)."""
+
+    def __init__(self, devices, args):
+        self.devices = devices
+        self.args = args
+        self.proc = None
+        self.port = None
+
+    def __enter__(self):
+        a = self.args
+        cmd = [sys.executable, "-m", "benchmarks.fake_server", "--devices", str(self.devices),
+               "--latency", str(a.latency), "--jitter", str(a.jitter), "--failure-rate", str(a.failure_rate),
+               "--drop-rate", str(a.drop_rate), "--sleep-scale", str(a.sleep_scale), "--ui-nodes", str(a.ui_nodes)]
+        if a.seed is not None:
+            cmd += ["--seed", str(a.seed)]
+        self.proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+        line = self.proc.stdout.readline()
+        if not line.startswith("PORT "):
+            self.proc.kill()
+            raise RuntimeError(f"el servidor falso no arrancó: {line!r}")
+        self.port = int(line.split()[1])
+        return self
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        return False
+
+
+class Transport:
+    """Apunta adb_utils al servidor o al binario falsos y lo deshace al salir."""
+
+    def __init__(self, kind, devices, args):
+        self.kind = kind
+        self.devices = devices
+        self.args = args
+        self.server = None
+        self._saved = None
+        self._env = {}
+
+    def __enter__(self):
+        self._saved = (adb_utils.USE_ADB_SERVER, adb_utils.ADB_SERVER_PORT, adb_utils.ADB_PATH)
+        if self.kind == "server":
+            self.server = FakeServerProcess(self.devices, self.args).__enter__()
+            adb_utils.USE_ADB_SERVER = True
+            adb_utils.ADB_SERVER_PORT = self.server.port
+        else:
+            adb_utils.USE_ADB_SERVER = False
+            adb_utils.ADB_PATH = FAKE_ADB
+            self._env = dict(profile_env(profile_from_args(self.args)), **{DEVICES_ENV: str(self.devices)})
+            os.environ.update(self._env)
+        return self
+
+    def __exit__(self, *exc):
+        get_shell_pool().close_all()
+        adb_utils.USE_ADB_SERVER, adb_utils.ADB_SERVER_PORT, adb_utils.ADB_PATH = self._saved
+        for key in self._env:
+            os.environ.pop(key, None)
+        if self.server is not None:
+            self.server.__exit__(*exc)
+        return False
+
+
+def _run_threads(serials, program, tracer, script_timeout):
+    results = [None] * len(serials)
+
+    def one(i, serial):
+        results[i] = script_executor.execute_script_for_device(serial, program, script_timeout=script_timeout,
+                                                               tracer=tracer)
+
+    threads = [threading.Thread(target=one, args=(i, s), daemon=True) for i, s in enumerate(serials)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def _run_asyncio(serials, program, tracer, script_timeout):
+    async def fleet():
+        return await asyncio.gather(*(execute_script_for_device_async(s, program, script_timeout=script_timeout,
+                                                                      tracer=tracer) for s in serials))
+    return asyncio.run(fleet())
+
+
+ENGINES = {"threads": _run_threads, "asyncio": _run_asyncio}
+
+
+def _reset_state():
+    get_shell_pool().close_all()
+    get_snapshot_cache().clear()
+    get_uia_cache().clear()
+    get_health_registry().reset()
+
+
+def run_case(scenario, devices, engine, transport, args):
+    """Ejecuta un caso y devuelve su fila de resultados."""
+    program = compile_script(SCENARIOS[scenario](wait=args.wait))
+    serials = device_serials(devices)
+    script_executor.BATCH_INPUT_STEPS = not args.no_batch
+    tracer = tracing.Tracer()
+    with Transport(transport, devices, args):
+        _reset_state()
+        cpu0, child0, _ = _usage()
+        t0 = time.perf_counter()
+        stats = ENGINES[engine](serials, program, tracer, args.script_timeout)
+        wall = time.perf_counter() - t0
+        cpu1, child1, peak = _usage()
+        _reset_state()
+
+    stats = [s for s in stats if isinstance(s, dict)]
+    executed = sum(s["executed"] for s in stats)
+    failed = sum(s["failed"] for s in stats)
+    steps, _ = tracer.snapshot()
+    durations = [st.duration * 1000 for st in steps]
+    by_action = {}
+    for st in steps:
+        by_action.setdefault(st.action, []).append(st.duration * 1000)
+    cpu = cpu1 - cpu0
+    return {
+        "scenario": scenario, "devices": devices, "engine": engine, "transport": transport,
+        "batch": not args.no_batch, "wall_s": round(wall, 4),
+        "steps_executed": executed, "steps_failed": failed, "traced_steps": len(steps),
+        "steps_per_sec": round(executed / wall, 2) if wall > 0 else None,
+        "latency_ms": {"p50": _r(percentile(durations, 50)), "p99": _r(percentile(durations, 99)),
+                       "max": _r(max(durations, default=None))},
+        "by_action": {action: {"count": len(v), "p50_ms": _r(percentile(v, 50)), "p99_ms": _r(percentile(v, 99))}
+                      for action, v in sorted(by_action.items(), key=lambda kv: str(kv[0]))},
+        "cpu_s": round(cpu, 4), "cpu_ms_per_step": round(cpu * 1000 / executed, 4) if executed else None,
+        "child_cpu_s": round(child1 - child0, 4),
+        "rss_peak_kb": peak, "rss_kb": _current_rss_kb(),
+        "timed_out": sum(1 for s in stats if s.get("timed_out")),
+    }
+
+
+def _r(value, digits=3):
+    return round(value, digits) if value is not None else None
+
+
+def format_row(row):
+    lat = row["latency_ms"]
+    return (f"{row['scenario']:<7} {row['devices']:>4} disp  {row['engine']:<7} {row['transport']:<6} "
+            f"{'lotes' if row['batch'] else 'sin lotes':<9}  {row['steps_per_sec'] or 0:>9.1f} pasos/s  "
+            f"p50 {lat['p50'] or 0:>7.2f}ms  p99 {lat['p99'] or 0:>8.2f}ms  "
+            f"CPU {row['cpu_ms_per_step'] or 0:.3f}ms/paso  RSS {row['rss_kb'] or 0}KB"
+            + (f"  fallos {row['steps_failed']}" if row["steps_failed"] else "")
+            + (f"  timeouts {row['timed_out']}" if row["timed_out"] else ""))
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compara dos listas de filas por CASE_KEY. Devuelve (líneas de informe,
+    nº de regresiones): pasos/s que bajan o p99 / CPU por paso que suben más
+    de `threshold` %.
+    """
+    base = {tuple(r.get(k) for k in CASE_KEY): r for r in baseline}
+    lines, regressions = [], 0
+    checks = (("steps_per_sec", lambda r: r["steps_per_sec"], True),
+              ("p99_ms", lambda r: r["latency_ms"]["p99"], False),
+              ("cpu_ms_per_step", lambda r: r["cpu_ms_per_step"], False))
+    for row in results:
+        key = tuple(row.get(k) for k in CASE_KEY)
+        old = base.get(key)
+        if old is None:
+            lines.append(f"{'/'.join(map(str, key))}: sin referencia")
+            continue
+        parts = []
+        for name, get, higher_is_better in checks:
+            a, b = get(old), get(row)
+            if not a or b is None:
+                continue
+            change = (b - a) / a * 100
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                flag = " REGRESIÓN"
+                regressions += 1
+            parts.append(f"{name} {a:g} -> {b:g} ({change:+.1f}%){flag}")
+        lines.append(f"{'/'.join(map(str, key))}: " + ", ".join(parts))
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banco de pruebas del ejecutor de scripts")
+    parser.add_argument("--scenario", default="linear,nested,uia",
+                        help=f"lista separada por comas de {', '.join(SCENARIOS)}")
+    parser.add_argument("--devices", default="1,10,100", help="nº de dispositivos, separados por comas")
+    parser.add_argument("--engine", default="threads", help="threads, asyncio o ambos separados por comas")
+    parser.add_argument("--transport", default="server", choices=("server", "binary"))
+    parser.add_argument("--no-batch", action="store_true", help="desactiva los lotes de pasos de entrada")
+    parser.add_argument("--wait", type=float, default=0, help="espera tras cada paso de entrada (s)")
+    parser.add_argument("--script-timeout", type=float, default=None)
+    parser.add_argument("--out", help="guardar los resultados en este JSON")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="%% de empeoramiento que cuenta como regresión")
+    profile_args(parser)
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenario.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"escenario desconocido: {', '.join(unknown)}")
+    engines = [e.strip() for e in args.engine.split(",") if e.strip()]
+    if any(e not in ENGINES for e in engines):
+        parser.error(f"motor desconocido: {args.engine}")
+    counts = [int(n) for n in args.devices.split(",") if n.strip()]
+
+    fake_u2.install(profile_from_args(args))
+    results = []
+    for scenario in scenarios:
+        for engine in engines:
+            for devices in counts:
+                row = run_case(scenario, devices, engine, args.transport, args)
+                results.append(row)
+                print(format_row(row), flush=True)
+
+    report = {
+        "meta": {"git": _git_revision(), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpus": os.cpu_count(),
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")}},
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados guardados en {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline.get("results", []), args.threshold)
+        print(f"\nComparación con {args.compare} (git {baseline.get('meta', {}).get('git')}):")
+        for line in lines:
+            print("  " + line)
+        if regressions:
+            print(f"{regressions} regresión(es) de más del {args.threshold:g}%")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# benchmarks/scenarios.py
+# Scripts sintéticos para el banco de pruebas, en el mismo formato JSON que
+# guarda el editor visual. `wait` fija la espera tras cada paso de entrada
+# (0 mide solo el coste del ejecutor y del transporte).
+
+_INPUTS = (
+    {"action": "tap", "x": 540, "y": 1200},
+    {"action": "text", "text": "hola mundo"},
+    {"action": "keyevent", "key": 66},
+    {"action": "swipe", "x1": 300, "y1": 1500, "x2": 300, "y2": 500, "duration": 200},
+)
+
+
+def _input(i, wait):
+    step = dict(_INPUTS[i % len(_INPUTS)])
+    step["wait"] = wait
+    return step
+
+
+def linear(steps=200, wait=0, shell_every=25):
+    """Flujo lineal largo: pasos de entrada con un `shell` cada `shell_every` (corta los lotes)."""
+    result = []
+    for i in range(steps):
+        if shell_every and i % shell_every == shell_every - 1:
+            result.append({"action": "shell", "command": "dumpsys battery", "wait": wait})
+        else:
+            result.append(_input(i, wait))
+    return {"steps": result}
+
+
+def nested(depth=3, iterations=4, wait=0):
+    """
+    while anidados `depth` niveles con `iterations` vueltas cada uno; en el
+    más interno un if/else sobre el contador y un paso de entrada por rama.
+    Pasos ejecutados ~ iterations**depth * 6: mide el coste del flujo de control.
+    """
+    steps = []
+
+    def block(level):
+        var = f"i{level}"
+        steps.append({"action": "set_var", "name": var, "value": 0})
+        steps.append({"action": "while", "condition": f"${{{var}}} < {iterations}",
+                      "max_iterations": iterations + 1})
+        if level + 1 < depth:
+            block(level + 1)
+        else:
+            steps.append({"action": "if", "condition": f"${{{var}}} < {iterations // 2}"})
+            steps.append(_input(0, wait))
+            steps.append({"action": "else"})
+            steps.append(_input(2, wait))
+            steps.append({"action": "endif"})
+        steps.append({"action": "math_operation", "var_name": var, "operation": "increment"})
+        steps.append({"action": "endwhile"})
+
+    block(0)
+    return {"steps": steps}
+
+
+def uia(steps=60, wait=0):
+    """Selectores UIA (contra el snapshot de UI) alternados con taps que lo invalidan."""
+    pattern = (
+        {"action": "uia_exists", "resourceId": "com.bench:id/ok", "result_var": "ok"},
+        {"action": "uia_click", "text": "Item 3"},
+        {"action": "uia_text", "resourceId": "com.bench:id/item_5", "text": "hola"},
+        {"action": "uia_exists", "text": "no-existe", "result_var": "missing"},
+        {"action": "tap", "x": 540, "y": 1200},
+    )
+    result = []
+    for i in range(steps):
+        step = dict(pattern[i % len(pattern)])
+        step["wait"] = wait
+        result.append(step)
+    return {"steps": result}
+
+
+SCENARIOS = {"linear": linear, "nested": nested, "uia": uia}
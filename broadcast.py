@@ -0,0 +1,135 @@
+# broadcast.py
+# Envía el mismo comando adb a varios dispositivos a la vez (un pool de hilos,
+# cada comando con timeout) y agrupa los resultados idénticos, para que la
+# GUI muestre "N dispositivos: misma salida" en vez de N bloques repetidos.
+import concurrent.futures
+import threading
+import time
+from collections import namedtuple
+import adb_utils
+
+DEFAULT_TIMEOUT = 30.0
+MAX_WORKERS = 32
+# Margen sobre el timeout antes de dar por colgado un comando que no respondió
+DEADLINE_GRACE = 5.0
+
+CommandResult = namedtuple("CommandResult", ["serial", "stdout", "stderr", "rc", "duration", "attempts"])
+
+
+def run_command(serial, command, timeout=DEFAULT_TIMEOUT, policy=None):
+    """Ejecuta `command` (lo que va tras `adb -s <serial>`) en un dispositivo con la política de reintentos."""
+    policy = (policy or adb_utils.DEFAULT_RETRY_POLICY).with_timeout(timeout)
+    res = adb_utils.run_adb_command(serial, command, policy)
+    return CommandResult(serial, res.stdout, res.stderr, res.rc, res.elapsed, res.attempts)
+
+
+def group_results(results):
+    """
+    Agrupa resultados con la misma salida (rc, stdout y stderr sin espacios
+    de los extremos). Devuelve [(CommandResult representativo, [seriales])],
+    los grupos más grandes primero.
+    """
+    groups = {}
+    for res in results:
+        key = (res.rc, (res.stdout or "").strip(), (res.stderr or "").strip())
+        groups.setdefault(key, (res, []))[1].append(res.serial)
+    return sorted(groups.values(), key=lambda g: (-len(g[1]), g[0].rc))
+
+
+def format_groups(command, results):
+    """Texto del resumen agregado para el log o la ventana de resultados."""
+    results = list(results)
+    ok = sum(1 for r in results if r.rc == 0)
+    slowest = max((r.duration for r in results), default=0.0)
+    lines = [f"$ adb {command}  ->  {ok}/{len(results)} OK, más lento {slowest:.2f}s"]
+    for res, serials in group_results(results):
+        lines.append("")
+        lines.append(f"== {len(serials)} dispositivo(s), rc={res.rc}: {', '.join(sorted(serials))}")
+        if res.stdout.strip():
+            lines.append(res.stdout.rstrip())
+        if res.stderr.strip():
+            lines.append(f"[stderr] {res.stderr.rstrip()}")
+    return "\n".join(lines)
+
+
+class BroadcastRun:
+    """
+    Un envío en curso. results (serial -> CommandResult) se va llenando desde
+    los hilos del pool; finished se activa cuando todos respondieron o venció
+    el plazo (los que no respondieron quedan con rc TIMEOUT_RC).
+    result_cb(CommandResult) y done_cb(run) se llaman desde hilos de trabajo.
+    """
+
+    def __init__(self, serials, command, timeout=DEFAULT_TIMEOUT, max_workers=MAX_WORKERS,
+                 result_cb=None, done_cb=None, policy=None):
+        self.serials = list(serials)
+        self.command = command
+        self.timeout = timeout
+        self.policy = (policy or adb_utils.DEFAULT_RETRY_POLICY).with_timeout(timeout)
+        self.max_workers = max(1, min(max_workers, len(self.serials) or 1))
+        self.result_cb = result_cb
+        self.done_cb = done_cb
+        self.results = {}
+        self.started = None
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started = time.time()
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                     thread_name_prefix="broadcast")
+        futures = {pool.submit(run_command, s, self.command, self.timeout, self.policy): s for s in self.serials}
+        for fut in futures:
+            fut.add_done_callback(self._on_done)
+        threading.Thread(target=self._wait, args=(pool, futures), daemon=True).start()
+        return self
+
+    def _record(self, res):
+        with self._lock:
+            if res.serial in self.results:
+                return
+            self.results[res.serial] = res
+        if self.result_cb:
+            self.result_cb(res)
+
+    def _on_done(self, fut):
+        if fut.cancelled():
+            return
+        try:
+            self._record(fut.result())
+        except Exception:
+            pass  # lo recoge _wait como error
+
+    def _wait(self, pool, futures):
+        # el plazo cuenta la cola del pool: con más dispositivos que hilos hay varias rondas
+        rounds = -(-len(futures) // self.max_workers)
+        per_call = self.policy.worst_case()
+        deadline = per_call * rounds + DEADLINE_GRACE if per_call is not None else None
+        done, pending = concurrent.futures.wait(futures, timeout=deadline)
+        # los callbacks de las futures pueden no haber corrido aún: registrar aquí también
+        for fut in done:
+            if fut.exception() is not None:
+                self._record(CommandResult(futures[fut], "", f"error: {fut.exception()}", 1, 0.0, 1))
+            else:
+                self._record(fut.result())
+        for fut in pending:
+            fut.cancel()
+            self._record(CommandResult(futures[fut], "", "error: sin respuesta", adb_utils.TIMEOUT_RC,
+                                       time.time() - self.started, 0))
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.finished.set()
+        if self.done_cb:
+            self.done_cb(self)
+
+    def ordered_results(self):
+        with self._lock:
+            return [self.results[s] for s in self.serials if s in self.results]
+
+    def summary(self):
+        return format_groups(self.command, self.ordered_results())
+
+
+def broadcast_command(serials, command, timeout=DEFAULT_TIMEOUT, max_workers=MAX_WORKERS,
+                      result_cb=None, done_cb=None, policy=None):
+    """Arranca un BroadcastRun y lo devuelve (no bloquea)."""
+    return BroadcastRun(serials, command, timeout, max_workers, result_cb, done_cb, policy).start()
@@ -0,0 +1,157 @@
+# device_tracker.py
+# Seguimiento de dispositivos por eventos con host:track-devices del servidor
+# ADB: un hilo mantiene un registro en memoria (serial -> estado) y avisa a los
+# listeners de altas, bajas y cambios, sin lanzar `adb devices` nunca.
+import threading
+from adb_client import AdbClient, AdbError
+import adb_utils
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+
+RECONNECT_DELAY = 1.0
+RECONNECT_MAX_DELAY = 10.0
+
+
+def parse_device_list(text):
+    """'serial\\testado\\n...' -> {serial: estado}"""
+    result = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            result[parts[0]] = parts[1]
+    return result
+
+
+class DeviceTracker:
+    """
+    Registro de dispositivos thread-safe alimentado por host:track-devices.
+    devices() devuelve una tupla ya calculada de los seriales en estado
+    'device' (lectura O(1)); states() una copia serial -> estado
+    ('device', 'offline', 'unauthorized'...).
+    Los listeners se llaman desde el hilo del tracker: listener(evento, serial, estado).
+    """
+
+    def __init__(self, client_factory=adb_utils.get_adb_client):
+        self.client_factory = client_factory
+        self._states = {}
+        self._ready = ()
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._thread = None
+        self._sock = None
+        self._stop = threading.Event()
+        self.connected = threading.Event()
+
+    # -------------------------
+    # lectura
+    # -------------------------
+    def devices(self):
+        return self._ready
+
+    def states(self):
+        with self._lock:
+            return dict(self._states)
+
+    def state(self, serial):
+        return self._states.get(serial)
+
+    # -------------------------
+    # ciclo de vida
+    # -------------------------
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="device-tracker", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.close()  # desbloquea el recv del hilo
+            except OSError:
+                pass
+
+    def wait_ready(self, timeout=None):
+        """Espera a recibir la primera lista del servidor."""
+        return self.connected.wait(timeout)
+
+    # -------------------------
+    # hilo
+    # -------------------------
+    def _run(self):
+        delay = RECONNECT_DELAY
+        while not self._stop.is_set():
+            client = self.client_factory()
+            try:
+                sock = client.connect()
+                self._sock = sock
+                AdbClient.send_request(sock, "host:track-devices")
+                AdbClient.check_status(sock)
+                delay = RECONNECT_DELAY
+                while not self._stop.is_set():
+                    block = AdbClient.read_prefixed(sock)
+                    self._update(parse_device_list(block.decode("utf-8", errors="replace")))
+                    self.connected.set()
+            except (OSError, AdbError, ValueError):
+                pass
+            finally:
+                if self._sock is not None:
+                    try:
+                        self._sock.close()
+                    except OSError:
+                        pass
+                self._sock = None
+            # sin servidor no hay dispositivos utilizables
+            self.connected.clear()
+            self._update({})
+            if self._stop.wait(delay):
+                break
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def _update(self, new_states):
+        events = []
+        with self._lock:
+            old = self._states
+            for serial, state in new_states.items():
+                prev = old.get(serial)
+                if prev is None:
+                    events.append((ADDED, serial, state))
+                elif prev != state:
+                    events.append((CHANGED, serial, state))
+            for serial, state in old.items():
+                if serial not in new_states:
+                    events.append((REMOVED, serial, state))
+            self._states = new_states
+            self._ready = tuple(s for s, st in new_states.items() if st == "device")
+            listeners = list(self._listeners)
+        for event in events:
+            for listener in listeners:
+                try:
+                    listener(*event)
+                except Exception:
+                    pass
+
+
+_tracker = None
+
+def get_device_tracker():
+    """Tracker compartido del proceso; se arranca y se registra en adb_utils al primer uso."""
+    global _tracker
+    if _tracker is None:
+        _tracker = DeviceTracker().start()
+        adb_utils.set_device_tracker(_tracker)
+    return _tracker
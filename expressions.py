@@ -0,0 +1,347 @@
+# expressions.py
+# Motor de expresiones/condiciones de los scripts.
+# Reproduce la semántica del ejecutor original (sustituir cada ${var} por
+# str(valor) y hacer eval del texto resultante, con los mismos fallbacks) sin
+# usar eval: el texto se analiza con el módulo ast de Python (así la sintaxis
+# es exactamente la de antes: "0123" no es un número, "1 & 3" sí se calcula)
+# y el árbol se convierte en closures. Cada fuente se compila una vez (caché
+# por texto); si sus ${var} son tokens sueltos y en la ejecución valen números
+# no negativos, el árbol se evalúa directamente contra vars_store sin
+# reconstruir el texto. En cualquier otro caso se interpola el texto y se
+# evalúa (con caché por texto interpolado).
+# No se admiten llamadas, atributos, f-strings, comprensiones ni lambdas
+# (el eval original sí; eran una puerta a ejecutar código arbitrario): esos
+# textos caen al mismo fallback que un error de evaluación.
+import ast
+import operator
+import re
+from functools import lru_cache
+
+_TEMPLATE_RE = re.compile(r"\$\{([^}]*)\}")
+# Caracteres que el ejecutor original aceptaba como "expresión matemática"
+_MATH_RE = re.compile(r'^[\d\s\+\-\*\/\(\)\.\%\<\>\=\!\&\\|]+$')
+# str() de un float que vuelve a leerse como el mismo número (sin exponente, inf ni nan)
+_PLAIN_FLOAT_RE = re.compile(r"^\d+\.\d+$")
+# Caracteres que pueden rodear a una ${var} sin pegarse a ella en un mismo token
+_SAFE_BORDER = frozenset(" \t\r\n+-*/%()<>=!&|^~,:[]")
+_PLACEHOLDER = "_gb_var{}"
+
+_MISSING = object()
+
+
+class ExpressionError(ValueError):
+    """El texto usa una construcción que el motor no evalúa."""
+
+
+# -------------------------
+# árbol ast -> closures
+# -------------------------
+_BINARY = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.LShift: operator.lshift, ast.RShift: operator.rshift, ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_, ast.BitXor: operator.xor, ast.MatMult: operator.matmul,
+}
+_UNARY = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: operator.not_, ast.Invert: operator.invert}
+_COMPARE = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Is: operator.is_, ast.IsNot: operator.is_not,
+    ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b,
+}
+
+
+def _compile_node(node, slots):
+    """Closure env -> valor para el nodo; `slots` son los nombres que leen de env (las ${var})."""
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body, slots)
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda env: value
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name in slots:
+            return lambda env: env[name]
+
+        def undefined(env):
+            # eval sin builtins: cualquier nombre es un NameError
+            raise NameError(name)
+        return undefined
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        fn, operand = _UNARY[type(node.op)], _compile_node(node.operand, slots)
+        return lambda env: fn(operand(env))
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        fn, left, right = _BINARY[type(node.op)], _compile_node(node.left, slots), _compile_node(node.right, slots)
+        return lambda env: fn(left(env), right(env))
+    if isinstance(node, ast.BoolOp):
+        values = tuple(_compile_node(v, slots) for v in node.values)
+        is_and = isinstance(node.op, ast.And)
+
+        def boolop(env):
+            for value in values:
+                result = value(env)
+                if bool(result) != is_and:
+                    return result
+            return result
+        return boolop
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+        first = _compile_node(node.left, slots)
+        pairs = tuple((_COMPARE[type(op)], _compile_node(c, slots)) for op, c in zip(node.ops, node.comparators))
+
+        # comparaciones encadenadas como en Python: a < b < c
+        def compare(env):
+            left = first(env)
+            for fn, right_node in pairs:
+                right = right_node(env)
+                result = fn(left, right)
+                if not result:
+                    return result
+                left = right
+            return result
+        return compare
+    if isinstance(node, ast.IfExp):
+        test, body, orelse = (_compile_node(n, slots) for n in (node.test, node.body, node.orelse))
+        return lambda env: body(env) if test(env) else orelse(env)
+    if isinstance(node, (ast.Tuple, ast.List, ast.Set)) and not any(isinstance(e, ast.Starred) for e in node.elts):
+        items = tuple(_compile_node(e, slots) for e in node.elts)
+        make = {ast.Tuple: tuple, ast.List: list, ast.Set: set}[type(node)]
+        return lambda env: make(item(env) for item in items)
+    if isinstance(node, ast.Dict) and None not in node.keys:
+        pairs = tuple((_compile_node(k, slots), _compile_node(v, slots)) for k, v in zip(node.keys, node.values))
+        return lambda env: {k(env): v(env) for k, v in pairs}
+    if isinstance(node, ast.Subscript):
+        value, index = _compile_node(node.value, slots), _compile_node(node.slice, slots)
+        return lambda env: value(env)[index(env)]
+    if isinstance(node, ast.Slice):
+        parts = tuple(_compile_node(p, slots) if p is not None else (lambda env: None)
+                      for p in (node.lower, node.upper, node.step))
+        return lambda env: slice(*(p(env) for p in parts))
+    kind = type(node).__name__
+
+    def unsupported(env):
+        # falla al evaluarse (no al compilar): un "x or <esto>" sigue dando x, como con eval
+        raise ExpressionError(f"construcción no admitida: {kind}")
+    return unsupported
+
+
+def _parse(text, slots=()):
+    """Closure env -> valor del texto (sintaxis de Python); SyntaxError si no se analiza."""
+    return _compile_node(ast.parse(text.strip(" \t"), mode="eval"), frozenset(slots))
+
+
+# -------------------------
+# plantillas ${var}
+# -------------------------
+def _compile_template(text):
+    """Divide el texto en literales y nombres de variable. Devuelve (función vars -> str, nombres)."""
+    parts = []
+    pos = 0
+    for m in _TEMPLATE_RE.finditer(text):
+        if m.start() > pos:
+            parts.append((False, text[pos:m.start()]))
+        parts.append((True, m.group(1)))
+        pos = m.end()
+    if pos < len(text):
+        parts.append((False, text[pos:]))
+    names = tuple(val for is_var, val in parts if is_var)
+    if not names:
+        return (lambda vars_store: text), names
+    parts = tuple(parts)
+
+    def render(vars_store):
+        out = []
+        for is_var, val in parts:
+            if is_var:
+                v = vars_store.get(val, _MISSING)
+                # variable inexistente: se deja el ${name} literal, como antes
+                out.append("${" + val + "}" if v is _MISSING else str(v))
+            else:
+                out.append(val)
+        return "".join(out)
+    return render, names
+
+
+def _plain_number(value):
+    """True si str(value) es un número sin signo que Python vuelve a leer igual."""
+    if type(value) is int:
+        return value >= 0
+    if type(value) is float:
+        return _PLAIN_FLOAT_RE.match(repr(value)) is not None
+    return False
+
+
+def _direct_tree(source, math_only):
+    """
+    Árbol para evaluar `source` sin interpolar (sus ${var} como nombres) o
+    None si no es equivalente a interpolar: una ${var} pegada a otro token,
+    dentro de un string literal, o un texto que no se analiza.
+    """
+    matches = list(_TEMPLATE_RE.finditer(source))
+    if not matches:
+        return None
+    for m in matches:
+        before = source[m.start() - 1] if m.start() else " "
+        after = source[m.end()] if m.end() < len(source) else " "
+        if before not in _SAFE_BORDER or after not in _SAFE_BORDER:
+            return None
+    if math_only and not _MATH_RE.match(_TEMPLATE_RE.sub("0", source)):
+        return None
+    slots = {}
+
+    def placeholder(m):
+        return slots.setdefault(m.group(1), _PLACEHOLDER.format(len(slots)))
+    text = _TEMPLATE_RE.sub(placeholder, source)
+    try:
+        tree = ast.parse(text.strip(" \t"), mode="eval")
+        fn = _compile_node(tree, frozenset(slots.values()))
+    except (SyntaxError, ValueError):
+        return None
+    # cada ${var} tiene que haber quedado como un nombre (no dentro de un string)
+    used = sum(isinstance(n, ast.Name) and n.id in slots.values() for n in ast.walk(tree))
+    if used != len(matches):
+        return None
+    return fn, tuple(slots.items())
+
+
+def _direct_env(slots, vars_store):
+    """Valores de las ${var} si todas existen y son números planos; si no, None."""
+    env = {}
+    for name, slot in slots:
+        value = vars_store.get(name, _MISSING)
+        if not _plain_number(value):
+            return None
+        env[slot] = value
+    return env
+
+
+# -------------------------
+# evaluación de textos ya interpolados (caché por texto)
+# -------------------------
+@lru_cache(maxsize=4096)
+def _math_text_value(text):
+    """Lo que daba `eval(text)` si el texto era "matemático"; si no, o si fallaba, el propio texto."""
+    if not _MATH_RE.match(text):
+        return text
+    try:
+        return _parse(text)({})
+    except Exception:
+        return text
+
+
+@lru_cache(maxsize=4096)
+def _condition_text_tree(text):
+    try:
+        return _parse(text)
+    except Exception:
+        return None
+
+
+def _condition_fallback(text):
+    """Comparación de texto cuando la condición no se puede evaluar (la del ejecutor original)."""
+    if "==" in text:
+        left, right = text.split("==", 1)
+        return left.strip() == right.strip()
+    if "!=" in text:
+        left, right = text.split("!=", 1)
+        return left.strip() != right.strip()
+    if " contains " in text:
+        left, right = text.split(" contains ", 1)
+        return right.strip() in left.strip()
+    # Condición no reconocida, tratar como False
+    return False
+
+
+def _condition_text_value(text):
+    fn = _condition_text_tree(text)
+    if fn is not None:
+        try:
+            return fn({})
+        except Exception:
+            pass
+    return _condition_fallback(text)
+
+
+# -------------------------
+# formas compiladas
+# -------------------------
+class CompiledExpression:
+    """Valor de un paso: el resultado aritmético si el texto interpolado es matemático, si no el texto."""
+
+    __slots__ = ("source", "render", "constant", "direct")
+
+    def __init__(self, source):
+        self.source = source
+        self.render, names = _compile_template(source)
+        self.constant = _math_text_value(source) if not names else _MISSING
+        self.direct = _direct_tree(source, math_only=True)
+
+    def __call__(self, vars_store):
+        if self.constant is not _MISSING:
+            return self.constant
+        if self.direct is not None:
+            fn, slots = self.direct
+            env = _direct_env(slots, vars_store)
+            if env is not None:
+                try:
+                    return fn(env)
+                except Exception:
+                    pass  # mismo error que al evaluar el texto: devolver el texto
+        return _math_text_value(self.render(vars_store))
+
+
+class CompiledCondition:
+    """Condición de if/while: expresión de Python sobre el texto interpolado, con fallback de texto."""
+
+    __slots__ = ("source", "render", "direct")
+
+    def __init__(self, source):
+        self.source = source
+        self.render, _ = _compile_template(source)
+        self.direct = _direct_tree(source, math_only=False)
+
+    def __call__(self, vars_store):
+        if self.direct is not None:
+            fn, slots = self.direct
+            env = _direct_env(slots, vars_store)
+            if env is not None:
+                try:
+                    return fn(env)
+                except Exception:
+                    return _condition_fallback(self.render(vars_store))
+        return _condition_text_value(self.render(vars_store))
+
+
+@lru_cache(maxsize=4096)
+def compile_expression(source):
+    return CompiledExpression(source)
+
+
+@lru_cache(maxsize=4096)
+def compile_condition(source):
+    return CompiledCondition(source)
+
+
+def eval_expression(expr, vars_store):
+    """
+    Evalúa el valor de un parámetro de paso.
+    Números/bools se devuelven tal cual; si el texto con las ${var}
+    sustituidas es matemático (p.ej. "${i} * 2" con i=3) se calcula; en
+    cualquier otro caso (o si el cálculo falla) se devuelve ese texto.
+    Un entero con ceros a la izquierda ("0123") no es un número: queda texto.
+    """
+    if isinstance(expr, str):
+        return compile_expression(expr)(vars_store)
+    return expr
+
+
+def eval_condition(condition, vars_store):
+    """
+    Evalúa una condición de if/while: el texto con las ${var} sustituidas
+    como expresión de Python (aritmética, comparaciones, and/or/not, in,
+    listas...). Si no se puede evaluar se compara como texto con == / != o
+    " contains "; condiciones no reconocidas valen False.
+    """
+    if isinstance(condition, bool):
+        return condition
+    if isinstance(condition, str):
+        return compile_condition(condition)(vars_store)
+    return False
@@ -0,0 +1,168 @@
+# fleet_launcher.py
+# Reparte los dispositivos seleccionados entre N procesos (por defecto uno por
+# núcleo) para que la evaluación de expresiones, el parseo de dumps y el
+# logging no compitan por el GIL de un único proceso.
+# Cada proceso ejecuta su parte con el motor asyncio y envía logs, resultados
+# por paso y resúmenes al proceso padre por una multiprocessing.Queue.
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from async_executor import run_fleet
+from script_compiler import compile_script
+
+# Mensajes worker -> padre
+MSG_LOG = "log"
+MSG_STEP = "step"
+MSG_RESULT = "result"
+MSG_DONE = "done"
+
+# Cada cuánto el monitor revisa si algún proceso murió
+MONITOR_INTERVAL = 0.2
+
+
+def default_processes():
+    return os.cpu_count() or 1
+
+
+def shard_serials(serials, n):
+    """Reparte los seriales en n grupos (round-robin), sin grupos vacíos."""
+    n = max(1, min(n, len(serials)))
+    return [serials[i::n] for i in range(n)]
+
+
+def _shard_main(shard_id, serials, program, out_queue, stop_event, max_concurrency):
+    """Punto de entrada de cada proceso worker (nivel de módulo para 'spawn')."""
+    def log_cb(msg):
+        out_queue.put((MSG_LOG, shard_id, msg))
+
+    def step_cb(serial, step_idx, action, ok):
+        out_queue.put((MSG_STEP, shard_id, (serial, step_idx, action, ok)))
+
+    results = run_fleet(serials, program, log_cb=log_cb, stop_event=stop_event,
+                        max_concurrency=max_concurrency, step_cb=step_cb)
+    for serial, res in zip(serials, results):
+        if isinstance(res, dict):
+            out_queue.put((MSG_RESULT, shard_id, res))
+        else:
+            out_queue.put((MSG_RESULT, shard_id, {"serial": serial, "error": str(res)}))
+    out_queue.put((MSG_DONE, shard_id, None))
+
+
+class ShardedRun:
+    """
+    Ejecución de un script repartida en procesos. Los callbacks se invocan
+    desde un hilo monitor del proceso padre:
+      log_cb(msg), step_cb(serial, step_idx, action, ok), result_cb(summary)
+    Si un proceso muere sin terminar, sus dispositivos se informan como
+    fallidos y el resto sigue.
+    """
+
+    def __init__(self, serials, script, processes=None, log_cb=None, step_cb=None, result_cb=None,
+                 max_concurrency=None):
+        self.program = compile_script(script)
+        self.shards = shard_serials(list(serials), processes or default_processes())
+        self.log_cb = log_cb
+        self.step_cb = step_cb
+        self.result_cb = result_cb
+        self.max_concurrency = max_concurrency
+        self.ctx = mp.get_context("spawn")  # fork + Tk/hilos en el padre no es seguro
+        self.queue = self.ctx.Queue()
+        self.stop_event = self.ctx.Event()
+        self.procs = []
+        self.results = {}
+        self.finished = threading.Event()
+        self._monitor = None
+
+    def start(self):
+        for shard_id, serials in enumerate(self.shards):
+            p = self.ctx.Process(target=_shard_main, name=f"shard-{shard_id}",
+                                 args=(shard_id, serials, self.program, self.queue, self.stop_event,
+                                       self.max_concurrency),
+                                 daemon=True)
+            p.start()
+            self.procs.append(p)
+            self._log(f"Proceso {shard_id} (pid {p.pid}): {len(serials)} dispositivos")
+        self._monitor = threading.Thread(target=self._monitor_loop, daemon=True)
+        self._monitor.start()
+        return self
+
+    def stop(self, grace=5.0):
+        """Pide a todos los procesos que paren; los que no terminen en `grace` s se matan."""
+        self.stop_event.set()
+
+        def reap():
+            for p in self.procs:
+                p.join(grace)
+                if p.is_alive():
+                    p.terminate()
+        threading.Thread(target=reap, daemon=True).start()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def _log(self, msg):
+        if self.log_cb:
+            self.log_cb(msg)
+
+    def _dispatch(self, kind, payload):
+        if kind == MSG_LOG:
+            self._log(payload)
+        elif kind == MSG_STEP:
+            if self.step_cb:
+                self.step_cb(*payload)
+        elif kind == MSG_RESULT:
+            self.results[payload.get("serial")] = payload
+            if self.result_cb:
+                self.result_cb(payload)
+
+    def _monitor_loop(self):
+        pending = set(range(len(self.procs)))
+        next_check = time.monotonic() + MONITOR_INTERVAL
+        while pending:
+            try:
+                kind, shard_id, payload = self.queue.get(timeout=MONITOR_INTERVAL)
+            except queue.Empty:
+                self._check_shards(pending, drained=True)
+                next_check = time.monotonic() + MONITOR_INTERVAL
+                continue
+            try:
+                if kind == MSG_DONE:
+                    pending.discard(shard_id)
+                else:
+                    self._dispatch(kind, payload)
+            except Exception as e:
+                self._log(f"Error procesando mensaje del proceso {shard_id}: {e}")
+            # los mensajes de los demás procesos no deben retrasar la detección de uno caído
+            if time.monotonic() >= next_check:
+                self._check_shards(pending, drained=False)
+                next_check = time.monotonic() + MONITOR_INTERVAL
+        self.finished.set()
+        self._log(f"Ejecución multiproceso finalizada: {len(self.results)} dispositivos")
+
+    def _check_shards(self, pending, drained):
+        """
+        Da por caídos los procesos de `pending` que ya no viven sin haber
+        mandado MSG_DONE. Uno que salió con exitcode 0 puede tener aún su
+        MSG_DONE en la cola: solo cuenta como caído cuando la cola está vacía.
+        """
+        for shard_id in list(pending):
+            p = self.procs[shard_id]
+            if p.is_alive() or (p.exitcode == 0 and not drained):
+                continue
+            pending.discard(shard_id)
+            self._shard_crashed(shard_id, p.exitcode)
+
+    def _shard_crashed(self, shard_id, exitcode):
+        self._log(f"Proceso {shard_id} terminó inesperadamente (exitcode {exitcode})")
+        for serial in self.shards[shard_id]:
+            if serial not in self.results:
+                summary = {"serial": serial, "error": f"proceso {shard_id} caído (exitcode {exitcode})"}
+                self._dispatch(MSG_RESULT, summary)
+
+
+def launch_sharded(serials, script, processes=None, log_cb=None, step_cb=None, result_cb=None,
+                   max_concurrency=None):
+    """Arranca una ShardedRun y la devuelve (no bloquea)."""
+    return ShardedRun(serials, script, processes, log_cb, step_cb, result_cb, max_concurrency).start()
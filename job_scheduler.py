@@ -0,0 +1,232 @@
+# job_scheduler.py
+# Cola de trabajos (script, dispositivo) ejecutada por un pool acotado de hilos.
+# Limita la concurrencia total y por host ADB, nunca corre dos trabajos a la vez
+# sobre el mismo dispositivo y permite cancelar y consultar el estado.
+import heapq
+import itertools
+import threading
+import time
+from script_executor import execute_script_for_device
+from watchdog import get_health_registry
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+def host_of(serial):
+    """Host al que pertenece el dispositivo: IP para adb over TCP, 'usb' para el servidor local."""
+    if ":" in serial:
+        return serial.rsplit(":", 1)[0]
+    return "usb"
+
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, serial, script, priority=0, label=None):
+        self.id = next(self._ids)
+        self.serial = serial
+        self.script = script
+        self.priority = priority
+        self.label = label or ""
+        self.host = host_of(serial)
+        self.status = QUEUED
+        self.error = None
+        self.result = None
+        self.stop_event = threading.Event()
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def snapshot(self):
+        """Copia del estado apta para mostrar en la GUI."""
+        end = self.finished or time.time()
+        return {
+            "id": self.id,
+            "serial": self.serial,
+            "label": self.label,
+            "status": self.status,
+            "priority": self.priority,
+            "error": self.error,
+            "elapsed": (end - self.started) if self.started else 0.0,
+        }
+
+
+class JobScheduler:
+    """
+    Pool de `max_workers` hilos que consumen una cola por prioridad (menor
+    primero, FIFO dentro de la misma prioridad). `per_host_limit` acota los
+    trabajos simultáneos por host ADB. Los trabajos de dispositivos marcados
+    como no saludables en `health` (ver watchdog) se descartan como fallidos
+    en vez de ocupar un hilo.
+    """
+
+    def __init__(self, max_workers=8, per_host_limit=8, runner=execute_script_for_device, log_cb=None,
+                 health=None):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.runner = runner
+        self.log_cb = log_cb
+        self.health = health or get_health_registry()
+        self._heap = []
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._running_hosts = {}
+        self._busy_serials = set()
+        self._live_workers = 0  # hilos del pool que no han salido (se cuenta con el lock)
+        self._cond = threading.Condition()
+        self._shutdown = False
+
+    # -------------------------
+    # API
+    # -------------------------
+    def submit(self, serial, script, priority=0, label=None):
+        job = Job(serial, script, priority, label)
+        with self._cond:
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._spawn_workers()
+            self._cond.notify_all()
+        return job
+
+    def cancel(self, job_id):
+        """Cancela un trabajo: si está en cola no llega a ejecutarse; si corre se activa su stop_event."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job.stop_event.set()
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished = time.time()
+            self._cond.notify_all()
+            return True
+
+    def cancel_all(self):
+        with self._cond:
+            ids = [j.id for j in self._jobs.values() if not j.done]
+        for job_id in ids:
+            self.cancel(job_id)
+        return len(ids)
+
+    def jobs(self):
+        """Estado de todos los trabajos (snapshots), más recientes al final."""
+        with self._cond:
+            return [j.snapshot() for j in self._jobs.values()]
+
+    def counts(self):
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0, CANCELLED: 0}
+        with self._cond:
+            for j in self._jobs.values():
+                counts[j.status] += 1
+        return counts
+
+    def clear_finished(self):
+        with self._cond:
+            for job_id in [j.id for j in self._jobs.values() if j.done]:
+                del self._jobs[job_id]
+
+    def set_limits(self, max_workers=None, per_host_limit=None):
+        with self._cond:
+            if max_workers is not None:
+                self.max_workers = max(1, int(max_workers))
+            if per_host_limit is not None:
+                self.per_host_limit = max(1, int(per_host_limit))
+            self._spawn_workers()
+            self._cond.notify_all()
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            self.cancel_all()
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+
+    # -------------------------
+    # workers
+    # -------------------------
+    def _spawn_workers(self):
+        # llamado con el lock tomado; los hilos se crean a demanda
+        while self._live_workers < self.max_workers:
+            self._live_workers += 1
+            threading.Thread(target=self._worker_loop, daemon=True).start()
+
+    def _eligible(self, job):
+        return (job.serial not in self._busy_serials and
+                self._running_hosts.get(job.host, 0) < self.per_host_limit)
+
+    def _take_next(self):
+        """Saca el primer trabajo ejecutable de la cola (con el lock tomado) o None."""
+        skipped = []
+        found = None
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            job = item[2]
+            if job.status != QUEUED:
+                continue  # cancelado mientras esperaba
+            if not self.health.is_healthy(job.serial):
+                job.status = FAILED
+                job.error = "dispositivo no saludable"
+                job.finished = time.time()
+                if self.log_cb:
+                    self.log_cb(f"[{job.serial}] Trabajo {job.id} omitido: dispositivo no saludable")
+                continue
+            if self._eligible(job):
+                found = job
+                break
+            skipped.append(item)
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        return found
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._shutdown:
+                    if self._live_workers > self.max_workers:
+                        break  # el pool se redujo: sobra este hilo
+                    job = self._take_next()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                if job is None:
+                    self._live_workers -= 1
+                    return
+                job.status = RUNNING
+                job.started = time.time()
+                self._busy_serials.add(job.serial)
+                self._running_hosts[job.host] = self._running_hosts.get(job.host, 0) + 1
+
+            try:
+                job.result = self.runner(job.serial, job.script, log_cb=self.log_cb, stop_event=job.stop_event)
+                if job.stop_event.is_set():
+                    status = CANCELLED
+                elif isinstance(job.result, dict) and job.result.get("timed_out"):
+                    job.error = "timeout"
+                    status = FAILED
+                elif job.result is None:
+                    # el ejecutor no llegó a correr el script (inválido o no compila; el motivo va al log)
+                    job.error = "script inválido"
+                    status = FAILED
+                else:
+                    status = DONE
+            except Exception as e:
+                job.error = str(e)
+                status = FAILED
+                if self.log_cb:
+                    self.log_cb(f"[{job.serial}] Trabajo {job.id} falló: {e}")
+
+            with self._cond:
+                job.status = status
+                job.finished = time.time()
+                self._busy_serials.discard(job.serial)
+                self._running_hosts[job.host] -= 1
+                self._cond.notify_all()
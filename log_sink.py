@@ -0,0 +1,77 @@
+# log_sink.py
+# Sumidero de logs para el panel Tk.
+# Los hilos de trabajo solo hacen append en una deque (atómico en CPython, sin
+# locks ni llamadas a Tk); el hilo de Tk la vacía por lotes con after() y el
+# widget se mantiene como un anillo de N líneas como máximo.
+import collections
+import sys
+import time
+import tkinter as tk
+
+MAX_LINES = 5000        # líneas visibles en el panel
+MAX_PENDING = 50000     # registros en cola antes de descartar los más viejos
+DRAIN_INTERVAL_MS = 100
+BATCH_LIMIT = 2000      # registros por vaciado, para no bloquear la UI
+
+
+class LogSink:
+    def __init__(self, widget=None, max_lines=MAX_LINES, echo_stdout=False,
+                 interval_ms=DRAIN_INTERVAL_MS, max_pending=MAX_PENDING):
+        self.widget = None
+        self.max_lines = max_lines
+        self.echo_stdout = echo_stdout
+        self.interval_ms = interval_ms
+        self.pending = collections.deque(maxlen=max_pending)
+        self._after_id = None
+        if widget is not None:
+            self.attach(widget)
+
+    def push(self, text):
+        """Encola una línea. Seguro desde cualquier hilo; nunca toca Tk."""
+        self.pending.append(f"[{time.strftime('%H:%M:%S')}] {text}")
+
+    __call__ = push
+
+    def attach(self, widget):
+        """Empieza a volcar en `widget` (tk.Text). Llamar desde el hilo de Tk."""
+        self.widget = widget
+        if self._after_id is None:
+            self._after_id = widget.after(self.interval_ms, self._drain)
+
+    def detach(self):
+        if self.widget is not None and self._after_id is not None:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except tk.TclError:
+                pass
+        self._after_id = None
+        self.widget = None
+
+    def _drain(self):
+        self._after_id = None
+        widget = self.widget
+        if widget is None:
+            return
+        lines = []
+        pending = self.pending
+        try:
+            while len(lines) < BATCH_LIMIT:
+                lines.append(pending.popleft())
+        except IndexError:
+            pass
+        if lines:
+            block = "\n".join(lines) + "\n"
+            if self.echo_stdout:
+                sys.stdout.write(block)
+            try:
+                widget.insert(tk.END, block)
+                # anillo: recortar por arriba lo que sobre
+                total = int(widget.index("end-1c").split(".")[0])
+                excess = total - self.max_lines
+                if excess > 0:
+                    widget.delete("1.0", f"{excess + 1}.0")
+                widget.see(tk.END)
+            except tk.TclError:
+                self.widget = None  # widget destruido
+                return
+        self._after_id = widget.after(self.interval_ms, self._drain)
@@ -4,13 +4,30 @@ from tkinter import filedialog, messagebox, simpledialog
 import json
 import os
 import threading
-import time
-from adb_utils import list_devices, run_adb_command
+import collections
+from adb_utils import list_devices
 from script_executor import execute_script_for_device
+from script_compiler import compile_script, ScriptCompileError
+from job_scheduler import JobScheduler
+from async_executor import run_fleet
+from fleet_launcher import launch_sharded
 from visual_editor import VisualFlowEditor
+from log_sink import LogSink
+from broadcast import broadcast_command, format_groups
+from device_tracker import get_device_tracker, ADDED, REMOVED
+from watchdog import get_health_registry
+import tracing
 import subprocess
 # Configuración (modifica si adb/scrcpy no están en PATH)
 SCRCPY_PATH = "scrcpy"
+# Máximo de dispositivos ejecutando scripts a la vez (total y por host ADB)
+MAX_PARALLEL_DEVICES = 8
+MAX_DEVICES_PER_HOST = 8
+# Panel de log: líneas máximas y si también se escribe en stdout
+MAX_LOG_LINES = 5000
+LOG_TO_STDOUT = False
+# Timeout (s) de cada comando enviado con "Send Command to selected"
+COMMAND_TIMEOUT = 30
 
 class AndroidMultiControlApp:
     def __init__(self, root):
@@ -20,10 +37,23 @@ class AndroidMultiControlApp:
 
         self.devices = []
         self.profiles = {}
+        self.log_sink = LogSink(max_lines=MAX_LOG_LINES, echo_stdout=LOG_TO_STDOUT)
+        self.scheduler = JobScheduler(max_workers=MAX_PARALLEL_DEVICES, per_host_limit=MAX_DEVICES_PER_HOST,
+                                      runner=execute_script_for_device, log_cb=self.log)
+        self.jobs_window = None
+        self.async_runs = []  # stop_events de las ejecuciones con motor asyncio
+        self.sharded_runs = []  # ejecuciones multiproceso (fleet_launcher.ShardedRun)
+        self.last_trace = None  # tracing.Tracer de la última traza activada
 
         self.create_widgets()
         self.refresh_devices()
 
+        # altas/bajas de dispositivos por eventos (host:track-devices)
+        self.device_events = collections.deque()
+        self.tracker = get_device_tracker()
+        self.tracker.add_listener(lambda *ev: self.device_events.append(ev))
+        self.root.after(300, self.poll_device_events)
+
     def create_widgets(self):
         # left frame devices & actions
         left = tk.Frame(self.root)
@@ -48,6 +78,23 @@ class AndroidMultiControlApp:
         tk.Button(mid, text="▶ Run Script on selected (open file)", command=self.run_script_on_selected).pack(pady=4)
         tk.Button(mid, text="📂 Save/Load Profile (script + devices)", command=self.profile_dialog).pack(pady=4)
         tk.Button(mid, text="📂 Open Template (save)", command=self.open_template).pack(pady=4)
+        jobs_bar = tk.Frame(mid)
+        jobs_bar.pack(pady=4)
+        tk.Button(jobs_bar, text="📋 Trabajos", command=self.open_jobs_window).pack(side=tk.LEFT, padx=2)
+        tk.Button(jobs_bar, text="⏹ Cancelar todo", command=self.cancel_all_jobs).pack(side=tk.LEFT, padx=2)
+        tk.Label(jobs_bar, text="Paralelo máx:").pack(side=tk.LEFT, padx=(8, 2))
+        self.max_workers_var = tk.IntVar(value=MAX_PARALLEL_DEVICES)
+        tk.Spinbox(jobs_bar, from_=1, to=200, width=5, textvariable=self.max_workers_var,
+                   command=self.apply_worker_limit).pack(side=tk.LEFT)
+        tk.Label(jobs_bar, text="Motor:").pack(side=tk.LEFT, padx=(8, 2))
+        self.engine_var = tk.StringVar(value="threads")
+        tk.Radiobutton(jobs_bar, text="Hilos", variable=self.engine_var, value="threads").pack(side=tk.LEFT)
+        tk.Radiobutton(jobs_bar, text="asyncio", variable=self.engine_var, value="asyncio").pack(side=tk.LEFT)
+        tk.Radiobutton(jobs_bar, text="Multi-proceso", variable=self.engine_var, value="processes").pack(side=tk.LEFT)
+        self.trace_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(jobs_bar, text="Traza", variable=self.trace_var,
+                       command=self.toggle_tracing).pack(side=tk.LEFT, padx=(8, 0))
+        tk.Button(jobs_bar, text="💾 Exportar traza", command=self.export_trace).pack(side=tk.LEFT, padx=2)
 
         tk.Label(mid, text="Editor JSON (visual export/import)").pack(pady=(8,0))
         self.script_text = tk.Text(mid, height=15)
@@ -60,15 +107,11 @@ class AndroidMultiControlApp:
         tk.Label(right, text="Log:").pack()
         self.log_text = tk.Text(right, height=30, width=60)
         self.log_text.pack(fill=tk.BOTH, expand=True)
+        self.log_sink.attach(self.log_text)
 
     def log(self, text):
-        ts = time.strftime("%H:%M:%S")
-        try:
-            self.log_text.insert(tk.END, f"[{ts}] {text}\n")
-            self.log_text.see(tk.END)
-        except:
-            pass
-        print(f"[{ts}] {text}")
+        # seguro desde cualquier hilo: el panel se actualiza por lotes desde Tk
+        self.log_sink.push(text)
 
     def refresh_devices(self):
         self.devices = list_devices()
@@ -77,6 +120,28 @@ class AndroidMultiControlApp:
             self.device_listbox.insert(tk.END, d)
         self.log(f"Found devices: {self.devices}")
 
+    def poll_device_events(self):
+        """Aplica en el listbox los eventos del tracker (en el hilo de Tk, conserva la selección)."""
+        while self.device_events:
+            event, serial, state = self.device_events.popleft()
+            usable = event != REMOVED and state == "device"
+            if usable and get_health_registry().mark_healthy(serial):
+                self.log(f"Dispositivo {serial} reconectado: vuelve a recibir trabajos")
+            if usable and serial not in self.devices:
+                self.devices.append(serial)
+                self.device_listbox.insert(tk.END, serial)
+            elif not usable and serial in self.devices:
+                idx = self.devices.index(serial)
+                self.devices.pop(idx)
+                self.device_listbox.delete(idx)
+            if event == ADDED:
+                self.log(f"Dispositivo conectado: {serial} ({state})")
+            elif event == REMOVED:
+                self.log(f"Dispositivo desconectado: {serial}")
+            else:
+                self.log(f"Dispositivo {serial}: {state}")
+        self.root.after(300, self.poll_device_events)
+
     def get_selected_devices(self):
         indices = self.device_listbox.curselection()
         return [self.device_listbox.get(i) for i in indices]
@@ -91,7 +156,7 @@ class AndroidMultiControlApp:
             self.log(f"Abrir scrcpy para {d}")
 
     def open_visual_editor(self):
-        VisualFlowEditor(self.root, inject_target_textwidget=self.script_text)
+        VisualFlowEditor(self.root, inject_target_textwidget=self.script_text, log_cb=self.log)
 
     def send_command_selected(self):
         devs = self.get_selected_devices()
@@ -99,9 +164,44 @@ class AndroidMultiControlApp:
         if not cmd:
             messagebox.showwarning("Empty", "Escribe el comando ADB (sin 'adb -s <device>')")
             return
-        for d in devs:
-            out = run_adb_command(d, cmd)
-            self.log(f"[{d}] $ adb {cmd}\n{out}")
+        if not devs:
+            messagebox.showwarning("Select", "Selecciona uno o más dispositivos")
+            return
+        # en paralelo y fuera del hilo de Tk; el resumen agrupado va al log y a su ventana
+        self.log(f"$ adb {cmd} -> {len(devs)} dispositivos")
+        run = broadcast_command(devs, cmd, timeout=COMMAND_TIMEOUT, done_cb=lambda r: self.log(r.summary()))
+        self.open_broadcast_window(run)
+
+    def open_broadcast_window(self, run):
+        win = tk.Toplevel(self.root)
+        win.title(f"adb {run.command}")
+        win.geometry("700x450")
+        status = tk.Label(win, anchor=tk.W)
+        status.pack(fill=tk.X, padx=6, pady=4)
+        text = tk.Text(win, font=("Courier", 9))
+        text.pack(fill=tk.BOTH, expand=True, padx=6, pady=(0, 6))
+
+        def refresh():
+            if not win.winfo_exists():
+                return
+            results = run.ordered_results()
+            if run.finished.is_set():
+                status.config(text=f"Terminado: {len(results)} dispositivos")
+                text.delete("1.0", tk.END)
+                text.insert(tk.END, format_groups(run.command, results))
+                return
+            status.config(text=f"Respondieron {len(results)}/{len(run.serials)}...")
+            win.after(200, refresh)
+
+        refresh()
+
+    def compile_or_warn(self, script):
+        """Compila el script una vez para todos los dispositivos; muestra el error si está mal formado."""
+        try:
+            return compile_script(script)
+        except ScriptCompileError as e:
+            messagebox.showerror("Script inválido", str(e))
+            return None
 
     def run_inline_json(self):
         txt = self.script_text.get("1.0", tk.END).strip()
@@ -113,9 +213,10 @@ class AndroidMultiControlApp:
         except Exception as e:
             messagebox.showerror("JSON inválido", str(e))
             return
-        for d in self.get_selected_devices():
-            threading.Thread(target=lambda s=d, sc=script: execute_script_for_device(s, sc, log_cb=self.log), daemon=True).start()
-            self.log(f"Ejecutando inline JSON en {d}")
+        program = self.compile_or_warn(script)
+        if program is None:
+            return
+        self.launch_on_devices(self.get_selected_devices(), program, "inline JSON")
 
     def run_script_on_selected(self):
         path = filedialog.askopenfilename(filetypes=[("JSON Files","*.json")])
@@ -130,9 +231,10 @@ class AndroidMultiControlApp:
         if not devs:
             messagebox.showwarning("Select", "Selecciona uno o más dispositivos")
             return
-        for d in devs:
-            threading.Thread(target=lambda s=d, sc=script: execute_script_for_device(s, sc, log_cb=self.log), daemon=True).start()
-            self.log(f"Ejecutando {os.path.basename(path)} en {d}")
+        program = self.compile_or_warn(script)
+        if program is None:
+            return
+        self.launch_on_devices(devs, program, os.path.basename(path))
 
     def open_template(self):
         template = {
@@ -176,9 +278,136 @@ class AndroidMultiControlApp:
             script_path, devs = self.profiles[name]
             with open(script_path, "r", encoding="utf-8") as f:
                 script = json.load(f)
-            for d in devs:
-                threading.Thread(target=lambda s=d, sc=script: execute_script_for_device(s, sc, log_cb=self.log), daemon=True).start()
-                self.log(f"Profile '{name}' executed on {d}")
+            program = self.compile_or_warn(script)
+            if program is None:
+                return
+            self.launch_on_devices(devs, program, f"profile {name}")
+
+    # -------------------------
+    # trabajos (job_scheduler)
+    # -------------------------
+    def launch_on_devices(self, devs, program, label):
+        """Lanza el programa compilado en los dispositivos con el motor elegido."""
+        if not devs:
+            return
+        if self.engine_var.get() == "asyncio":
+            # un solo hilo con un event loop para todos los dispositivos
+            stop_ev = threading.Event()
+            self.async_runs.append(stop_ev)
+            limit = self.max_workers_var.get()
+
+            def run():
+                try:
+                    run_fleet(devs, program, log_cb=self.log, stop_event=stop_ev, max_concurrency=limit)
+                finally:
+                    if stop_ev in self.async_runs:
+                        self.async_runs.remove(stop_ev)
+            threading.Thread(target=run, daemon=True).start()
+            self.log(f"Ejecutando {label} en {len(devs)} dispositivos (asyncio)")
+            return
+        if self.engine_var.get() == "processes":
+            # reparte los dispositivos entre procesos; un proceso caído no afecta al resto
+            def on_result(summary):
+                if "error" in summary:
+                    self.log(f"[{summary['serial']}] ERROR: {summary['error']}")
+                else:
+                    self.log(f"[{summary['serial']}] {summary['executed']}/{summary['total_steps']} pasos, "
+                             f"{summary['failed']} fallidos en {summary['duration']:.1f}s")
+            run = launch_sharded(devs, program, log_cb=self.log, result_cb=on_result,
+                                 max_concurrency=self.max_workers_var.get())
+            self.sharded_runs = [r for r in self.sharded_runs if not r.finished.is_set()] + [run]
+            self.log(f"Ejecutando {label} en {len(devs)} dispositivos ({len(run.shards)} procesos)")
+            return
+        for d in devs:
+            job = self.scheduler.submit(d, program, label=label)
+            self.log(f"Ejecutando {label} en {d} (trabajo {job.id})")
+
+    def apply_worker_limit(self):
+        try:
+            n = int(self.max_workers_var.get())
+        except (tk.TclError, ValueError):
+            return
+        self.scheduler.set_limits(max_workers=n)
+        self.log(f"Paralelo máximo: {n} dispositivos")
+
+    def cancel_all_jobs(self):
+        n = self.scheduler.cancel_all()
+        for stop_ev in list(self.async_runs):
+            stop_ev.set()
+        for run in self.sharded_runs:
+            if not run.finished.is_set():
+                run.stop()
+        self.log(f"Cancelados {n} trabajos" + (f" y {len(self.async_runs)} ejecuciones asyncio" if self.async_runs else ""))
+
+    def toggle_tracing(self):
+        # la traza cubre los motores de hilos y asyncio (los procesos worker tienen la suya)
+        if self.trace_var.get():
+            self.last_trace = tracing.start_tracing()
+            self.log("Traza por paso activada")
+        else:
+            tracing.stop_tracing()
+            self.log("Traza por paso desactivada")
+
+    def export_trace(self):
+        tracer = self.last_trace
+        if tracer is None or not tracer.steps:
+            messagebox.showinfo("Traza", "No hay pasos trazados: activa 'Traza' y ejecuta un script")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Chrome trace", "*.json")])
+        if not path:
+            return
+        csv_path = os.path.splitext(path)[0] + ".csv"
+        tracer.export_chrome_trace(path)
+        tracer.export_csv(csv_path)
+        self.log(f"Traza exportada: {path} ({len(tracer.steps)} pasos) y resumen {csv_path}")
+
+    def open_jobs_window(self):
+        if self.jobs_window is not None and self.jobs_window.winfo_exists():
+            self.jobs_window.lift()
+            return
+        win = tk.Toplevel(self.root)
+        win.title("Trabajos")
+        win.geometry("620x400")
+        self.jobs_window = win
+        summary = tk.Label(win, anchor=tk.W)
+        summary.pack(fill=tk.X, padx=6, pady=4)
+        listbox = tk.Listbox(win, selectmode=tk.EXTENDED, font=("Courier", 9))
+        listbox.pack(fill=tk.BOTH, expand=True, padx=6)
+        bar = tk.Frame(win)
+        bar.pack(fill=tk.X, padx=6, pady=4)
+        shown_ids = []
+
+        def cancel_selected():
+            for i in listbox.curselection():
+                self.scheduler.cancel(shown_ids[i])
+
+        tk.Button(bar, text="Cancelar seleccionados", command=cancel_selected).pack(side=tk.LEFT, padx=2)
+        tk.Button(bar, text="Limpiar terminados", command=self.scheduler.clear_finished).pack(side=tk.LEFT, padx=2)
+        tk.Button(bar, text="Restablecer no saludables", command=get_health_registry().reset).pack(side=tk.LEFT, padx=2)
+        health_label = tk.Label(win, anchor=tk.W, fg="#b00")
+        health_label.pack(fill=tk.X, padx=6, pady=(0, 4))
+
+        def refresh():
+            if not win.winfo_exists():
+                return
+            jobs = self.scheduler.jobs()
+            selected = {shown_ids[i] for i in listbox.curselection() if i < len(shown_ids)}
+            listbox.delete(0, tk.END)
+            shown_ids[:] = [j["id"] for j in jobs]
+            for i, j in enumerate(jobs):
+                listbox.insert(tk.END, f"#{j['id']:<4} {j['serial']:<22} {j['status']:<10} {j['elapsed']:6.1f}s  {j['label']}")
+                if j["id"] in selected:
+                    listbox.selection_set(i)
+            counts = self.scheduler.counts()
+            summary.config(text=" · ".join(f"{k}: {v}" for k, v in counts.items()))
+            health = get_health_registry()
+            hc = health.counts()
+            unhealthy = health.unhealthy()
+            health_label.config(text=f"timeouts: {hc['timeouts']} · no saludables: {hc['unhealthy']}" +
+                                (f" ({', '.join(sorted(unhealthy))})" if unhealthy else ""))
+            win.after(500, refresh)
+
+        refresh()
 
 # -------------------------
 # MAIN
@@ -0,0 +1,132 @@
+# script_compiler.py
+# Compila un script (lista de pasos) una sola vez: valida el anidamiento de
+# if/else/endif y while/endwhile y precalcula la tabla de saltos, de modo que
+# el ejecutor no tenga que buscar bloques coincidentes en cada iteración.
+from collections import namedtuple
+
+# steps: tupla de pasos (dicts, solo lectura por convención)
+# jumps: tupla paralela con el índice destino de cada paso de control (-1 si no aplica)
+#   if       -> primer paso tras el else, o tras el endif (cuando la condición es falsa)
+#   else     -> paso tras el endif (cuando la rama if se ejecutó)
+#   while    -> paso tras el endwhile (cuando la condición es falsa)
+#   endwhile -> índice del while
+#   break    -> paso tras el endwhile del bucle más interno
+#   continue -> índice del endwhile del bucle más interno
+# loops: tupla paralela con el índice del while al que pertenece cada
+#   endwhile/break/continue (-1 si no aplica)
+# batches: tupla paralela; para cada paso de entrada agrupable (ver
+#   BATCHABLE_ACTIONS) el índice tras el último paso de su racha, si desde él
+#   quedan al menos dos pasos agrupables (-1 si no)
+CompiledProgram = namedtuple("CompiledProgram", ["steps", "jumps", "loops", "batches"])
+
+BLOCK_ACTIONS = ("if", "else", "endif", "while", "endwhile", "break", "continue")
+# Pasos de entrada pura que pueden mandarse juntos en un solo script de shell:
+# no leen nada del dispositivo ni cambian variables
+BATCHABLE_ACTIONS = ("tap", "keyevent", "text", "swipe")
+
+
+class ScriptCompileError(ValueError):
+    """El script está mal formado (anidamiento de bloques incorrecto, formato inválido)."""
+
+
+def normalize_steps(script):
+    """Devuelve la lista de pasos de un script (dict con 'steps' o lista)."""
+    if isinstance(script, dict) and "steps" in script:
+        steps = script["steps"]
+    elif isinstance(script, list):
+        steps = script
+    else:
+        raise ScriptCompileError("Script inválido: se esperaba una lista de pasos o un dict con 'steps'")
+    if not isinstance(steps, list):
+        raise ScriptCompileError("Script inválido: 'steps' debe ser una lista")
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict):
+            raise ScriptCompileError(f"Paso {i+1}: se esperaba un objeto JSON, no {type(step).__name__}")
+    return steps
+
+
+def compile_script(script):
+    """
+    Compila un script a CompiledProgram. Si ya está compilado lo devuelve tal cual.
+    Lanza ScriptCompileError si el anidamiento de bloques es incorrecto.
+    """
+    if isinstance(script, CompiledProgram):
+        return script
+    steps = tuple(dict(s) for s in normalize_steps(script))
+    n = len(steps)
+    jumps = [-1] * n
+    loops = [-1] * n
+
+    # pila de bloques abiertos: [tipo, índice de apertura, índice del else]
+    stack = []
+    # cada bucle abierto acumula sus break/continue para resolverlos en el endwhile
+    pending = {}
+
+    for i, step in enumerate(steps):
+        action = step.get("action")
+        if action == "if":
+            stack.append(["if", i, -1])
+        elif action == "else":
+            if not stack or stack[-1][0] != "if":
+                raise ScriptCompileError(f"Paso {i+1}: 'else' sin 'if' abierto")
+            if stack[-1][2] != -1:
+                raise ScriptCompileError(f"Paso {i+1}: segundo 'else' para el 'if' del paso {stack[-1][1]+1}")
+            stack[-1][2] = i
+        elif action == "endif":
+            if not stack or stack[-1][0] != "if":
+                raise ScriptCompileError(f"Paso {i+1}: 'endif' sin 'if' abierto")
+            _, if_idx, else_idx = stack.pop()
+            if else_idx != -1:
+                jumps[if_idx] = else_idx + 1
+                jumps[else_idx] = i + 1
+            else:
+                jumps[if_idx] = i + 1
+        elif action == "while":
+            stack.append(["while", i, -1])
+            pending[i] = []
+        elif action == "endwhile":
+            if not stack or stack[-1][0] != "while":
+                raise ScriptCompileError(f"Paso {i+1}: 'endwhile' sin 'while' abierto")
+            _, while_idx, _ = stack.pop()
+            jumps[while_idx] = i + 1
+            jumps[i] = while_idx
+            loops[i] = while_idx
+            for j in pending.pop(while_idx):
+                jumps[j] = i + 1 if steps[j].get("action") == "break" else i
+                loops[j] = while_idx
+        elif action in ("break", "continue"):
+            loop = next((b for b in reversed(stack) if b[0] == "while"), None)
+            if loop is None:
+                raise ScriptCompileError(f"Paso {i+1}: '{action}' fuera de un bucle")
+            pending[loop[1]].append(i)
+
+    if stack:
+        kind, idx, _ = stack[-1]
+        closer = "endif" if kind == "if" else "endwhile"
+        raise ScriptCompileError(f"Paso {idx+1}: '{kind}' sin '{closer}'")
+
+    return CompiledProgram(steps, tuple(jumps), tuple(loops), input_batches(steps))
+
+
+def is_batchable(step):
+    """Paso de entrada con espera fija (sin 'wait' o un número literal)."""
+    if step.get("action") not in BATCHABLE_ACTIONS:
+        return False
+    wait = step.get("wait")
+    return wait is None or (isinstance(wait, (int, float)) and not isinstance(wait, bool))
+
+
+def input_batches(steps):
+    """Calcula la tupla `batches` de CompiledProgram (de atrás hacia delante)."""
+    n = len(steps)
+    batches = [-1] * n
+    end = -1
+    for i in range(n - 1, -1, -1):
+        if not is_batchable(steps[i]):
+            end = -1
+            continue
+        if end == -1:
+            end = i + 1
+        if end - i >= 2:
+            batches[i] = end
+    return tuple(batches)
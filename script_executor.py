@@ -1,470 +1,624 @@
 # script_executor.py (versión mejorada)
 import time
-import shlex
-import re
-from adb_utils import run_adb_command, run_adb_cmd_raw
+from collections import namedtuple
+import expressions
+from shell_pool import run_shell, parse_error
+from adb_utils import AdbCommandError, TIMEOUT_RC
+from watchdog import DeviceTimeout, action_timeout, get_watchdog, handle_timeout
+import watchdog
+import tracing
+from script_compiler import compile_script, ScriptCompileError
 
-# Intentar importar uiautomator2 (si no está, la app sigue funcionando con ADB)
-try:
-    import uiautomator2 as u2
-except Exception:
-    u2 = None
+from uia_pool import get_uia_cache
+from ui_hierarchy import get_snapshot, invalidate_snapshot
+import ui_wait
+from ui_wait import WaitCondition, wait_for, wait_for_timeout, record_wait_result
 
-def execute_script_for_device(serial, script, log_cb=None, stop_event=None):
+# Espera por defecto (segundos) tras cada acción si el paso no trae "wait"
+DEFAULT_WAITS = {
+    "open_link": 1, "shell": 0.5, "start_app": 1, "tap": 0.5, "text": 0.4,
+    "keyevent": 0.2, "swipe": 0.5, "broadcast": 0.2,
+    "uia_click": 0.4, "uia_text": 0.4, "uia_exists": 0.2, "uia_scroll": 0.4,
+}
+CONTROL_ACTIONS = ("while", "endwhile", "break", "continue", "if", "else", "endif")
+VARIABLE_ACTIONS = ("set_var", "math_operation")
+ADB_ACTIONS = ("open_link", "shell", "start_app", "tap", "text", "keyevent", "swipe", "broadcast")
+UIA_ACTIONS = ("uia_click", "uia_text", "uia_exists", "uia_scroll")
+# Acciones que pueden cambiar la pantalla: invalidan el snapshot de UI del dispositivo
+INPUT_ACTIONS = ("open_link", "shell", "start_app", "tap", "text", "keyevent", "swipe", "broadcast",
+                 "uia_click", "uia_text", "uia_scroll")
+# Las esperas (sleep, "wait" de un paso) también: la pantalla sigue cambiando sola.
+# uia_click pulsa las coordenadas del snapshot: solo si tiene como mucho esta edad (s)
+UIA_CLICK_MAX_AGE = 0.5
+
+# Rachas de pasos de entrada con espera fija (ver script_compiler.input_batches)
+# se mandan como un solo script de shell, con `sleep` en el dispositivo
+BATCH_INPUT_STEPS = True
+MAX_BATCH_STEPS = 50
+MAX_BATCH_SECONDS = 5.0       # tope de esperas por lote: stop_event se sigue revisando entre lotes
+BATCH_TIMEOUT_MARGIN = 10.0   # margen sobre la suma de esperas para el timeout del shell
+BATCH_STATUS_MARKER = "__batch_rc"
+
+# start/end: rango de pasos [start, end); actions/commands: acción y comando de cada paso
+# (comando None si al paso le faltan parámetros)
+InputBatch = namedtuple("InputBatch", ["start", "end", "actions", "commands", "script", "duration"])
+
+# Esperas adaptativas: el "wait" de las acciones de entrada y los sleep (de al
+# menos ui_wait.ADAPTIVE_MIN_WAIT) pasan a ser el tope de una espera a que la
+# UI deje de cambiar. Un paso puede activarlas o desactivarlas con "adaptive_wait"
+ADAPTIVE_WAITS = False
+
+# Tiempo mínimo (s) que tiene que quedarle al script para empezar una acción
+MIN_ACTION_TIME = 0.05
+
+
+class ScriptTimeout(Exception):
+    """El script agotó su plazo (watchdog.SCRIPT_TIMEOUT) antes de una acción."""
+
+
+def step_limit(timeout, deadline):
+    """
+    Plazo de una acción: `timeout` sin pasar de lo que le queda al script.
+    Si ya no queda (casi) nada lanza ScriptTimeout: un plazo 0 dejaría el
+    socket en modo no bloqueante y el fallo parecería del dispositivo.
+    """
+    if not deadline:
+        return timeout
+    left = deadline - time.time()
+    if left < MIN_ACTION_TIME:
+        raise ScriptTimeout()
+    return min(timeout, left)
+
+
+def step_wait(action, step):
+    """Segundos a esperar tras el paso (0 para pasos sin espera)."""
+    if action not in DEFAULT_WAITS:
+        return 0
+    return float(step.get("wait", DEFAULT_WAITS[action]))
+
+
+def adaptive_wait(action, step, wait):
+    """True si la espera fija `wait` del paso se sustituye por una espera adaptativa (ver ADAPTIVE_WAITS)."""
+    if wait < ui_wait.ADAPTIVE_MIN_WAIT or (action not in INPUT_ACTIONS and action != "sleep"):
+        return False
+    return bool(step.get("adaptive_wait", ADAPTIVE_WAITS))
+
+
+def control_flow_next(program, step_idx, iterations, eval_condition, log):
+    """
+    Resuelve un paso de control (if/else/endif/while/endwhile/break/continue)
+    con la tabla de saltos precalculada. Devuelve el índice del siguiente paso.
+    `iterations` guarda por índice de while las iteraciones completadas.
+    """
+    steps, jumps, loops = program.steps, program.jumps, program.loops
+    step = steps[step_idx]
+    action = step.get("action")
+
+    # Manejo de bucles (saltos precalculados en compile_script)
+    if action == "while":
+        if eval_condition(step.get("condition", "")):
+            return step_idx + 1
+        # Condición no cumplida, saltar tras el endwhile
+        iterations.pop(step_idx, None)
+        return jumps[step_idx]
+
+    if action == "endwhile":
+        while_idx = loops[step_idx]
+        count = iterations.get(while_idx, 0) + 1
+        max_iterations = steps[while_idx].get("max_iterations", 100)
+        if count >= max_iterations:
+            log(f"Bucle excedió el máximo de iteraciones ({max_iterations})")
+            iterations.pop(while_idx, None)
+            return step_idx + 1
+        # Volver al while para reevaluar la condición
+        iterations[while_idx] = count
+        return jumps[step_idx]
+
+    if action == "break":
+        iterations.pop(loops[step_idx], None)
+        return jumps[step_idx]
+
+    if action == "continue":
+        # ir al endwhile: cuenta la iteración y vuelve al while
+        return jumps[step_idx]
+
+    # Condicionales mejorados
+    if action == "if":
+        # Si es falsa saltar tras el else (o tras el endif si no hay else)
+        return step_idx + 1 if eval_condition(step.get("condition", "")) else jumps[step_idx]
+
+    if action == "else":
+        # Solo se llega aquí si la rama if se ejecutó: saltar tras el endif
+        return jumps[step_idx]
+
+    # endif: simplemente continuar
+    return step_idx + 1
+
+
+def apply_variable_step(action, step, vars_store, eval_expression, log):
+    """Ejecuta set_var / math_operation sobre vars_store."""
+    # Asignación de variables mejorada
+    if action == "set_var":
+        name = step.get("name")
+        if name:
+            # Evaluar expresión si es necesario
+            evaluated_value = eval_expression(step.get("value"))
+            vars_store[name] = evaluated_value
+            log(f"variable {name} = {evaluated_value} (tipo: {type(evaluated_value).__name__})")
+        return
+
+    # Operaciones matemáticas con variables
+    var_name = step.get("var_name")
+    operation = step.get("operation")
+    if not (var_name and var_name in vars_store and operation):
+        return
+    current_value = vars_store[var_name]
+    value = eval_expression(step.get("value"))
+    try:
+        if operation == "add":
+            vars_store[var_name] = current_value + value
+        elif operation == "subtract":
+            vars_store[var_name] = current_value - value
+        elif operation == "multiply":
+            vars_store[var_name] = current_value * value
+        elif operation == "divide":
+            if value != 0:
+                vars_store[var_name] = current_value / value
+            else:
+                log("Error: División por cero")
+        elif operation == "increment":
+            vars_store[var_name] = current_value + 1
+        elif operation == "decrement":
+            vars_store[var_name] = current_value - 1
+        log(f"{var_name} = {vars_store[var_name]} después de {operation}")
+    except Exception as e:
+        log(f"Error en operación matemática: {e}")
+
+
+def adb_step_command(action, step, eval_expression, log):
+    """
+    Comando de shell (en el dispositivo) para una acción ADB pura, con las
+    variables ya sustituidas. Devuelve None si faltan parámetros.
+    """
+    if action == "open_link":
+        url = step.get("url")
+        if not url:
+            log("open_link sin URL")
+            return None
+        return f"am start -a android.intent.action.VIEW -d \"{eval_expression(url)}\""
+
+    if action == "shell":
+        cmd = step.get("command", "")
+        return str(eval_expression(cmd)) if cmd else None
+
+    if action == "start_app":
+        pkg = step.get("package")
+        if not pkg:
+            log("start_app sin package")
+            return None
+        return f"monkey -p {eval_expression(pkg)} -c android.intent.category.LAUNCHER 1"
+
+    if action == "tap":
+        x = eval_expression(step.get("x"))
+        y = eval_expression(step.get("y"))
+        if x is None or y is None:
+            log("tap sin coords")
+            return None
+        return f"input tap {int(x)} {int(y)}"
+
+    if action == "text":
+        txt = str(eval_expression(step.get("text", "")))
+        safe = txt.replace(" ", "%s")
+        return f"input text {safe}"
+
+    if action == "keyevent":
+        key = step.get("key")
+        if key is None:
+            return None
+        return f"input keyevent {eval_expression(key)}"
+
+    if action == "swipe":
+        x1 = eval_expression(step.get("x1"))
+        y1 = eval_expression(step.get("y1"))
+        x2 = eval_expression(step.get("x2"))
+        y2 = eval_expression(step.get("y2"))
+        dur = eval_expression(step.get("duration", 300))
+        if None in (x1, y1, x2, y2):
+            log("swipe sin coords")
+            return None
+        return f"input swipe {int(x1)} {int(y1)} {int(x2)} {int(y2)} {int(dur)}"
+
+    if action == "broadcast":
+        intent = step.get("intent")
+        if not intent:
+            return None
+        return f"am broadcast -a {eval_expression(intent)}"
+
+    return None
+
+
+def check_adb_step(action, cmd, res, log):
+    """
+    Registra el resultado de una acción ADB. Para `shell` se muestra la salida
+    y el rc es del usuario; en las demás un rc != 0 hace fallar el paso.
+    Un timeout lanza DeviceTimeout en ambos casos.
+    """
+    if res.rc == TIMEOUT_RC:
+        raise DeviceTimeout(f"{cmd}: {res.stderr}")
+    if action == "shell":
+        log(f"Shell: {cmd}")
+        if res.stdout: log(f"Output: {res.stdout}")
+        if res.stderr: log(f"Error: {res.stderr}")
+        if res.rc != 0: log(f"rc {res.rc}")
+    elif res.rc != 0:
+        raise AdbCommandError(cmd, res)
+    if res.attempts > 1:
+        log(f"{cmd}: {res.attempts} intentos")
+
+
+def plan_input_batch(program, step_idx, eval_expression, log):
+    """
+    Agrupa los pasos de entrada que empiezan en step_idx en un único script de
+    shell que imprime el código de salida de cada comando. Devuelve un
+    InputBatch, o None si no hay al menos dos pasos que agrupar.
+    """
+    end = program.batches[step_idx]
+    if not BATCH_INPUT_STEPS or end == -1:
+        return None
+    steps = program.steps
+    waits = []
+    for i in range(step_idx, min(end, step_idx + MAX_BATCH_STEPS)):
+        wait = step_wait(steps[i].get("action"), steps[i])
+        if waits and sum(waits) + wait > MAX_BATCH_SECONDS:
+            break
+        if adaptive_wait(steps[i].get("action"), steps[i], wait):
+            break  # su espera depende de la UI: va fuera del lote
+        waits.append(wait)
+    if len(waits) < 2:
+        return None
+    actions = tuple(steps[i].get("action") for i in range(step_idx, step_idx + len(waits)))
+    commands = []
+    for i in range(step_idx, step_idx + len(waits)):
+        cmd = adb_step_command(actions[i - step_idx], steps[i], eval_expression, log)
+        if cmd and parse_error(cmd):
+            break  # mal formado: va solo (y falla solo) en vez de tumbar todo el lote
+        commands.append(cmd)
+    if len(commands) < 2:
+        return None
+    waits, actions = waits[:len(commands)], actions[:len(commands)]
+    lines = []
+    for i, (cmd, wait) in enumerate(zip(commands, waits), step_idx):
+        if cmd:
+            lines.append(f'{cmd}; echo "{BATCH_STATUS_MARKER} {i} $?"')
+        if wait:
+            lines.append(f"sleep {wait:g}")
+    return InputBatch(step_idx, step_idx + len(waits), actions, tuple(commands), "\n".join(lines), sum(waits))
+
+
+def parse_batch_status(out):
+    """Índice de paso -> código de salida, según las marcas impresas por el lote."""
+    status = {}
+    for line in (out or "").splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[0] == BATCH_STATUS_MARKER:
+            try:
+                status[int(parts[1])] = int(parts[2])
+            except ValueError:
+                pass
+    return status
+
+
+def record_input_batch(serial, batch, result, stats, step_cb, log):
+    """
+    Registra el resultado de un lote paso a paso (stats, step_cb, log) y
+    devuelve {índice de paso: código de salida}. Un comando sin marca (el
+    script se cortó antes) cuenta como fallido.
+    """
+    status = parse_batch_status(result.stdout)
+    log(f"Steps {batch.start+1}-{batch.end}: {batch.end - batch.start} pasos de entrada "
+        f"en un solo script ({batch.duration:g}s de esperas en el dispositivo)")
+    for i, (action, cmd) in enumerate(zip(batch.actions, batch.commands), batch.start):
+        ok = cmd is None or status.get(i) == 0
+        stats["executed"] += 1
+        if not ok:
+            stats["failed"] += 1
+            log(f"ERROR en step {i+1}: {cmd} -> rc {status.get(i, 'sin ejecutar')}")
+        if step_cb:
+            step_cb(serial, i, action, ok)
+    if result.stderr:
+        log(f"Error: {result.stderr}")
+    return status
+
+
+def uia_selector(step, eval_expression):
+    """Selector uiautomator2 del paso (resourceId, text o description, en ese orden) o None."""
+    for key in ("resourceId", "text", "description"):
+        if key in step:
+            return {key: str(eval_expression(step[key]))}
+    return None
+
+
+def run_uia_step(d, serial, action, step, vars_store, eval_expression, log):
+    """
+    Acciones UIAutomator2 (más precisas). Si `d` es None usa equivalentes ADB
+    cuando es posible. Los selectores se resuelven contra el snapshot de UI
+    del dispositivo (ui_hierarchy), un dump compartido por todas las
+    búsquedas hasta la siguiente acción de entrada.
+    Bloqueante: el ejecutor asíncrono la corre en un hilo.
+    """
+    if action == "uia_click":
+        selector = uia_selector(step, eval_expression)
+        if d is None:
+            # fallback to adb tap if coords
+            x = eval_expression(step.get("x"))
+            y = eval_expression(step.get("y"))
+            if x is not None and y is not None:
+                run_shell(serial, f"input tap {int(x)} {int(y)}")
+            else:
+                log("uia_click solicitado pero UIA no disponible y sin coords")
+        elif selector:
+            node = get_snapshot(serial, d, max_age=UIA_CLICK_MAX_AGE).find(**selector)
+            if node is not None:
+                d.click(*node.center)
+            else:
+                # aún no está en pantalla: esperar a que aparezca como antes
+                d(**selector).click_exists(timeout=5)
+        elif "x" in step and "y" in step:
+            d.click(int(eval_expression(step["x"])), int(eval_expression(step["y"])))
+
+    elif action == "uia_text":
+        text_val = str(eval_expression(step.get("text", "")))
+        if d is None:
+            run_shell(serial, f"input text {text_val.replace(' ', '%s')}")
+        elif "resourceId" in step:
+            resource_id = str(eval_expression(step["resourceId"]))
+            if get_snapshot(serial, d).exists(resourceId=resource_id):
+                try:
+                    d(resourceId=resource_id).set_text(text_val)
+                except Exception:
+                    d.send_keys(text_val)
+            else:
+                d.send_keys(text_val)
+        else:
+            d.send_keys(text_val)
+
+    elif action == "uia_exists":
+        exists = False
+        selector = uia_selector(step, eval_expression)
+        if d is not None and selector:
+            exists = get_snapshot(serial, d).exists(**selector)
+        # Guardar resultado en variable si se especifica
+        result_var = step.get("result_var")
+        if result_var:
+            vars_store[result_var] = exists
+        log(f"uia_exists -> {exists}")
+
+    elif action == "uia_scroll":
+        if d is not None and "text" in step:
+            try:
+                d(scrollable=True).scroll.to(text=str(eval_expression(step["text"])))
+            except Exception:
+                run_shell(serial, "input swipe 300 1200 300 400 400")
+
+
+def new_run_stats(serial, total_steps):
+    """Resumen de una ejecución (lo que devuelven los ejecutores)."""
+    return {"serial": serial, "total_steps": total_steps, "executed": 0, "failed": 0,
+            "stopped": False, "timed_out": False, "start_time": time.time(), "duration": 0.0}
+
+
+def finish_run_stats(stats):
+    stats["duration"] = time.time() - stats["start_time"]
+    return stats
+
+
+def connect_uia(serial, log):
+    """
+    Conexión uiautomator2 del dispositivo desde la caché del proceso (uia_pool);
+    devuelve None si no está disponible.
+    """
+    cache = get_uia_cache()
+    if not cache.available:
+        return None
+    try:
+        d = cache.get(serial)
+        log("UIAutomator2 conectado.")
+        return d
+    except Exception as e:
+        log(f"UIA connect falló: {e}. Usando ADB cuando sea posible.")
+        return None
+
+
+def execute_script_for_device(serial, script, log_cb=None, stop_event=None, step_cb=None, script_timeout=None,
+                              tracer=None):
     """
-    Ejecuta un script (dict con key 'steps' o lista de pasos) en un dispositivo.
+    Ejecuta un script (dict con key 'steps', lista de pasos o CompiledProgram) en un dispositivo.
     Soporte mejorado para:
       - Variables: asignación, operaciones matemáticas
       - Condicionales: if/else, comparaciones complejas
-      - Bucles: while con condiciones
+      - Bucles: while con condiciones, break/continue
       - ADB actions: start_app, tap, text, keyevent, swipe, broadcast, sleep
       - UIA actions: uia_click, uia_text, uia_exists, uia_scroll
+      - wait_for: esperar a que un selector aparezca/desaparezca, a que la UI
+        se estabilice o a una actividad en primer plano (ver ui_wait)
+    El script se compila (ver script_compiler) antes de empezar; para lanzar
+    el mismo script en muchos dispositivos conviene compilarlo una vez y
+    pasar el CompiledProgram, que se comparte en solo lectura entre hilos.
     stop_event: threading.Event para parar ejecución si es necesario
+    step_cb: opcional, step_cb(serial, step_idx, action, ok) tras cada paso no de control
+    script_timeout: plazo del script completo en segundos (por defecto watchdog.SCRIPT_TIMEOUT)
+    Cada acción ADB/UIA tiene además su plazo (watchdog.action_timeout); si
+    vence, el dispositivo se marca como no saludable y el script termina.
+    tracer: tracing.Tracer que recibe el tiempo de cada paso (por defecto la
+    traza global de tracing, si está activa)
+    Devuelve un resumen (ver new_run_stats) o None si el script no compila.
     """
-    # Normalizar steps
-    if isinstance(script, dict) and "steps" in script:
-        steps = script["steps"]
-    elif isinstance(script, list):
-        steps = script
-    else:
+    def log(msg):
         if log_cb:
-            log_cb(f"[{serial}] Script inválido")
+            log_cb(f"[{serial}] {msg}")
+
+    try:
+        program = compile_script(script)
+    except ScriptCompileError as e:
+        log(str(e))
         return
+    steps = program.steps
+    if script_timeout is None:
+        script_timeout = watchdog.SCRIPT_TIMEOUT
+    deadline = time.time() + script_timeout if script_timeout else None
+    wd = get_watchdog()
+    tracer = tracer or tracing.active_tracer()
+
+    def limit(timeout):
+        return step_limit(timeout, deadline)
 
     # intento de conectar uiautomator2
-    d = None
-    if u2 is not None:
-        try:
-            d = u2.connect(serial)
-            if log_cb:
-                log_cb(f"[{serial}] UIAutomator2 conectado.")
-        except Exception as e:
-            d = None
-            if log_cb:
-                log_cb(f"[{serial}] UIA connect falló: {e}. Usando ADB cuando sea posible.")
+    d = connect_uia(serial, log)
 
+    stats = new_run_stats(serial, len(steps))
     vars_store = {}  # para variables
-    loop_stack = []  # para manejar bucles anidados
+    iterations = {}  # índice del while -> iteraciones completadas
     step_idx = 0     # índice del paso actual
-    
-    # Función para evaluar expresiones con variables
+
+    # Expresiones y condiciones: compiladas y cacheadas por texto (ver expressions)
     def eval_expression(expr):
-        if isinstance(expr, (int, float, bool)):
-            return expr
-        if isinstance(expr, str):
-            # Reemplazar variables en la expresión
-            for var_name, var_value in vars_store.items():
-                expr = expr.replace(f"${{{var_name}}}", str(var_value))
-            
-            # Intentar evaluar como expresión matemática
-            try:
-                # Verificar si es una expresión matemática válida
-                if re.match(r'^[\d\s\+\-\*\/\(\)\.\%\<\>\=\!\&\\|]+$', expr):
-                    # Reemplazar operadores lógicos
-                    expr = expr.replace('==', '==').replace('!=', '!=').replace('<=', '<=').replace('>=', '>=')
-                    expr = expr.replace(' and ', ' and ').replace(' or ', ' or ')
-                    
-                    # Evaluar expresión
-                    return eval(expr, {"__builtins__": None}, {})
-            except:
-                pass
-            
-            # Si no es una expresión matemática, devolver el string
-            return expr
-        return expr
+        return expressions.eval_expression(expr, vars_store)
 
-    # Función para evaluar condiciones
     def eval_condition(condition):
-        if isinstance(condition, bool):
-            return condition
-        
-        if isinstance(condition, str):
-            # Reemplazar variables en la condición
-            for var_name, var_value in vars_store.items():
-                condition = condition.replace(f"${{{var_name}}}", str(var_value))
-            
-            # Intentar evaluar como expresión booleana
-            try:
-                # Reemplazar operadores lógicos
-                condition = condition.replace(' and ', ' and ').replace(' or ', ' or ')
-                condition = condition.replace('==', '==').replace('!=', '!=').replace('<=', '<=').replace('>=', '>=')
-                
-                # Evaluar condición
-                return eval(condition, {"__builtins__": None}, {})
-            except:
-                # Si falla la evaluación, tratar como comparación de strings
-                if "==" in condition:
-                    parts = condition.split("==", 1)
-                    return str(parts[0]).strip() == str(parts[1]).strip()
-                elif "!=" in condition:
-                    parts = condition.split("!=", 1)
-                    return str(parts[0]).strip() != str(parts[1]).strip()
-                elif " contains " in condition:
-                    parts = condition.split(" contains ", 1)
-                    return str(parts[1]).strip() in str(parts[0]).strip()
-                else:
-                    # Condición no reconocida, tratar como False
-                    return False
-        
-        return False
+        return expressions.eval_condition(condition, vars_store)
+
+    def poll(condition, timeout, label, initial_delay=0.0):
+        # cada consulta puede colgarse (dump de UI): el vigilante cubre el plazo más un margen
+        with wd.watch(serial, label, timeout + action_timeout("wait_for")):
+            return wait_for(serial, d, condition, timeout, stop_event, initial_delay)
+
+    def pause(secs, adaptive):
+        """Espera fija, o adaptativa con `secs` como tope. Después la UI ya no es la del snapshot."""
+        if not adaptive:
+            time.sleep(secs)
+        else:
+            start = time.time()
+            met = poll(ui_wait.settle_condition(), limit(secs), f"step {step_idx+1} espera adaptativa",
+                       ui_wait.ADAPTIVE_SETTLE)
+            log(f"espera adaptativa: {time.time() - start:.2f}s de {secs:g}s" + ("" if met else " (UI sin estabilizar)"))
+        invalidate_snapshot(serial)
 
     while step_idx < len(steps):
         if stop_event and stop_event.is_set():
-            if log_cb: log_cb(f"[{serial}] Ejecución interrumpida por stop_event.")
+            log("Ejecución interrumpida por stop_event.")
+            stats["stopped"] = True
+            break
+        if deadline and time.time() > deadline:
+            log(f"Script superó su plazo de {script_timeout}s.")
+            stats["timed_out"] = True
+            watchdog.get_health_registry().record_timeout(serial, "script", unhealthy=False)
             break
 
         step = steps[step_idx]
         action = step.get("action")
-        if log_cb:
-            log_cb(f"[{serial}] Step {step_idx+1}: {action} -> {step}")
+        log(f"Step {step_idx+1}: {action} -> {step}")
+        trace = tracer.begin_step(serial, step_idx, action)
+        ok = False
 
         try:
-            # Manejo de bucles
-            if action == "while":
-                condition = step.get("condition", "")
-                loop_id = step.get("loop_id", f"loop_{step_idx}")
-                
-                # Evaluar condición
-                condition_met = eval_condition(condition)
-                
-                if condition_met:
-                    # Guardar posición para volver
-                    if not any(loop["loop_id"] == loop_id for loop in loop_stack):
-                        loop_stack.append({
-                            "loop_id": loop_id,
-                            "start_idx": step_idx,
-                            "max_iterations": step.get("max_iterations", 100),
-                            "iteration": 0
-                        })
-                    
-                    # Avanzar al siguiente paso
-                    step_idx += 1
-                    continue
-                else:
-                    # Condición no cumplida, saltar al endwhile correspondiente
-                    endwhile_idx = find_matching_endwhile(steps, step_idx)
-                    if endwhile_idx != -1:
-                        step_idx = endwhile_idx + 1
-                    else:
-                        step_idx += 1
-                    continue
-            
-            elif action == "endwhile":
-                # Volver al inicio del bucle
-                current_loop = loop_stack[-1] if loop_stack else None
-                if current_loop:
-                    # Verificar máximo de iteraciones
-                    current_loop["iteration"] += 1
-                    if current_loop["iteration"] >= current_loop["max_iterations"]:
-                        if log_cb: log_cb(f"[{serial}] Bucle excedió el máximo de iteraciones ({current_loop['max_iterations']})")
-                        loop_stack.pop()
-                        step_idx += 1
-                        continue
-                    
-                    # Volver al inicio del bucle
-                    step_idx = current_loop["start_idx"]
-                else:
-                    step_idx += 1
-                continue
-            
-            # Condicionales mejorados
-            elif action == "if":
-                condition = step.get("condition", "")
-                condition_met = eval_condition(condition)
-                
-                if not condition_met:
-                    # Saltar al else o endif correspondiente
-                    else_idx = find_matching_else(steps, step_idx)
-                    endif_idx = find_matching_endif(steps, step_idx)
-                    
-                    if else_idx != -1:
-                        step_idx = else_idx + 1
-                    elif endif_idx != -1:
-                        step_idx = endif_idx + 1
-                    else:
-                        step_idx += 1
-                else:
-                    step_idx += 1
+            batch = plan_input_batch(program, step_idx, eval_expression, log)
+            if batch is not None:
+                trace.action, trace.label = "batch", f"steps {batch.start+1}-{batch.end}"
+                timeout = limit(batch.duration + BATCH_TIMEOUT_MARGIN)
+                with wd.watch(serial, f"steps {batch.start+1}-{batch.end}", timeout), trace.phase("adb"):
+                    res = run_shell(serial, batch.script, timeout=timeout)
+                if res.rc == TIMEOUT_RC:
+                    raise DeviceTimeout(f"lote de pasos {batch.start+1}-{batch.end}: {res.stderr}")
+                failed = stats["failed"]
+                record_input_batch(serial, batch, res, stats, step_cb, log)
+                invalidate_snapshot(serial)
+                ok = stats["failed"] == failed
+                step_idx = batch.end
                 continue
-            
-            elif action == "else":
-                # Saltar al endif correspondiente (solo se ejecuta si el if fue falso)
-                endif_idx = find_matching_endif(steps, step_idx)
-                if endif_idx != -1:
-                    step_idx = endif_idx + 1
-                else:
-                    step_idx += 1
-                continue
-            
-            elif action == "endif":
-                # Simplemente continuar
-                step_idx += 1
-                continue
-            
-            # Asignación de variables mejorada
-            elif action == "set_var":
-                name = step.get("name")
-                value = step.get("value")
-                
-                if name:
-                    # Evaluar expresión si es necesario
-                    evaluated_value = eval_expression(value)
-                    vars_store[name] = evaluated_value
-                    
-                    if log_cb: 
-                        log_cb(f"[{serial}] variable {name} = {evaluated_value} (tipo: {type(evaluated_value).__name__})")
-                
-                step_idx += 1
-                continue
-            
-            # Operaciones matemáticas con variables
-            elif action == "math_operation":
-                var_name = step.get("var_name")
-                operation = step.get("operation")
-                value = step.get("value")
-                
-                if var_name and var_name in vars_store and operation:
-                    current_value = vars_store[var_name]
-                    value = eval_expression(value)
-                    
-                    try:
-                        if operation == "add":
-                            vars_store[var_name] = current_value + value
-                        elif operation == "subtract":
-                            vars_store[var_name] = current_value - value
-                        elif operation == "multiply":
-                            vars_store[var_name] = current_value * value
-                        elif operation == "divide":
-                            if value != 0:
-                                vars_store[var_name] = current_value / value
-                            else:
-                                if log_cb: log_cb(f"[{serial}] Error: División por cero")
-                        elif operation == "increment":
-                            vars_store[var_name] = current_value + 1
-                        elif operation == "decrement":
-                            vars_store[var_name] = current_value - 1
-                        
-                        if log_cb: 
-                            log_cb(f"[{serial}] {var_name} = {vars_store[var_name]} después de {operation}")
-                    except Exception as e:
-                        if log_cb: log_cb(f"[{serial}] Error en operación matemática: {e}")
-                
-                step_idx += 1
+
+            if action in CONTROL_ACTIONS:
+                step_idx = control_flow_next(program, step_idx, iterations, eval_condition, log)
+                ok = True
                 continue
-            
-            # ADB actions (existentes, pero con soporte para variables)
-            elif action == "open_link":
-                url = step.get("url")
-                if url:
-                    url = str(eval_expression(url))
-                    run_adb_command(serial, f"shell am start -a android.intent.action.VIEW -d \"{url}\"")
-                    time.sleep(step.get("wait", 1))
-                else:
-                    if log_cb: log_cb(f"[{serial}] open_link sin URL")
-           
-            elif action == "shell":
-                cmd = step.get("command", "")
+
+            if action in VARIABLE_ACTIONS:
+                apply_variable_step(action, step, vars_store, eval_expression, log)
+
+            # ADB actions (sesión de shell persistente del dispositivo)
+            elif action in ADB_ACTIONS:
+                cmd = adb_step_command(action, step, eval_expression, log)
                 if cmd:
-                    cmd = str(eval_expression(cmd))
-                    # Ejecutar comando shell directamente
-                    full_cmd = ["adb", "-s", serial, "shell"] + shlex.split(cmd)
-                    out, err, rc = run_adb_cmd_raw(full_cmd)
-                    if log_cb:
-                        log_cb(f"[{serial}] Shell: {cmd}")
-                        if out: log_cb(f"[{serial}] Output: {out}")
-                        if err: log_cb(f"[{serial}] Error: {err}")
-                time.sleep(step.get("wait", 0.5))   
-
-            elif action == "start_app":
-                pkg = step.get("package")
-                if pkg:
-                    pkg = str(eval_expression(pkg))
-                    run_adb_command(serial, f"shell monkey -p {pkg} -c android.intent.category.LAUNCHER 1")
-                    time.sleep(step.get("wait", 1))
-                else:
-                    if log_cb: log_cb(f"[{serial}] start_app sin package")
-
-            elif action == "tap":
-                x = eval_expression(step.get("x"))
-                y = eval_expression(step.get("y"))
-                if x is None or y is None:
-                    if log_cb: log_cb(f"[{serial}] tap sin coords")
-                else:
-                    run_adb_command(serial, f"shell input tap {int(x)} {int(y)}")
-                time.sleep(step.get("wait", 0.5))
-
-            elif action == "text":
-                txt = step.get("text", "")
-                txt = str(eval_expression(txt))
-                safe = txt.replace(" ", "%s")
-                run_adb_command(serial, f"shell input text {safe}")
-                time.sleep(step.get("wait", 0.4))
-
-            elif action == "keyevent":
-                key = step.get("key")
-                if key is not None:
-                    key = eval_expression(key)
-                    run_adb_command(serial, f"shell input keyevent {key}")
-                time.sleep(step.get("wait", 0.2))
-
-            elif action == "swipe":
-                x1 = eval_expression(step.get("x1"))
-                y1 = eval_expression(step.get("y1"))
-                x2 = eval_expression(step.get("x2"))
-                y2 = eval_expression(step.get("y2"))
-                dur = eval_expression(step.get("duration", 300))
-                
-                if None in (x1, y1, x2, y2):
-                    if log_cb: log_cb(f"[{serial}] swipe sin coords")
-                else:
-                    run_adb_command(serial, f"shell input swipe {int(x1)} {int(y1)} {int(x2)} {int(y2)} {int(dur)}")
-                time.sleep(step.get("wait", 0.5))
-
-            elif action == "broadcast":
-                intent = step.get("intent")
-                if intent:
-                    intent = str(eval_expression(intent))
-                    run_adb_command(serial, f"shell am broadcast -a {intent}")
-                time.sleep(step.get("wait", 0.2))
+                    timeout = limit(action_timeout(action, step))
+                    with wd.watch(serial, f"step {step_idx+1} {action}", timeout), trace.phase("adb"):
+                        res = run_shell(serial, cmd, timeout=timeout)
+                    check_adb_step(action, cmd, res, log)
 
             elif action == "sleep":
                 secs = float(eval_expression(step.get("seconds", 1)))
-                if log_cb: log_cb(f"[{serial}] durmiendo {secs}s")
-                time.sleep(secs)
-
-            # UIAutomator2 actions (más precisas)
-            elif action == "uia_click":
-                if d is None:
-                    # fallback to adb tap if coords
-                    x = eval_expression(step.get("x"))
-                    y = eval_expression(step.get("y"))
-                    if x is not None and y is not None:
-                        run_adb_command(serial, f"shell input tap {int(x)} {int(y)}")
-                        time.sleep(step.get("wait", 0.3))
-                    else:
-                        if log_cb: log_cb(f"[{serial}] uia_click solicitado pero UIA no disponible y sin coords")
-                else:
-                    if "resourceId" in step:
-                        resourceId = str(eval_expression(step["resourceId"]))
-                        d(resourceId=resourceId).click_exists(timeout=5)
-                    elif "text" in step:
-                        text = str(eval_expression(step["text"]))
-                        d(text=text).click_exists(timeout=5)
-                    elif "description" in step:
-                        description = str(eval_expression(step["description"]))
-                        d(description=description).click_exists(timeout=5)
-                    elif "x" in step and "y" in step:
-                        x = eval_expression(step["x"])
-                        y = eval_expression(step["y"])
-                        d.click(int(x), int(y))
-                    time.sleep(step.get("wait", 0.4))
-
-            elif action == "uia_text":
-                if d is None:
-                    txt = step.get("text", "")
-                    txt = str(eval_expression(txt))
-                    safe = txt.replace(" ", "%s")
-                    run_adb_command(serial, f"shell input text {safe}")
-                else:
-                    text_val = str(eval_expression(step.get("text", "")))
-                    if "resourceId" in step:
-                        resourceId = str(eval_expression(step["resourceId"]))
-                        elem = d(resourceId=resourceId)
-                        if elem.exists:
-                            try:
-                                elem.set_text(text_val)
-                            except Exception:
-                                d.send_keys(text_val)
-                        else:
-                            d.send_keys(text_val)
-                    else:
-                        d.send_keys(text_val)
-                time.sleep(step.get("wait", 0.4))
-
-            elif action == "uia_exists":
-                exists = False
-                if d is not None:
-                    if "resourceId" in step:
-                        resourceId = str(eval_expression(step["resourceId"]))
-                        exists = d(resourceId=resourceId).exists
-                    elif "text" in step:
-                        text = str(eval_expression(step["text"]))
-                        exists = d(text=text).exists
-                    elif "description" in step:
-                        description = str(eval_expression(step["description"]))
-                        exists = d(description=description).exists
-                
-                # Guardar resultado en variable si se especifica
-                result_var = step.get("result_var")
-                if result_var:
-                    vars_store[result_var] = exists
-                
-                if log_cb:
-                    log_cb(f"[{serial}] uia_exists -> {exists}")
-                time.sleep(step.get("wait", 0.2))
-
-            elif action == "uia_scroll":
-                if d is not None:
-                    if "text" in step:
-                        text = str(eval_expression(step["text"]))
-                        try:
-                            d(scrollable=True).scroll.to(text=text)
-                        except Exception:
-                            run_adb_command(serial, f"shell input swipe 300 1200 300 400 400")
-                time.sleep(step.get("wait", 0.4))
+                log(f"durmiendo {secs}s")
+                with trace.phase("sleep"):
+                    pause(secs, adaptive_wait(action, step, secs))
+
+            elif action == "wait_for":
+                condition = WaitCondition.from_step(step, eval_expression)
+                start = time.time()
+                with trace.phase("uia"):
+                    met = poll(condition, limit(wait_for_timeout(step, eval_expression)),
+                               f"step {step_idx+1} wait_for")
+                record_wait_result(step, condition, met, time.time() - start, vars_store, log)
+
+            elif action in UIA_ACTIONS:
+                with wd.watch(serial, f"step {step_idx+1} {action}", limit(action_timeout(action, step))), \
+                        trace.phase("uia"):
+                    run_uia_step(d, serial, action, step, vars_store, eval_expression, log)
 
             else:
-                if log_cb:
-                    log_cb(f"[{serial}] Acción desconocida: {action}")
-                
+                log(f"Acción desconocida: {action}")
+
+            if action in INPUT_ACTIONS:
+                invalidate_snapshot(serial)
+            wait = step_wait(action, step)
+            if wait:
+                with trace.phase("sleep"):
+                    pause(wait, adaptive_wait(action, step, wait))
+            stats["executed"] += 1
+            ok = True
+            if step_cb:
+                step_cb(serial, step_idx, action, True)
             step_idx += 1
 
+        except ScriptTimeout:
+            log(f"Script superó su plazo de {script_timeout}s.")
+            stats["timed_out"] = True
+            watchdog.get_health_registry().record_timeout(serial, "script", unhealthy=False)
+            break
+
+        except DeviceTimeout as e:
+            # dispositivo colgado: se libera, queda marcado como no saludable y el script termina
+            handle_timeout(serial, e)
+            log(f"TIMEOUT en step {step_idx+1}: {e}")
+            stats["executed"] += 1
+            stats["failed"] += 1
+            stats["timed_out"] = True
+            if step_cb:
+                step_cb(serial, step_idx, action, False)
+            break
+
         except Exception as e:
-            if log_cb:
-                log_cb(f"[{serial}] ERROR en step {step_idx+1}: {e}")
+            log(f"ERROR en step {step_idx+1}: {e}")
+            if action in UIA_ACTIONS and d is not None:
+                # la conexión pudo quedar rota: descartarla y reconectar
+                get_uia_cache().invalidate(serial)
+                d = connect_uia(serial, log)
+            stats["executed"] += 1
+            stats["failed"] += 1
+            if step_cb:
+                step_cb(serial, step_idx, action, False)
             step_idx += 1
 
-    if log_cb:
-        log_cb(f"[{serial}] Script finalizado.")
-
-# Funciones auxiliares para encontrar bloques coincidentes
-def find_matching_endwhile(steps, while_idx):
-    """Encuentra el endwhile que corresponde a un while"""
-    depth = 0
-    for i in range(while_idx + 1, len(steps)):
-        action = steps[i].get("action")
-        if action == "while":
-            depth += 1
-        elif action == "endwhile":
-            if depth == 0:
-                return i
-            depth -= 1
-    return -1
-
-def find_matching_else(steps, if_idx):
-    """Encuentra el else que corresponde a un if"""
-    depth = 0
-    for i in range(if_idx + 1, len(steps)):
-        action = steps[i].get("action")
-        if action == "if":
-            depth += 1
-        elif action == "else" and depth == 0:
-            return i
-        elif action == "endif":
-            if depth == 0:
-                return -1
-            depth -= 1
-    return -1
-
-def find_matching_endif(steps, start_idx):
-    """Encuentra el endif que corresponde a un if o else"""
-    depth = 0
-    for i in range(start_idx + 1, len(steps)):
-        action = steps[i].get("action")
-        if action == "if":
-            depth += 1
-        elif action == "endif":
-            if depth == 0:
-                return i
-            depth -= 1
-    return -1
\ No newline at end of file
+        finally:
+            tracer.end_step(trace, ok)
+
+    finish_run_stats(stats)
+    log("Script finalizado.")
+    return stats
@@ -2,15 +2,7 @@
 import time
 import shlex
 from adb_utils import run_adb_command, run_adb_cmd_raw
-
-
-
-
-# Intentar importar uiautomator2 (si no está, la app sigue funcionando con ADB)
-try:
-    import uiautomator2 as u2
-except Exception:
-    u2 = None
+from uia_pool import get_uia_cache
 
 def execute_script_for_device(serial, script, log_callback=None, stop_event=None):
     """
@@ -26,11 +18,11 @@ def execute_script_for_device(serial, script, log_callback=None, stop_event=None
             log_callback(f"[{serial}] Script inválido", "error")
         return False
 
-    # Intentar conectar uiautomator2
+    # Intentar conectar uiautomator2 (conexión cacheada por serial)
     d = None
-    if u2 is not None:
+    if get_uia_cache().available:
         try:
-            d = u2.connect(serial)
+            d = get_uia_cache().get(serial)
             if log_callback:
                 log_callback(f"[{serial}] UIAutomator2 conectado.", "info")
         except Exception as e:
@@ -0,0 +1,252 @@
+# shell_pool.py
+# Sesiones de shell persistentes (una por dispositivo) sobre el servidor ADB.
+# Cada comando se escribe en un `sh` de larga vida y su salida se delimita con
+# un centinela, así un paso de script cuesta una escritura en el socket en vez
+# de abrir un shell nuevo. El comando va entrecomillado como argumento de
+# `sh -c`: uno mal formado (comillas sin cerrar...) falla solo, sin dejar al
+# shell de la sesión esperando el resto.
+import itertools
+import shlex
+import socket
+import threading
+import time
+from adb_client import AdbError
+import adb_utils
+from adb_utils import AdbResult, TIMEOUT_RC, SYNTAX_ERROR_RC, INTERRUPTED_RC, DEFAULT_RETRY_POLICY, get_adb_client, run_adb_cmd_raw
+
+# Si una sesión lleva más de esto sin usarse se comprueba antes de reutilizarla
+HEALTH_CHECK_IDLE = 30.0
+HEALTH_CHECK_TIMEOUT = 3.0
+
+
+class ShellSessionError(Exception):
+    """
+    La sesión se rompió. `sent` indica si el comando llegó a escribirse;
+    `timed_out` si fue por no terminar dentro del timeout.
+    """
+
+    def __init__(self, msg, sent=False, timed_out=False):
+        super().__init__(msg)
+        self.sent = sent
+        self.timed_out = timed_out
+
+
+def parse_error(command):
+    """Por qué `command` no se puede separar en palabras (comillas sin cerrar...), o None si se puede."""
+    try:
+        shlex.split(command)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def session_payload(command, marker):
+    """Lo que se escribe en la sesión para `command`: su salida termina en "\\n<marker> <rc>\\n"."""
+    return f"sh -c {shlex.quote(command)} </dev/null 2>&1; printf '\\n%s %d\\n' {marker} $?\n"
+
+
+class ShellSession:
+    """Un `sh` abierto en el dispositivo vía exec: (sin PTY, stdin/stdout crudos)."""
+
+    _counter = itertools.count(1)
+
+    def __init__(self, serial, client):
+        self.serial = serial
+        self.client = client
+        self.sock = None
+        self.buf = bytearray()
+        self.last_used = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def open(self):
+        self.close()
+        self.sock = self.client.open_service(self.serial, "exec:sh")
+        self.buf = bytearray()
+        self.last_used = time.time()
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+
+    def abort(self):
+        """Corta la sesión desde otro hilo (sin tomar el lock): el recv bloqueado falla y run() termina."""
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def run(self, command, timeout=None):
+        """
+        Ejecuta `command` y devuelve (salida, rc). stderr va mezclado con stdout.
+        Si la sesión se rompe la cierra y lanza ShellSessionError. El comando
+        va entrecomillado como argumento de `sh -c`: uno mal formado falla él
+        solo (rc de sh) y la sesión sigue usable. La validación con
+        parse_error se hace una vez, en run_shell.
+        """
+        if self.sock is None:
+            raise ShellSessionError("sesión cerrada")
+        marker = f"__GB_END_{next(self._counter)}__".encode()
+        # stdin a /dev/null para que el comando no se coma los siguientes
+        payload = session_payload(command, marker.decode()).encode("utf-8")
+        try:
+            self.sock.settimeout(timeout)
+            self.sock.sendall(payload)
+        except OSError as e:
+            self.close()
+            raise ShellSessionError(f"no se pudo escribir en la sesión: {e}", sent=False)
+
+        needle = b"\n" + marker + b" "
+        # el timeout es para el comando entero, no para cada recv (uno que no para de escribir también vence)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            while True:
+                pos = self.buf.find(needle)
+                if pos != -1:
+                    end = self.buf.find(b"\n", pos + len(needle))
+                    if end != -1:
+                        out = bytes(self.buf[:pos])
+                        rc = int(self.buf[pos + len(needle):end] or b"0")
+                        del self.buf[:end + 1]
+                        break
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        raise socket.timeout()
+                    self.sock.settimeout(left)
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError("el dispositivo cerró la sesión")
+                self.buf += chunk
+        except socket.timeout:
+            self.close()
+            raise ShellSessionError(f"timeout ({timeout}s)", sent=True, timed_out=True)
+        except (OSError, ValueError) as e:
+            self.close()
+            raise ShellSessionError(f"sesión interrumpida: {e}", sent=True)
+        self.last_used = time.time()
+        return out.decode("utf-8", errors="replace"), rc
+
+    def ping(self, timeout=HEALTH_CHECK_TIMEOUT):
+        """Comprueba que el shell sigue respondiendo."""
+        try:
+            out, rc = self.run("echo ok", timeout=timeout)
+            return rc == 0 and out.strip() == "ok"
+        except ShellSessionError:
+            return False
+
+
+class ShellPool:
+    """Pool de sesiones de shell por serial con health check y reconexión automática."""
+
+    def __init__(self, client_factory=get_adb_client, health_check_idle=HEALTH_CHECK_IDLE):
+        self.client_factory = client_factory
+        self.health_check_idle = health_check_idle
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def session(self, serial):
+        with self.lock:
+            s = self.sessions.get(serial)
+            if s is None:
+                s = ShellSession(serial, self.client_factory())
+                self.sessions[serial] = s
+            return s
+
+    def _ensure_open(self, s):
+        if not s.connected:
+            s.open()
+        elif time.time() - s.last_used > self.health_check_idle and not s.ping():
+            s.open()
+
+    def run(self, serial, command, timeout=None):
+        """
+        Ejecuta `command` en la sesión del dispositivo. Devuelve (stdout, stderr, rc).
+        Si la sesión estaba caída se reconecta; si la escritura falla antes de
+        llegar al dispositivo se reintenta una vez con una sesión nueva; si se
+        rompe con el comando ya enviado se devuelve INTERRUPTED_RC sin
+        reintentar.
+        """
+        s = self.session(serial)
+        with s.lock:
+            for attempt in (1, 2):
+                self._ensure_open(s)
+                try:
+                    out, rc = s.run(command, timeout=timeout)
+                    return out, "", rc
+                except ShellSessionError as e:
+                    if e.timed_out:
+                        return "", f"error: {e}", TIMEOUT_RC
+                    if e.sent:
+                        # el comando pudo ejecutarse: repetirlo podría duplicar su efecto
+                        return "", f"error: {e}", INTERRUPTED_RC
+                    if attempt == 2:
+                        return "", f"error: {e}", 255
+
+    def close(self, serial):
+        with self.lock:
+            s = self.sessions.pop(serial, None)
+        if s is not None:
+            with s.lock:
+                s.close()
+
+    def abort(self, serial):
+        """Como close() pero sin esperar a que termine el comando en curso (lo usa el watchdog)."""
+        with self.lock:
+            s = self.sessions.pop(serial, None)
+        if s is not None:
+            s.abort()
+
+    def close_all(self):
+        with self.lock:
+            serials = list(self.sessions)
+        for serial in serials:
+            self.close(serial)
+
+
+_pool = ShellPool()
+
+def get_shell_pool():
+    return _pool
+
+def _run_shell_once(serial, command, timeout):
+    # ADB_PATH y USE_ADB_SERVER se leen en cada llamada: pueden cambiarse en caliente
+    if adb_utils.USE_ADB_SERVER:
+        try:
+            return _pool.run(serial, command, timeout=timeout)
+        except ConnectionRefusedError:
+            pass  # servidor no levantado -> binario adb
+        except AdbError as e:
+            return "", f"error: {e}", 1
+        except OSError as e:
+            return "", f"error: {e}", 255
+    return run_adb_cmd_raw([adb_utils.ADB_PATH, "-s", serial, "shell", command], timeout=timeout)
+
+def run_shell(serial, command, timeout=None, policy=None):
+    """
+    Ejecuta un comando de shell en el dispositivo reutilizando su sesión
+    persistente. Si el servidor ADB no está disponible usa `adb shell`.
+    Devuelve un adb_utils.AdbResult; los errores de transporte se reintentan
+    según `policy` (por defecto adb_utils.DEFAULT_RETRY_POLICY). Un comando
+    mal formado (comillas sin cerrar) falla sin enviarse, con rc SYNTAX_ERROR_RC.
+    Por la sesión el stderr del comando llega mezclado en stdout (result.stderr
+    solo trae los errores "error: ..." de transporte); con `adb shell` llega
+    aparte. Quien busque el mensaje de un fallo debe mirar los dos.
+    """
+    error = parse_error(command)
+    if error:
+        # única validación del comando: ni se envía ni se reintenta, fallaría igual
+        return AdbResult("", f"error: comando inválido ({error}): {command}", SYNTAX_ERROR_RC, 0.0, 1)
+    policy = policy or DEFAULT_RETRY_POLICY
+    if timeout is not None:
+        policy = policy.with_timeout(timeout)
+    return policy.run(lambda t: _run_shell_once(serial, command, t))
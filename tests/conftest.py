@@ -0,0 +1,62 @@
+# tests/conftest.py
+# Los módulos del proyecto están en la raíz del repo (sin paquete): se añade al path.
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shell_pool import ShellSession  # noqa: E402
+
+SH = shutil.which("sh")
+
+
+class LocalShClient:
+    """Cliente ADB falso: cada exec:sh es un `sh` local por un socketpair."""
+
+    def __init__(self, broken_first=False):
+        self.broken_first = broken_first
+        self.opened = 0
+        self.procs = []
+
+    def open_service(self, serial, service):
+        self.opened += 1
+        ours, theirs = socket.socketpair()
+        if self.broken_first and self.opened == 1:
+            theirs.close()  # el otro extremo ya no está: la escritura falla
+            return ours
+        self.procs.append(subprocess.Popen([SH], stdin=theirs, stdout=theirs, stderr=subprocess.DEVNULL))
+        theirs.close()
+        return ours
+
+    def kill(self):
+        for proc in self.procs:
+            proc.kill()
+            proc.wait()
+
+
+@pytest.fixture
+def local_sh():
+    """Fábrica de LocalShClient; al terminar el test mata los `sh` que abrieron."""
+    if SH is None:
+        pytest.skip("no hay sh")
+    clients = []
+
+    def make(**kwargs):
+        clients.append(LocalShClient(**kwargs))
+        return clients[-1]
+    yield make
+    for client in clients:
+        client.kill()
+
+
+@pytest.fixture
+def local_session(local_sh):
+    """ShellSession abierta sobre un `sh` local (hace de exec:sh del dispositivo)."""
+    session = ShellSession("local", client=local_sh())
+    session.open()
+    yield session
+    session.close()
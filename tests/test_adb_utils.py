@@ -0,0 +1,74 @@
+# tests/test_adb_utils.py
+# Resultados de run_adb_command y métodos de dump de UI de read_ui_xml (sin adb real).
+import adb_utils
+import shell_pool
+from adb_utils import SYNTAX_ERROR_RC, run_adb_command
+
+
+def no_adb(*args, **kwargs):
+    raise AssertionError("no debería llamar a adb")
+
+
+def test_malformed_command_matches_run_shell(monkeypatch):
+    monkeypatch.setattr(adb_utils, "run_adb", no_adb)
+    res = run_adb_command("x", "shell echo 'abc")
+    assert res == shell_pool.run_shell("x", "echo 'abc")._replace(stderr=res.stderr)
+    assert (res.rc, res.attempts) == (SYNTAX_ERROR_RC, 1)
+    assert res.stderr.startswith("error: comando inválido (")
+
+
+XML = '<?xml version="1.0"?><hierarchy rotation="0"><node text="x"/></hierarchy>'
+
+
+class FakeDump:
+    """run_adb_cmd_raw falso: anota qué método de dump se intentó y solo `working` devuelve XML."""
+
+    def __init__(self, working):
+        self.working = set(working)
+        self.calls = []
+
+    def __call__(self, cmd, timeout=None):
+        method = "tty" if "exec-out" in cmd else cmd[-1].split()[2]
+        self.calls.append(method)
+        if method in self.working:
+            return f"UI hierchary dumped to: /dev/tty\n{XML}\n", "", 0
+        return "", "ERROR: null root node returned by UiTestAutomationBridge.", 1
+
+
+def test_read_ui_xml_remembers_the_working_method(monkeypatch):
+    monkeypatch.setattr(adb_utils, "_ui_dump_method", {})
+    fake = FakeDump(["/sdcard/ui.xml"])
+    monkeypatch.setattr(adb_utils, "run_adb_cmd_raw", fake)
+    assert adb_utils.read_ui_xml("dev") == XML
+    assert fake.calls == ["tty", "/sdcard/ui.xml"]
+    # el método que funcionó se prueba primero (y solo él)
+    fake.calls.clear()
+    assert adb_utils.read_ui_xml("dev") == XML
+    assert fake.calls == ["/sdcard/ui.xml"]
+    # otro dispositivo empieza de cero
+    fake.calls.clear()
+    fake.working = {"/data/local/tmp/ui.xml"}
+    assert adb_utils.read_ui_xml("other") == XML
+    assert fake.calls == ["tty", "/sdcard/ui.xml", "/data/local/tmp/ui.xml"]
+
+
+def test_read_ui_xml_rescans_once_after_a_failure(monkeypatch):
+    monkeypatch.setattr(adb_utils, "_ui_dump_method", {"dev": "/sdcard/ui.xml"})
+    fake = FakeDump(["tty"])
+    monkeypatch.setattr(adb_utils, "run_adb_cmd_raw", fake)
+    assert adb_utils.read_ui_xml("dev") == XML
+    # el recordado falla: se recorren los demás desde "tty", sin repetir el que falló
+    assert fake.calls == ["/sdcard/ui.xml", "tty"]
+    assert adb_utils._ui_dump_method["dev"] == "tty"
+
+    fake.calls.clear()
+    fake.working = set()
+    logs = []
+    assert adb_utils.read_ui_xml("dev", logs.append) is None
+    assert fake.calls == list(adb_utils.UI_DUMP_METHODS)
+    assert "dev" not in adb_utils._ui_dump_method
+    assert "No se pudo extraer" in logs[-1]
+    # sin método recordado: un solo recorrido por llamada
+    fake.calls.clear()
+    assert adb_utils.read_ui_xml("dev") is None
+    assert fake.calls == list(adb_utils.UI_DUMP_METHODS)
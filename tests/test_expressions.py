@@ -0,0 +1,177 @@
+# tests/test_expressions.py
+# El motor de expresiones tiene que dar lo mismo que el ejecutor original
+# (sustitución textual de ${var} + eval); aquí ese original es la referencia.
+import random
+import re
+import warnings
+import pytest
+from expressions import eval_expression, eval_condition
+
+_MATH = r'^[\d\s\+\-\*\/\(\)\.\%\<\>\=\!\&\\|]+$'
+
+
+def old_eval_expression(expr, vars_store):
+    """eval_expression del script_executor original."""
+    if isinstance(expr, (int, float, bool)):
+        return expr
+    if isinstance(expr, str):
+        for var_name, var_value in vars_store.items():
+            expr = expr.replace(f"${{{var_name}}}", str(var_value))
+        try:
+            if re.match(_MATH, expr):
+                return eval(expr, {"__builtins__": None}, {})
+        except Exception:
+            pass
+        return expr
+    return expr
+
+
+def old_eval_condition(condition, vars_store):
+    """eval_condition del script_executor original."""
+    if isinstance(condition, bool):
+        return condition
+    if isinstance(condition, str):
+        for var_name, var_value in vars_store.items():
+            condition = condition.replace(f"${{{var_name}}}", str(var_value))
+        try:
+            return eval(condition, {"__builtins__": None}, {})
+        except Exception:
+            if "==" in condition:
+                parts = condition.split("==", 1)
+                return str(parts[0]).strip() == str(parts[1]).strip()
+            elif "!=" in condition:
+                parts = condition.split("!=", 1)
+                return str(parts[0]).strip() != str(parts[1]).strip()
+            elif " contains " in condition:
+                parts = condition.split(" contains ", 1)
+                return str(parts[1]).strip() in str(parts[0]).strip()
+            return False
+    return False
+
+
+def same(a, b):
+    return type(a) is type(b) and (a == b or (a != a and b != b))
+
+
+VARS = {"n": 5, "neg": -3, "f": 2.5, "big": 1e20, "code": "0123", "s": "hello world", "x": "0123",
+        "num": "5", "t": True, "sp": " 7 ", "empty": ""}
+
+EXPRESSIONS = [
+    # (fuente, resultado esperado)
+    ("0123", "0123"),                # entero con ceros a la izquierda: texto (PIN, teléfono)
+    ("${code}", "0123"),
+    ("007", "007"),
+    ("00", 0),
+    ("0", 0),
+    ("01.5", 1.5),
+    ("${n}${n}", 55),                # concatenación textual y luego cálculo
+    ("${n} * 2 + 1", 11),
+    ("${neg}**2", -9),               # "-3**2" como en Python
+    ("2**${neg}", 0.125),
+    ("${f} * 2", 5.0),
+    ("${big} * 2", "1e+20 * 2"),    # str(1e20) no es "matemático"
+    ("6 & 3", 2),
+    ("6 | 3", 7),
+    ("1 << 4", 16),
+    ("7 // 2", 3),
+    ("7 % 4", 3),
+    ("1 / 0", "1 / 0"),
+    ("5 == 5", True),
+    ("1 < 2 < 3", True),
+    ("()", ()),
+    ("   ", "   "),
+    ("hola ${s}", "hola hello world"),
+    ("${missing} + 1", "${missing} + 1"),
+    ("${t}", "True"),
+    ("${num} + 1", 6),
+    ("${sp}", 7),
+    (" 1 + 2", 3),
+    ("1 2", "1 2"),
+    ("1..2", "1..2"),
+    (7, 7),
+    (None, None),
+]
+
+CONDITIONS = [
+    ("${x} == 123", False),          # "0123 == 123" no se analiza -> comparación de texto
+    ("${x} == 0123", True),
+    ("${n} == \"5\"", False),
+    ("${n} == 5", True),
+    ("${s} contains \"world\"", False),  # las comillas quedan en el texto comparado
+    ("${s} contains world", True),
+    ("1 == 1 and foo == foo", False),
+    ("5 in [5]", True),
+    ("${n} in [4, 5]", True),
+    ("${n} not in (1, 2)", True),
+    ("\"${s}\" == \"hello world\"", True),
+    ("${n} > 3 and ${f} < 3", True),
+    ("${neg} < 0", True),
+    ("not ${t}", False),
+    ("${t}", True),
+    ("${empty} == ", True),
+    ("abc", False),
+    ("bob != alice", True),
+    ("3.5 or None.world", 3.5),
+    ("${n} // 2", 2),
+    ("[1, 2][${n} - 4]", 2),
+    (True, True),
+    (3, False),
+]
+
+
+@pytest.mark.parametrize("source,expected", EXPRESSIONS)
+def test_expression(source, expected):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        old = old_eval_expression(source, VARS)
+    assert same(old, expected), "la tabla no refleja el comportamiento original"
+    assert same(eval_expression(source, VARS), expected)
+
+
+@pytest.mark.parametrize("source,expected", CONDITIONS)
+def test_condition(source, expected):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        old = old_eval_condition(source, VARS)
+    assert same(old, expected), "la tabla no refleja el comportamiento original"
+    assert same(eval_condition(source, VARS), expected)
+
+
+def test_calls_and_attributes_are_not_evaluated():
+    # única diferencia deliberada con el eval original: sin llamadas ni atributos
+    source = "\"${s}\".upper() == \"HELLO WORLD\""
+    assert old_eval_condition(source, VARS) is True
+    assert eval_condition(source, VARS) is False
+    assert eval_condition("().__class__", VARS) is False
+
+
+def test_repeated_evaluation_follows_variable_changes():
+    vars_store = {"i": 0}
+    for i in range(-3, 12):
+        vars_store["i"] = i
+        assert same(eval_expression("${i} * 2", vars_store), old_eval_expression("${i} * 2", vars_store))
+        assert same(eval_condition("${i} < 5", vars_store), old_eval_condition("${i} < 5", vars_store))
+    vars_store["i"] = "09"
+    assert eval_expression("${i} + 1", vars_store) == "09 + 1"
+
+
+_ATOMS = ["${a}", "${b}", "${a}${b}", "0", "00", "0123", "1", "2.", "3.5", ".5", "(", ")", "+", "-", "*",
+          "/", "//", "%", "**", "==", "!=", "<", ">=", "&", "|", "<<", " ", "and", "or", "not", "in",
+          "[5]", "\"5\"", "'abc'", "contains", "foo", "True", "None", "world", "!", "=", ".", "\\"]
+_VALUES = [0, 1, 5, -3, 2.5, -0.5, 1e20, "0123", "5", "abc", "hello world", "1 + 2", " 7 ", True, False, "",
+           None, "-2", 0.1, 1000]
+
+
+def test_matches_original_on_random_inputs():
+    rnd = random.Random(1234)
+    for _ in range(3000):
+        source = "".join(rnd.choice(_ATOMS) + rnd.choice(("", " ")) for _ in range(rnd.randint(1, 6)))
+        vars_store = {k: rnd.choice(_VALUES) for k in "ab" if rnd.random() < 0.8}
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            old_expr = old_eval_expression(source, vars_store)
+            old_cond = old_eval_condition(source, vars_store)
+            new_expr = eval_expression(source, vars_store)
+            new_cond = eval_condition(source, vars_store)
+        assert same(new_expr, old_expr), (source, vars_store)
+        assert same(new_cond, old_cond), (source, vars_store)
@@ -0,0 +1,63 @@
+# tests/test_fleet_launcher.py
+# Detección de procesos caídos en el monitor de ShardedRun.
+import queue
+import threading
+import time
+import fleet_launcher
+from fleet_launcher import MSG_DONE, MSG_LOG, MSG_RESULT, ShardedRun
+
+
+class FakeProcess:
+    def __init__(self, exitcode=None):
+        self.exitcode = exitcode
+
+    def is_alive(self):
+        return self.exitcode is None
+
+
+def test_dead_shard_is_reported_while_others_keep_logging(monkeypatch):
+    monkeypatch.setattr(fleet_launcher, "MONITOR_INTERVAL", 0.05)
+    run = ShardedRun(["dead-0", "live-0"], [{"action": "tap", "x": 1, "y": 1}], processes=2)
+    assert run.shards == [["dead-0"], ["live-0"]]
+    run.queue = queue.Queue()
+    live = FakeProcess()
+    run.procs = [FakeProcess(exitcode=-9), live]
+    reported = {}
+    start = time.monotonic()
+    run.result_cb = lambda summary: reported.setdefault(summary["serial"], (time.monotonic() - start, summary))
+
+    def shard_1():
+        # el proceso vivo manda un log cada 0.01s (la cola nunca se queda vacía un MONITOR_INTERVAL)
+        while time.monotonic() - start < 1.0:
+            run.queue.put((MSG_LOG, 1, "log"))
+            time.sleep(0.01)
+        run.queue.put((MSG_RESULT, 1, {"serial": "live-0", "executed": 1}))
+        run.queue.put((MSG_DONE, 1, None))
+        live.exitcode = 0
+
+    feeder = threading.Thread(target=shard_1)
+    feeder.start()
+    run._monitor_loop()
+    feeder.join()
+    elapsed, summary = reported["dead-0"]
+    assert elapsed < 0.5
+    assert "caído" in summary["error"]
+    assert run.results["live-0"] == {"serial": "live-0", "executed": 1}
+    assert run.finished.is_set()
+
+
+def test_clean_exit_waits_for_its_done_message(monkeypatch):
+    monkeypatch.setattr(fleet_launcher, "MONITOR_INTERVAL", 0.01)
+    run = ShardedRun(["a"], [], processes=1)
+    run.queue = queue.Queue()
+    run.procs = [FakeProcess(exitcode=0)]
+    logs = []
+    # cada log tarda más que MONITOR_INTERVAL: el monitor revisa los procesos entre mensajes
+    run.log_cb = lambda msg: (logs.append(msg), time.sleep(0.02))
+    for _ in range(5):
+        run.queue.put((MSG_LOG, 0, "log"))
+    run.queue.put((MSG_RESULT, 0, {"serial": "a"}))
+    run.queue.put((MSG_DONE, 0, None))
+    run._monitor_loop()
+    assert run.results == {"a": {"serial": "a"}}
+    assert not any("inesperadamente" in m for m in logs)
@@ -0,0 +1,78 @@
+# tests/test_input_batches.py
+# Rachas de pasos de entrada agrupadas en un solo script de shell.
+import shutil
+import subprocess
+import pytest
+from adb_utils import AdbResult
+import script_executor
+from script_compiler import compile_script, input_batches
+from script_executor import BATCH_STATUS_MARKER, plan_input_batch, record_input_batch
+
+SH = shutil.which("sh")
+
+
+def tap(**kw):
+    return dict({"action": "tap", "x": 1, "y": 2}, **kw)
+
+
+def plan(steps, start=0):
+    return plan_input_batch(compile_script(steps), start, lambda expr: expr, lambda msg: None)
+
+
+def test_input_batches():
+    steps = [tap(), tap(), {"action": "sleep"}, tap(), {"action": "text", "text": "a"},
+             {"action": "keyevent", "key": 4, "wait": "${w}"}, {"action": "swipe"}, tap(), tap(wait=True)]
+    # la espera con variable o no numérica corta la racha
+    assert input_batches(steps) == (2, -1, -1, 5, -1, -1, 8, -1, -1)
+    assert input_batches([]) == ()
+
+
+def test_plan_respects_limits(monkeypatch):
+    monkeypatch.setattr(script_executor, "MAX_BATCH_STEPS", 3)
+    batch = plan([tap(wait=0)] * 5)
+    assert (batch.start, batch.end, batch.duration) == (0, 3, 0)
+    monkeypatch.setattr(script_executor, "MAX_BATCH_SECONDS", 1.0)
+    batch = plan([tap(wait=0.4)] * 5)
+    assert (batch.end, batch.duration) == (2, 0.8)
+    monkeypatch.setattr(script_executor, "BATCH_INPUT_STEPS", False)
+    assert plan([tap(), tap()]) is None
+
+
+def test_plan_leaves_adaptive_waits_out():
+    assert plan([tap(wait=1, adaptive_wait=True), tap()]) is None
+    batch = plan([tap(wait=0), tap(wait=0), tap(wait=1, adaptive_wait=True)])
+    assert batch.end == 2
+
+
+def test_plan_script():
+    batch = plan([tap(wait=0.5), {"action": "swipe", "wait": 0}, {"action": "text", "text": "a b", "wait": 0}])
+    assert batch.commands == ("input tap 1 2", None, "input text a%sb")
+    assert batch.actions == ("tap", "swipe", "text")
+    assert batch.script.splitlines() == [
+        f'input tap 1 2; echo "{BATCH_STATUS_MARKER} 0 $?"',
+        "sleep 0.5",
+        f'input text a%sb; echo "{BATCH_STATUS_MARKER} 2 $?"',
+    ]
+
+
+@pytest.mark.skipif(SH is None, reason="no hay sh")
+def test_script_status_per_step():
+    batch = plan([tap(x=0, wait=0), tap(wait=0), tap(x=0, wait=0)], start=0)
+    # `input` falso: falla con las x a 0
+    fake_input = 'input() { [ "$2" != 0 ]; }\n'
+    out = subprocess.run([SH, "-c", fake_input + batch.script], capture_output=True, text=True, timeout=10).stdout
+    stats = {"executed": 0, "failed": 0}
+    calls = []
+    status = record_input_batch("dev", batch, AdbResult(out, "", 0, 0.0, 1), stats,
+                                lambda serial, i, action, ok: calls.append((i, ok)), lambda msg: None)
+    assert status == {0: 1, 1: 0, 2: 1}
+    assert stats == {"executed": 3, "failed": 2}
+    assert calls == [(0, False), (1, True), (2, False)]
+
+
+def test_missing_status_counts_as_failed():
+    batch = plan([tap(wait=0), tap(wait=0)])
+    stats = {"executed": 0, "failed": 0}
+    out = f"{BATCH_STATUS_MARKER} 0 0\n"  # el script se cortó antes del segundo
+    record_input_batch("dev", batch, AdbResult(out, "error: timeout", 124, 0.0, 1), stats, None, lambda msg: None)
+    assert stats == {"executed": 2, "failed": 1}
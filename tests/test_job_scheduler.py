@@ -0,0 +1,57 @@
+# tests/test_job_scheduler.py
+import threading
+import time
+from job_scheduler import JobScheduler, DONE, FAILED
+from watchdog import HealthRegistry
+
+
+def wait_until(predicate, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def live_threads(scheduler):
+    return sum(t.is_alive() and getattr(t, "_target", None) == scheduler._worker_loop
+               for t in threading.enumerate())
+
+
+def test_runner_without_result_is_failed():
+    # execute_script_for_device devuelve None si el script no se puede ejecutar
+    runner = lambda serial, script, **kw: None if serial == "dev-bad" else {"executed": 0}
+    scheduler = JobScheduler(max_workers=1, runner=runner, health=HealthRegistry())
+    ok = scheduler.submit("dev-ok", {"steps": []})
+    job = scheduler.submit("dev-bad", "no es un script")
+    assert wait_until(lambda: ok.done and job.done)
+    assert ok.status == DONE
+    assert job.status == FAILED and job.error
+    scheduler.shutdown()
+
+
+def test_shrinking_and_growing_keeps_worker_count():
+    scheduler = JobScheduler(max_workers=4, runner=lambda serial, script, **kw: {}, health=HealthRegistry())
+    with scheduler._cond:
+        scheduler._spawn_workers()
+    assert wait_until(lambda: live_threads(scheduler) == 4)
+    scheduler.set_limits(max_workers=1)
+    assert wait_until(lambda: live_threads(scheduler) == 1)
+    # crecer justo después de reducir: no quedan menos hilos de los pedidos
+    scheduler.set_limits(max_workers=2)
+    scheduler.set_limits(max_workers=3)
+    assert wait_until(lambda: live_threads(scheduler) == 3)
+    assert scheduler._live_workers == 3
+
+    release = threading.Event()
+    running = []
+    scheduler.runner = lambda serial, script, **kw: (running.append(serial), release.wait(5), {})[-1]
+    jobs = [scheduler.submit(f"dev-{i}", {}) for i in range(6)]
+    assert wait_until(lambda: len(running) == 3)
+    time.sleep(0.05)
+    assert len(running) == 3
+    release.set()
+    assert wait_until(lambda: all(j.status == DONE for j in jobs))
+    scheduler.shutdown()
+    assert wait_until(lambda: live_threads(scheduler) == 0)
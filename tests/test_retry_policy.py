@@ -0,0 +1,56 @@
+# tests/test_retry_policy.py
+# Qué se reintenta: solo los fallos de transporte en los que el comando no
+# llegó a ejecutarse.
+import pytest
+from adb_utils import (RetryPolicy, TIMEOUT_RC, SYNTAX_ERROR_RC, INTERRUPTED_RC)
+from shell_pool import ShellPool
+
+
+@pytest.mark.parametrize("stderr,rc,expected", [
+    ("", 0, False),
+    ("error: device offline", 1, True),
+    ("error: [Errno 104] Connection reset by peer", 255, True),
+    ("error: [Errno 32] Broken pipe", 255, True),
+    ("error: sesión cerrada", 255, True),
+    ("error: no se pudo escribir en la sesión: [Errno 9] Bad file descriptor", 255, True),
+    ("error: timeout (5s)", TIMEOUT_RC, False),
+    ("error: sesión interrumpida: el dispositivo cerró la sesión", INTERRUPTED_RC, False),
+    ("error: sesión interrumpida: [Errno 104] Connection reset by peer", INTERRUPTED_RC, False),
+    ("error: comando inválido (No closing quotation): echo 'a", SYNTAX_ERROR_RC, False),
+    ("/system/bin/sh: foo: not found", 127, False),
+    ("", 1, False),
+])
+def test_is_transient(stderr, rc, expected):
+    assert RetryPolicy().is_transient(stderr, rc) is expected
+
+
+def test_run_retries_only_transient_errors():
+    policy = RetryPolicy(attempts=3, backoff=0.0)
+    results = iter([("", "error: device offline", 1), ("", "error: device offline", 1), ("ok", "", 0)])
+    result = policy.run(lambda timeout: next(results))
+    assert (result.stdout, result.rc, result.attempts) == ("ok", 0, 3)
+    results = iter([("", "error: sesión interrumpida: x", INTERRUPTED_RC), ("ok", "", 0)])
+    result = policy.run(lambda timeout: next(results))
+    assert (result.rc, result.attempts) == (INTERRUPTED_RC, 1)
+
+
+def test_session_broken_after_send_is_not_repeated(local_sh, tmp_path):
+    client = local_sh()
+    pool = ShellPool(client_factory=lambda: client)
+    log = tmp_path / "runs"
+    # el comando se ejecuta y a continuación mata el sh de la sesión
+    command = f"echo x >> {log}; kill -9 $PPID"
+    result = RetryPolicy(attempts=3, backoff=0.0).run(lambda timeout: pool.run("dev", command, timeout=5))
+    assert result.rc == INTERRUPTED_RC
+    assert result.attempts == 1
+    assert log.read_text() == "x\n"
+    assert client.opened == 1
+    pool.close_all()
+
+
+def test_write_failure_is_retried_with_a_new_session(local_sh):
+    client = local_sh(broken_first=True)
+    pool = ShellPool(client_factory=lambda: client)
+    assert pool.run("dev", "echo hola", timeout=5) == ("hola\n", "", 0)
+    assert client.opened == 2
+    pool.close_all()
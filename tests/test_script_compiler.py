@@ -0,0 +1,120 @@
+# tests/test_script_compiler.py
+# Tabla de saltos precalculada y su recorrido con control_flow_next.
+import pytest
+from script_compiler import CompiledProgram, ScriptCompileError, compile_script
+from script_executor import control_flow_next
+
+
+def S(action, **kw):
+    return dict(kw, action=action)
+
+
+def test_if_else_jumps():
+    p = compile_script([S("if", condition="c"), S("tap"), S("else"), S("tap"), S("endif"), S("tap")])
+    assert p.jumps == (3, -1, 5, -1, -1, -1)
+    p = compile_script([S("if", condition="c"), S("tap"), S("endif")])
+    assert p.jumps == (3, -1, -1)
+
+
+def test_nested_loop_jumps():
+    steps = [
+        S("while", condition="a"),    # 0
+        S("while", condition="b"),    # 1
+        S("break"),                   # 2
+        S("continue"),                # 3
+        S("endwhile"),                # 4
+        S("if", condition="c"),       # 5
+        S("continue"),                # 6
+        S("endif"),                   # 7
+        S("break"),                   # 8
+        S("endwhile"),                # 9
+    ]
+    p = compile_script(steps)
+    assert p.jumps == (10, 5, 5, 4, 1, 8, 9, -1, 10, 0)
+    assert p.loops == (-1, -1, 1, 1, 1, -1, 0, -1, 0, 0)
+
+
+def test_compile_is_idempotent_and_copies_steps():
+    steps = [{"action": "tap"}]
+    p = compile_script({"steps": steps})
+    assert isinstance(p, CompiledProgram) and compile_script(p) is p
+    steps[0]["action"] = "swipe"
+    assert p.steps[0]["action"] == "tap"
+
+
+@pytest.mark.parametrize("script,message", [
+    ([S("else")], "'else' sin 'if'"),
+    ([S("if"), S("else"), S("else"), S("endif")], "segundo 'else'"),
+    ([S("endif")], "'endif' sin 'if'"),
+    ([S("while"), S("endif")], "'endif' sin 'if'"),
+    ([S("if"), S("endwhile")], "'endwhile' sin 'while'"),
+    ([S("break")], "fuera de un bucle"),
+    ([S("if"), S("continue"), S("endif")], "fuera de un bucle"),
+    ([S("while")], "'while' sin 'endwhile'"),
+    ([S("if")], "'if' sin 'endif'"),
+    ("tap", "se esperaba una lista"),
+    ({"steps": "tap"}, "debe ser una lista"),
+    ([["tap"]], "se esperaba un objeto JSON"),
+])
+def test_malformed_scripts(script, message):
+    with pytest.raises(ScriptCompileError, match=message):
+        compile_script(script)
+
+
+def run(steps, variables):
+    """Recorre el programa como el ejecutor; devuelve las marcas ("mark") visitadas."""
+    program = compile_script(steps)
+    iterations, visited, idx = {}, [], 0
+    vars_store = dict(variables)
+
+    def eval_condition(condition):
+        return eval(condition, {}, vars_store)
+
+    while idx < len(program.steps):
+        step = program.steps[idx]
+        action = step["action"]
+        if action in ("while", "endwhile", "break", "continue", "if", "else", "endif"):
+            idx = control_flow_next(program, idx, iterations, eval_condition, lambda m: None)
+            continue
+        if action == "mark":
+            visited.append(step["name"] if "name" in step else step["expr"] % vars_store)
+        elif action == "inc":
+            vars_store[step["var"]] += 1
+        idx += 1
+    return visited
+
+
+def test_break_and_continue():
+    steps = [
+        S("while", condition="i < 10"),
+        S("inc", var="i"),
+        S("if", condition="i % 2 == 0"),
+        S("continue"),
+        S("endif"),
+        S("if", condition="i > 6"),
+        S("break"),
+        S("else"),
+        S("mark", expr="odd %(i)d"),
+        S("endif"),
+        S("endwhile"),
+        S("mark", name="end"),
+    ]
+    assert run(steps, {"i": 0}) == ["odd 1", "odd 3", "odd 5", "end"]
+
+
+def test_nested_loops_restart_inner_counter():
+    steps = [
+        S("while", condition="i < 2"),
+        S("inc", var="i"),
+        S("while", condition="True", max_iterations=3),
+        S("mark", name="inner"),
+        S("endwhile"),
+        S("endwhile"),
+    ]
+    # el bucle interno se corta en max_iterations cada vez que se entra en él
+    assert run(steps, {"i": 0}) == ["inner"] * 6
+
+
+def test_max_iterations():
+    steps = [S("while", condition="True", max_iterations=4), S("mark", name="x"), S("endwhile")]
+    assert run(steps, {}) == ["x"] * 4
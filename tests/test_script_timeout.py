@@ -0,0 +1,42 @@
+# tests/test_script_timeout.py
+# Con el plazo del script agotado no se lanza la acción con timeout 0: el
+# script termina por su plazo y el dispositivo no queda marcado.
+import asyncio
+import time
+import pytest
+import async_executor
+import script_executor
+from script_executor import ScriptTimeout, step_limit
+from watchdog import get_health_registry
+
+SCRIPT = [{"action": "tap", "x": 1, "y": 2, "wait": 0}]
+
+
+def test_step_limit():
+    assert step_limit(5.0, None) == 5.0
+    assert step_limit(5.0, time.time() + 60) == 5.0
+    assert 0 < step_limit(5.0, time.time() + 1) <= 1
+    with pytest.raises(ScriptTimeout):
+        step_limit(5.0, time.time() - 1)
+    with pytest.raises(ScriptTimeout):
+        step_limit(5.0, time.time() + script_executor.MIN_ACTION_TIME / 2)
+
+
+def no_shell(*args, **kwargs):
+    raise AssertionError("la acción no debería lanzarse sin plazo")
+
+
+def test_sync_executor_ends_by_script_timeout(monkeypatch):
+    monkeypatch.setattr(script_executor, "MIN_ACTION_TIME", 60)
+    monkeypatch.setattr(script_executor, "run_shell", no_shell)
+    stats = script_executor.execute_script_for_device("deadline-sync", SCRIPT, script_timeout=30)
+    assert stats["timed_out"] and stats["executed"] == 0
+    assert get_health_registry().is_healthy("deadline-sync")
+
+
+def test_async_executor_ends_by_script_timeout(monkeypatch):
+    monkeypatch.setattr(script_executor, "MIN_ACTION_TIME", 60)
+    monkeypatch.setattr(async_executor, "run_shell_async", no_shell)
+    stats = asyncio.run(async_executor.execute_script_for_device_async("deadline-async", SCRIPT, script_timeout=30))
+    assert stats["timed_out"] and stats["executed"] == 0
+    assert get_health_registry().is_healthy("deadline-async")
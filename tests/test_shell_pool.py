@@ -0,0 +1,120 @@
+# tests/test_shell_pool.py
+# Delimitado de la salida de las sesiones persistentes: contra un sh real (por
+# un socketpair, ver conftest.local_session) y contra el servidor ADB falso de benchmarks/.
+import asyncio
+import threading
+import time
+import pytest
+from adb_client import AdbClient
+from adb_utils import SYNTAX_ERROR_RC
+from benchmarks.device_sim import DeviceProfile
+from benchmarks.fake_server import FakeAdbServer
+from script_compiler import compile_script
+from script_executor import BATCH_STATUS_MARKER, parse_batch_status, plan_input_batch
+import shell_pool
+from shell_pool import ShellPool, ShellSessionError, parse_error, run_shell
+
+@pytest.fixture
+def fake_server():
+    """Servidor ADB falso en un hilo; devuelve (puerto, seriales)."""
+    serials = ["bench-0000", "bench-0001"]
+    server = FakeAdbServer(serials, DeviceProfile(latency=0.0))
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    port = asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    yield port, serials
+
+    async def stop():
+        server.server.close()
+        await server.server.wait_closed()
+    asyncio.run_coroutine_threadsafe(stop(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def test_parse_error():
+    assert parse_error("input tap 1 2") is None
+    assert parse_error("input text 'don'\"'\"'t'") is None
+    assert parse_error("input text don't")
+    assert parse_error('echo "abc')
+
+
+def test_session_output_and_rc(local_session):
+    assert local_session.run("echo hola", timeout=5) == ("hola\n", 0)
+    assert local_session.run("printf sin-salto; exit 3", timeout=5) == ("sin-salto", 3)
+    assert local_session.run("echo a >&2", timeout=5) == ("a\n", 0)
+    assert local_session.run("echo uno\necho dos", timeout=5) == ("uno\ndos\n", 0)
+    # el stdin del comando no es la sesión: no se come el siguiente
+    assert local_session.run("cat", timeout=5) == ("", 0)
+    assert local_session.run("echo 'it'\"'\"'s'", timeout=5) == ("it's\n", 0)
+
+
+def test_timeout_covers_the_whole_command(local_session):
+    # escribe más a menudo que el timeout: aun así tiene que vencer
+    start = time.monotonic()
+    with pytest.raises(ShellSessionError) as excinfo:
+        local_session.run("while :; do echo x; sleep 0.05; done", timeout=0.5)
+    assert excinfo.value.timed_out and excinfo.value.sent
+    assert time.monotonic() - start < 2
+    assert not local_session.connected
+
+
+def test_unbalanced_quote_does_not_wedge_the_session(local_session):
+    # va entrecomillado para sh -c: falla ese comando y sh no se queda esperando la comilla
+    out, rc = local_session.run("input text don't", timeout=5)
+    assert rc != 0
+    assert local_session.connected
+    assert local_session.run("echo sigue", timeout=5) == ("sigue\n", 0)
+
+
+def test_sh_syntax_error_fails_alone(local_session):
+    # shlex lo acepta pero sh no: falla ese comando y la sesión sigue respondiendo
+    out, rc = local_session.run("if true; then echo x", timeout=5)
+    assert rc != 0
+    out, rc = local_session.run("echo $(", timeout=5)
+    assert rc != 0
+    assert local_session.run("echo sigue", timeout=5) == ("sigue\n", 0)
+
+
+def test_run_shell_rejects_malformed_command_without_connecting(monkeypatch):
+    def no_send(*args, **kwargs):
+        raise AssertionError("no debería enviarse")
+    monkeypatch.setattr(shell_pool, "_run_shell_once", no_send)
+    res = run_shell("x", 'echo "abc')
+    assert res.rc == SYNTAX_ERROR_RC
+    assert res.attempts == 1
+    assert "comando inválido" in res.stderr
+
+
+def test_pool_against_fake_server(fake_server):
+    port, serials = fake_server
+    pool = ShellPool(client_factory=lambda: AdbClient("127.0.0.1", port))
+    try:
+        for serial in serials:
+            assert pool.run(serial, "echo ok", timeout=5) == ("ok\n", "", 0)
+            assert pool.run(serial, "input tap 10 20", timeout=5)[2] == 0
+        batch = (f'input tap 1 2; echo "{BATCH_STATUS_MARKER} 0 $?"\nsleep 0\n'
+                 f"input text 'a b'; echo \"{BATCH_STATUS_MARKER} 1 $?\"")
+        out, err, rc = pool.run(serials[0], batch, timeout=5)
+        assert rc == 0
+        assert parse_batch_status(out) == {0: 0, 1: 0}
+        # la misma sesión sigue sirviendo tras todo lo anterior
+        assert pool.run(serials[0], "echo fin", timeout=5) == ("fin\n", "", 0)
+        assert len(pool.sessions) == len(serials)
+    finally:
+        pool.close_all()
+
+
+def test_malformed_command_is_left_out_of_input_batch():
+    program = compile_script([
+        {"action": "tap", "x": 1, "y": 2},
+        {"action": "tap", "x": 3, "y": 4},
+        {"action": "text", "text": "don't"},
+        {"action": "tap", "x": 5, "y": 6},
+    ])
+    eval_expression = lambda expr: expr
+    batch = plan_input_batch(program, 0, eval_expression, lambda msg: None)
+    assert (batch.start, batch.end) == (0, 2)
+    assert plan_input_batch(program, 2, eval_expression, lambda msg: None) is None
@@ -0,0 +1,95 @@
+# tests/test_ui_snapshot.py
+# Vigencia del snapshot de UI compartido por las acciones uia_*.
+import time
+import pytest
+import adb_utils
+from ui_hierarchy import UiHierarchy, get_snapshot, get_snapshot_cache
+from script_executor import execute_script_for_device, run_uia_step, UIA_CLICK_MAX_AGE
+
+SERIAL = "snap-test"
+
+
+def screen(y):
+    return ('<?xml version="1.0" encoding="UTF-8"?><hierarchy rotation="0">'
+            '<node index="0" text="OK" resource-id="app:id/ok" class="android.widget.Button" package="app" '
+            f'content-desc="" clickable="true" enabled="true" bounds="[0,{y}][100,{y + 100}]"/></hierarchy>')
+
+
+class FakeDevice:
+    def __init__(self, xml):
+        self.xml = xml
+        self.dumps = 0
+        self.clicks = []
+
+    def dump_hierarchy(self):
+        self.dumps += 1
+        return self.xml
+
+    def click(self, x, y):
+        self.clicks.append((x, y))
+
+
+@pytest.fixture(autouse=True)
+def no_adb_dump(monkeypatch):
+    """Sin adb: read_ui_xml no da XML y el dump va por uiautomator2."""
+    get_snapshot_cache().invalidate(SERIAL)
+    monkeypatch.setattr(adb_utils, "read_ui_xml", lambda serial, log_cb=None: None)
+
+
+def test_max_age_forces_a_new_dump():
+    cache = get_snapshot_cache()
+    d = FakeDevice(screen(0))
+    first = cache.get(SERIAL, d.dump_hierarchy)
+    assert cache.get(SERIAL, d.dump_hierarchy) is first
+    first.created -= 1.0
+    assert cache.get(SERIAL, d.dump_hierarchy) is first  # dentro del TTL
+    assert cache.get(SERIAL, d.dump_hierarchy, max_age=0.5) is not first
+    assert d.dumps == 2
+
+
+def test_uia_click_does_not_use_a_stale_snapshot():
+    cache = get_snapshot_cache()
+    old = UiHierarchy(screen(0))
+    old.created = time.time() - UIA_CLICK_MAX_AGE - 0.1
+    cache.put(SERIAL, old)
+    d = FakeDevice(screen(500))  # el botón se movió desde el dump anterior
+    run_uia_step(d, SERIAL, "uia_click", {"resourceId": "app:id/ok"}, {}, lambda e: e, lambda m: None)
+    assert d.dumps == 1
+    assert d.clicks == [(50, 550)]
+
+
+def test_uia_click_reuses_a_fresh_snapshot():
+    get_snapshot_cache().put(SERIAL, UiHierarchy(screen(0)))
+    d = FakeDevice(screen(500))
+    run_uia_step(d, SERIAL, "uia_click", {"resourceId": "app:id/ok"}, {}, lambda e: e, lambda m: None)
+    assert d.dumps == 0
+    assert d.clicks == [(50, 50)]
+
+
+def test_sleep_invalidates_the_snapshot():
+    cache = get_snapshot_cache()
+    cache.put(SERIAL, UiHierarchy(screen(0)))
+    execute_script_for_device(SERIAL, [{"action": "sleep", "seconds": 0}])
+    d = FakeDevice(screen(500))
+    cache.get(SERIAL, d.dump_hierarchy)
+    assert d.dumps == 1
+
+
+def test_snapshot_dumps_through_adb_first(monkeypatch):
+    calls = []
+
+    def read_ui_xml(serial, log_cb=None):
+        calls.append(serial)
+        return screen(300)
+    monkeypatch.setattr(adb_utils, "read_ui_xml", read_ui_xml)
+    d = FakeDevice(screen(0))
+    snap = get_snapshot(SERIAL, d)
+    assert calls == [SERIAL] and d.dumps == 0
+    assert snap.find(resourceId="app:id/ok") is not None
+    assert get_snapshot(SERIAL, d) is snap
+
+
+def test_snapshot_falls_back_to_uiautomator2():
+    d = FakeDevice(screen(0))
+    get_snapshot(SERIAL, d)
+    assert d.dumps == 1
@@ -0,0 +1,125 @@
+# tests/test_visual_editor.py
+# Estructuras del editor visual que no necesitan pantalla.
+import colorsys
+import random
+from visual_editor import (EdgeStore, GridIndex, NO_IN_PORT, NO_OUT_PORT, VisualFlowEditor, block_styles,
+                           lighten_color, rects_intersect)
+
+
+def test_edge_store_indexes():
+    edges = EdgeStore()
+    edges.add(1, 2, "l1")
+    edges.add(2, 3, "l2")
+    edges.add(1, 3, "l3")
+    edges.add(3, 3, "l4")  # conexión de un bloque consigo mismo
+    assert list(edges) == [(1, 2, "l1"), (2, 3, "l2"), (1, 3, "l3"), (3, 3, "l4")]
+    assert len(edges) == 4 and "l2" in edges
+    assert edges.successors(1) == [2, 3]
+    assert edges.in_degree(3) == 3
+    assert sorted(edges.touching(3)) == [(1, 3, "l3"), (2, 3, "l2"), (3, 3, "l4")]
+    assert edges.endpoints("l3") == (1, 3)
+    assert edges.remove("l3") == (1, 3)
+    assert edges.remove("l3") is None
+    assert edges.successors(1) == [2]
+    assert sorted(edges.remove_node(3)) == ["l2", "l4"]
+    assert list(edges) == [(1, 2, "l1")]
+    assert edges.in_degree(3) == 0 and edges.successors(2) == []
+    assert edges.clear() == ["l1"]
+    assert len(edges) == 0 and edges.touching(1) == []
+
+
+def test_edge_store_matches_edge_list():
+    rnd = random.Random(7)
+    edges, reference = EdgeStore(), []
+    for n in range(2000):
+        if reference and rnd.random() < 0.3:
+            nid = rnd.randrange(10)
+            gone = sorted(lid for a, b, lid in reference if nid in (a, b))
+            assert sorted(edges.remove_node(nid)) == gone
+            reference = [e for e in reference if nid not in e[:2]]
+        elif reference and rnd.random() < 0.3:
+            edge = rnd.choice(reference)
+            reference.remove(edge)
+            assert edges.remove(edge[2]) == edge[:2]
+        else:
+            edge = (rnd.randrange(10), rnd.randrange(10), n)
+            reference.append(edge)
+            edges.add(*edge)
+        assert list(edges) == reference
+        nid = rnd.randrange(10)
+        assert sorted(edges.touching(nid)) == sorted(e for e in reference if nid in e[:2])
+        assert edges.successors(nid) == [b for a, b, _ in reference if a == nid]
+        assert edges.in_degree(nid) == sum(1 for _, b, _ in reference if b == nid)
+
+
+def test_grid_index_matches_linear_scan():
+    rnd = random.Random(11)
+    grid, rects, order = GridIndex(cell=50), {}, []
+    for n in range(1500):
+        key = rnd.randrange(60)
+        if key in rects and rnd.random() < 0.3:
+            grid.remove(key)
+            del rects[key]
+            order.remove(key)
+        else:
+            x, y = rnd.uniform(-300, 600), rnd.uniform(-300, 600)
+            # esquinas en cualquier orden
+            rect = (x, y, x + rnd.uniform(-120, 120), y + rnd.uniform(-120, 120))
+            grid.insert(key, rect)
+            if key not in rects:
+                order.append(key)
+            rects[key] = (min(rect[0], rect[2]), min(rect[1], rect[3]), max(rect[0], rect[2]), max(rect[1], rect[3]))
+        assert len(grid) == len(rects)
+        px, py = rnd.uniform(-400, 700), rnd.uniform(-400, 700)
+        hits = [k for k in order if rects_intersect(rects[k], (px, py, px, py))]
+        assert grid.at(px, py) == (hits[-1] if hits else None)
+        q = (px, py, px + rnd.uniform(-500, 500), py + rnd.uniform(-500, 500))
+        box = (min(q[0], q[2]), min(q[1], q[3]), max(q[0], q[2]), max(q[1], q[3]))
+        assert grid.query(*q) == [k for k in order if rects_intersect(rects[k], box)]
+    # una consulta enorme (zoom lejano) recorre solo las celdas ocupadas
+    assert grid.query(-1e9, -1e9, 1e9, 1e9) == order
+
+
+def test_grid_index_keeps_stacking_order_when_moving():
+    grid = GridIndex(cell=100)
+    grid.insert("a", (0, 0, 50, 50))
+    grid.insert("b", (0, 0, 50, 50))
+    assert grid.at(10, 10) == "b"
+    grid.insert("a", (400, 400, 450, 450))
+    grid.insert("a", (0, 0, 50, 50))
+    assert grid.at(10, 10) == "b"
+    assert grid.rect("a") == (0, 0, 50, 50)
+    grid.remove("b")
+    assert grid.at(10, 10) == "a" and "b" not in grid
+    grid.clear()
+    assert len(grid) == 0 and grid.at(10, 10) is None
+
+
+def hls(color):
+    return colorsys.rgb_to_hls(*(int(color[i:i + 2], 16) / 255 for i in (1, 3, 5)))
+
+
+def test_lighten_color():
+    for item in VisualFlowEditor.PALETTE:
+        color = item["color"]
+        assert lighten_color(color, 0) == color
+        light = lighten_color(color)
+        assert len(light) == 7 and light.startswith("#")
+        h, l, s = hls(color)
+        h2, l2, s2 = hls(light)
+        assert abs(l2 - min(1, l + 0.2)) < 0.01
+        assert abs(h2 - h) < 0.01 or l2 > 0.99
+    assert lighten_color("#3b82f6") == "#98bfff"
+    assert lighten_color("#ffffff") == "#ffffff"
+    assert lighten_color("#808080", 0.5) == "#ffffff"
+    for other in ("red", "#12345", "#zzzzzz", "", None):
+        assert lighten_color(other) == other
+
+
+def test_block_styles():
+    styles = block_styles(VisualFlowEditor.PALETTE)
+    assert set(styles) == {item["type"] for item in VisualFlowEditor.PALETTE}
+    for kind, style in styles.items():
+        assert style["hover"] == lighten_color(style["color"])
+        assert style["out_port"] == (kind not in NO_OUT_PORT)
+        assert style["in_port"] == (kind not in NO_IN_PORT)
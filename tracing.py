@@ -0,0 +1,191 @@
+# tracing.py
+# Traza por paso de las ejecuciones: para cada paso de cada dispositivo guarda
+# inicio/fin, tiempo en I/O adb, en UIA y en esperas deliberadas, y si salió
+# bien. Se exporta como JSON de eventos de Chrome (chrome://tracing, Perfetto:
+# una fila por dispositivo) y como CSV resumido por dispositivo y acción.
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Categorías de tiempo dentro de un paso
+PHASES = ("adb", "uia", "sleep")
+
+
+class StepTrace:
+    __slots__ = ("serial", "step", "action", "label", "start", "end", "ok", "totals", "phases")
+
+    def __init__(self, serial, step, action, start):
+        self.serial = serial
+        self.step = step
+        self.action = action
+        self.label = None
+        self.start = start
+        self.end = None
+        self.ok = None
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.phases = []  # (fase, inicio, fin)
+
+    def phase(self, name):
+        """Context manager que cuenta el tiempo del bloque en la fase `name`."""
+        return _Phase(self, name)
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    @property
+    def other(self):
+        """Tiempo no atribuido a ninguna fase (expresiones, logging, Python)."""
+        return max(0.0, self.duration - sum(self.totals.values()))
+
+
+class _Phase:
+    __slots__ = ("trace", "name", "t0")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter()
+        self.trace.totals[self.name] += t1 - self.t0
+        self.trace.phases.append((self.name, self.t0, t1))
+        return False
+
+
+class Tracer:
+    """Acumula StepTrace de cualquier número de hilos/dispositivos."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.wall0 = time.time()
+        self.steps = []
+        self._lanes = {}
+        self._lock = threading.Lock()
+
+    def begin_step(self, serial, step, action):
+        return StepTrace(serial, step, action, time.perf_counter())
+
+    def end_step(self, trace, ok):
+        trace.end = time.perf_counter()
+        trace.ok = bool(ok)
+        with self._lock:
+            self.steps.append(trace)
+            if trace.serial not in self._lanes:
+                self._lanes[trace.serial] = len(self._lanes) + 1
+
+    def clear(self):
+        with self._lock:
+            self.steps = []
+            self._lanes = {}
+        self.t0 = time.perf_counter()
+        self.wall0 = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.steps), dict(self._lanes)
+
+    # -------------------------
+    # exportación
+    # -------------------------
+    def _us(self, t):
+        return round((t - self.t0) * 1e6, 1)
+
+    def chrome_trace(self):
+        """Dict {"traceEvents": [...]} en el formato de Chrome trace-event."""
+        steps, lanes = self.snapshot()
+        pid = os.getpid()
+        events = [{"ph": "M", "name": "process_name", "pid": pid, "tid": 0, "args": {"name": "Granja de Bots"}}]
+        for serial, tid in lanes.items():
+            events.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": serial}})
+        for st in steps:
+            tid = lanes[st.serial]
+            args = {"step": st.step + 1, "ok": st.ok}
+            args.update({f"{k}_ms": round(v * 1000, 3) for k, v in st.totals.items()})
+            if st.label:
+                args["label"] = st.label
+            events.append({"ph": "X", "name": st.action or "?", "cat": "step", "pid": pid, "tid": tid,
+                           "ts": self._us(st.start), "dur": round((st.end - st.start) * 1e6, 1), "args": args})
+            for name, a, b in st.phases:
+                events.append({"ph": "X", "name": name, "cat": name, "pid": pid, "tid": tid,
+                               "ts": self._us(a), "dur": round((b - a) * 1e6, 1)})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"start": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.wall0))}}
+
+    def export_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self):
+        """Filas agregadas por (dispositivo, acción), las de más tiempo total primero."""
+        steps, _ = self.snapshot()
+        rows = {}
+        for st in steps:
+            key = (st.serial, st.action)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = {"serial": st.serial, "action": st.action, "count": 0, "failed": 0,
+                                   "total_s": 0.0, "max_s": 0.0, "adb_s": 0.0, "uia_s": 0.0,
+                                   "sleep_s": 0.0, "other_s": 0.0}
+            d = st.duration
+            row["count"] += 1
+            row["failed"] += 0 if st.ok else 1
+            row["total_s"] += d
+            row["max_s"] = max(row["max_s"], d)
+            for k in PHASES:
+                row[f"{k}_s"] += st.totals[k]
+            row["other_s"] += st.other
+        result = sorted(rows.values(), key=lambda r: -r["total_s"])
+        for row in result:
+            row["mean_s"] = row["total_s"] / row["count"]
+        return result
+
+    def export_csv(self, path):
+        fields = ["serial", "action", "count", "failed", "total_s", "mean_s", "max_s",
+                  "adb_s", "uia_s", "sleep_s", "other_s"]
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for row in self.summary():
+                writer.writerow({k: (round(v, 4) if isinstance(v, float) else v) for k, v in row.items()})
+
+
+class _NullTrace:
+    """StepTrace que no mide nada (trazas desactivadas)."""
+    __slots__ = ("label", "action")
+
+    def phase(self, name):
+        return nullcontext()
+
+
+class NullTracer:
+    def begin_step(self, serial, step, action):
+        return _NullTrace()
+
+    def end_step(self, trace, ok):
+        pass
+
+
+NULL_TRACER = NullTracer()
+_active = None
+
+def start_tracing():
+    """Activa (o reinicia) la traza global que usan los ejecutores si no reciben una."""
+    global _active
+    _active = Tracer()
+    return _active
+
+def stop_tracing():
+    """Desactiva la traza global y la devuelve (para exportarla)."""
+    global _active
+    tracer, _active = _active, None
+    return tracer
+
+def active_tracer():
+    return _active if _active is not None else NULL_TRACER
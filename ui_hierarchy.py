@@ -0,0 +1,342 @@
+# ui_hierarchy.py
+# Snapshots de la jerarquía de UI por dispositivo.
+# El XML de `uiautomator dump` se parsea en streaming (expat, sin construir un
+# DOM) a una tabla compacta de nodos: arrays paralelos para bounds, flags y
+# padre, y listas de strings internados para class, package, resource-id,
+# text y content-desc. Índices secundarios por selector permiten que
+# uia_exists/uia_click/uia_text consulten el snapshot con búsquedas en
+# diccionario hasta que una acción de entrada o el TTL lo invalidan.
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from array import array
+from xml.parsers import expat
+import xml.etree.ElementTree as ET
+
+# Segundos que un snapshot sigue siendo válido si no hubo acciones de entrada
+SNAPSHOT_TTL = 2.0
+
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+_NO_BOUNDS = (0, 0, 0, 0)
+
+# Bits del array de flags
+FLAG_CLICKABLE = 1
+FLAG_ENABLED = 2
+FLAG_SCROLLABLE = 4
+FLAG_FOCUSABLE = 8
+FLAG_CHECKED = 16
+FLAG_SELECTED = 32
+_FLAG_ATTRS = (("clickable", FLAG_CLICKABLE), ("enabled", FLAG_ENABLED), ("scrollable", FLAG_SCROLLABLE),
+               ("focusable", FLAG_FOCUSABLE), ("checked", FLAG_CHECKED), ("selected", FLAG_SELECTED))
+
+
+class UiParseError(ValueError):
+    pass
+
+
+def parse_bounds(text):
+    m = _BOUNDS_RE.match(text or "")
+    return tuple(map(int, m.groups())) if m else _NO_BOUNDS
+
+
+class UiNode:
+    """Vista ligera de un nodo: solo guarda la tabla y el índice."""
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    resource_id = property(lambda self: self.tree.resource_ids[self.index])
+    text = property(lambda self: self.tree.texts[self.index])
+    content_desc = property(lambda self: self.tree.descriptions[self.index])
+    class_name = property(lambda self: self.tree.classes[self.index])
+    package = property(lambda self: self.tree.packages[self.index])
+    clickable = property(lambda self: self._flag(FLAG_CLICKABLE))
+    enabled = property(lambda self: self._flag(FLAG_ENABLED))
+    scrollable = property(lambda self: self._flag(FLAG_SCROLLABLE))
+    focusable = property(lambda self: self._flag(FLAG_FOCUSABLE))
+    checked = property(lambda self: self._flag(FLAG_CHECKED))
+    selected = property(lambda self: self._flag(FLAG_SELECTED))
+
+    def _flag(self, bit):
+        return bool(self.tree.flags[self.index] & bit)
+
+    @property
+    def bounds(self):
+        i = self.index * 4
+        return tuple(self.tree.bounds[i:i + 4])
+
+    @property
+    def center(self):
+        x1, y1, x2, y2 = self.bounds
+        return (x1 + x2) // 2, (y1 + y2) // 2
+
+    @property
+    def parent(self):
+        p = self.tree.parents[self.index]
+        return UiNode(self.tree, p) if p >= 0 else None
+
+    def __eq__(self, other):
+        return isinstance(other, UiNode) and other.tree is self.tree and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self):
+        return f"<UiNode {self.class_name} id={self.resource_id!r} text={self.text!r} {self.bounds}>"
+
+
+# nombre del selector (como en uiautomator2) -> índice
+SELECTOR_INDEXES = {
+    "resourceId": "by_resource_id",
+    "text": "by_text",
+    "description": "by_description",
+    "className": "by_class",
+}
+
+
+class ParseStats:
+    __slots__ = ("nodes", "xml_bytes", "parse_ms", "memory_bytes")
+
+    def __init__(self, nodes, xml_bytes, parse_ms, memory_bytes):
+        self.nodes = nodes
+        self.xml_bytes = xml_bytes
+        self.parse_ms = parse_ms
+        self.memory_bytes = memory_bytes
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self):
+        return (f"<ParseStats {self.nodes} nodos, {self.xml_bytes} B xml, "
+                f"{self.parse_ms:.2f} ms, ~{self.memory_bytes} B>")
+
+
+class UiHierarchyBuilder:
+    """
+    Parser incremental: feed(chunk) con trozos del XML según llegan (str o
+    bytes) y close() devuelve la UiHierarchy ya indexada.
+    """
+
+    def __init__(self, tree=None):
+        self.tree = tree if tree is not None else UiHierarchy()
+        self._stack = []
+        self._size = 0
+        self._elapsed = 0.0
+        self._parser = expat.ParserCreate()
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+
+    def _start(self, name, attrib):
+        if name != "node":
+            return
+        t = self.tree
+        idx = len(t.classes)
+        get = attrib.get
+        intern = sys.intern
+        rid = intern(get("resource-id", ""))
+        text = intern(get("text", ""))
+        desc = intern(get("content-desc", ""))
+        cls = intern(get("class", ""))
+        t.resource_ids.append(rid)
+        t.texts.append(text)
+        t.descriptions.append(desc)
+        t.classes.append(cls)
+        t.packages.append(intern(get("package", "")))
+        m = _BOUNDS_RE.match(get("bounds", ""))
+        t.bounds.extend(map(int, m.groups()) if m else _NO_BOUNDS)
+        t.flags.append(sum(bit for attr, bit in _FLAG_ATTRS if get(attr) == "true"))
+        stack = self._stack
+        t.parents.append(stack[-1] if stack else -1)
+        for key, index in ((rid, t.by_resource_id), (text, t.by_text),
+                           (desc, t.by_description), (cls, t.by_class)):
+            if key:
+                found = index.get(key)
+                if found is None:
+                    index[key] = array("i", (idx,))
+                else:
+                    found.append(idx)
+        stack.append(idx)
+
+    def _end(self, name):
+        if name == "node":
+            self._stack.pop()
+
+    def feed(self, chunk, final=False):
+        start = time.perf_counter()
+        self._size += len(chunk)
+        try:
+            self._parser.Parse(chunk, final)
+        except expat.ExpatError as e:
+            raise UiParseError(str(e)) from None
+        self._elapsed += time.perf_counter() - start
+
+    def close(self):
+        self.feed(b"", True)
+        t = self.tree
+        t.stats = ParseStats(len(t), self._size, self._elapsed * 1000.0, t.memory_size())
+        return t
+
+
+class UiHierarchy:
+    """Jerarquía parseada en tabla compacta con índices por selector. Inmutable una vez creada."""
+
+    def __init__(self, xml_text=None):
+        self.resource_ids = []
+        self.texts = []
+        self.descriptions = []
+        self.classes = []
+        self.packages = []
+        self.bounds = array("i")   # 4 enteros por nodo: x1, y1, x2, y2
+        self.flags = array("B")
+        self.parents = array("i")  # -1 en la raíz
+        self.by_resource_id = {}
+        self.by_text = {}
+        self.by_description = {}
+        self.by_class = {}
+        self.stats = None
+        self.created = time.time()
+        if xml_text is not None:
+            builder = UiHierarchyBuilder(self)
+            builder.feed(xml_text)
+            builder.close()
+
+    def __len__(self):
+        return len(self.classes)
+
+    def __iter__(self):
+        return (UiNode(self, i) for i in range(len(self)))
+
+    def node(self, index):
+        return UiNode(self, index)
+
+    @property
+    def nodes(self):
+        return list(self)
+
+    def find_all(self, **selector):
+        """Nodos que cumplen todos los criterios (resourceId, text, description, className)."""
+        result = None
+        for name, value in selector.items():
+            index = getattr(self, SELECTOR_INDEXES[name])
+            matches = index.get(str(value), ())
+            if result is None:
+                result = list(matches)
+            else:
+                ids = set(matches)
+                result = [i for i in result if i in ids]
+            if not result:
+                return []
+        return [UiNode(self, i) for i in result or ()]
+
+    def find(self, **selector):
+        matches = self.find_all(**selector)
+        return matches[0] if matches else None
+
+    def exists(self, **selector):
+        return self.find(**selector) is not None
+
+    def memory_size(self):
+        """Estimación en bytes de la tabla y los índices (cada string internado cuenta una vez)."""
+        size = 0
+        seen = set()
+        for column in (self.resource_ids, self.texts, self.descriptions, self.classes, self.packages):
+            size += sys.getsizeof(column)
+            for s in column:
+                if id(s) not in seen:
+                    seen.add(id(s))
+                    size += sys.getsizeof(s)
+        for arr in (self.bounds, self.flags, self.parents):
+            size += sys.getsizeof(arr)
+        for index in (self.by_resource_id, self.by_text, self.by_description, self.by_class):
+            size += sys.getsizeof(index)
+            size += sum(sys.getsizeof(v) for v in index.values())
+        return size
+
+
+def compare_parsers(xml_text, repeat=5):
+    """
+    Compara el parseo con DOM (ElementTree, el enfoque anterior) contra la
+    tabla compacta: tiempo medio en ms y pico de memoria con tracemalloc.
+    """
+    def measure(parse):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            parse(xml_text)
+        elapsed = (time.perf_counter() - start) * 1000.0 / repeat
+        tracemalloc.start()
+        try:
+            kept = parse(xml_text)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del kept
+        return {"parse_ms": elapsed, "retained_bytes": current, "peak_bytes": peak}
+
+    return {"dom": measure(ET.fromstring), "compact": measure(UiHierarchy)}
+
+
+class SnapshotCache:
+    """Último snapshot por serial; se invalida por TTL o explícitamente tras una acción de entrada."""
+
+    def __init__(self, ttl=SNAPSHOT_TTL):
+        self.ttl = ttl
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def get(self, serial, dump, max_age=None):
+        """
+        Snapshot vigente o uno nuevo obtenido con dump() -> xml. `max_age`
+        acorta el TTL para quien necesita una pantalla más reciente.
+        """
+        ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        with self._lock:
+            snap = self._snapshots.get(serial)
+        if snap is not None and time.time() - snap.created <= ttl:
+            return snap
+        snap = UiHierarchy(dump())
+        with self._lock:
+            self._snapshots[serial] = snap
+        return snap
+
+    def put(self, serial, snap):
+        """Guarda un snapshot obtenido por otra vía (p.ej. las consultas de ui_wait)."""
+        with self._lock:
+            self._snapshots[serial] = snap
+
+    def invalidate(self, serial):
+        with self._lock:
+            self._snapshots.pop(serial, None)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+    def stats(self):
+        """serial -> ParseStats del snapshot vigente."""
+        with self._lock:
+            return {serial: snap.stats for serial, snap in self._snapshots.items()}
+
+
+_snapshots = SnapshotCache()
+
+def get_snapshot_cache():
+    return _snapshots
+
+def get_snapshot(serial, d, max_age=None):
+    """
+    Snapshot del dispositivo. El dump va por adb exec-out (adb_utils.read_ui_xml,
+    más rápido); si no da XML se pide a la conexión uiautomator2 `d`.
+    """
+    import adb_utils  # aquí y no arriba: adb_utils importa este módulo
+
+    def dump():
+        xml = adb_utils.read_ui_xml(serial)
+        return xml if xml is not None else d.dump_hierarchy()
+    return _snapshots.get(serial, dump, max_age)
+
+def invalidate_snapshot(serial):
+    _snapshots.invalidate(serial)
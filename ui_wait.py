@@ -0,0 +1,162 @@
+# ui_wait.py
+# Esperas adaptativas: en vez de dormir un tiempo fijo se consulta el estado
+# del dispositivo con backoff y se sigue en cuanto se cumple la condición,
+# con un plazo máximo. Condiciones:
+#   appears / disappears -> un selector (resourceId, text, description) está / no está en la UI
+#   stable               -> la jerarquía de UI no cambia entre STABLE_POLLS dumps seguidos
+#   activity             -> la actividad en primer plano contiene el texto dado
+# Lo usan la acción wait_for de los scripts y, si se activan, las esperas
+# adaptativas (los "wait" fijos y los sleep pasan a ser el tope de una
+# espera a que la UI se estabilice; ver script_executor.ADAPTIVE_WAITS).
+import asyncio
+import time
+import adb_utils
+from shell_pool import run_shell
+from ui_hierarchy import UiHierarchy, UiParseError, get_snapshot_cache
+
+CONDITIONS = ("appears", "disappears", "stable", "activity")
+WAIT_FOR_TIMEOUT = 10.0
+POLL_INTERVAL = 0.2
+POLL_BACKOFF = 1.5
+MAX_POLL_INTERVAL = 2.0
+# Dumps idénticos seguidos para dar la UI por estable
+STABLE_POLLS = 2
+# Las esperas adaptativas solo sustituyen esperas fijas de al menos esto (s):
+# por debajo, un par de dumps de UI cuestan más que la propia espera
+ADAPTIVE_MIN_WAIT = 1.0
+# Antes del primer dump de una espera adaptativa: deja arrancar la transición
+# que haya provocado el paso (si no, la pantalla vieja parecería estable)
+ADAPTIVE_SETTLE = 0.3
+ACTIVITY_COMMAND = "dumpsys activity activities | grep -E 'mResumedActivity|topResumedActivity' | head -n 1"
+
+
+class WaitForTimeout(Exception):
+    """La condición de un wait_for no se cumplió dentro del plazo."""
+
+
+def poll_delays(interval=POLL_INTERVAL, backoff=POLL_BACKOFF, max_interval=MAX_POLL_INTERVAL):
+    """Esperas entre consultas: interval, interval*backoff... hasta max_interval."""
+    while True:
+        yield interval
+        interval = min(interval * backoff, max_interval)
+
+
+def read_ui(serial, d):
+    """XML actual de la UI (por uiautomator2 si hay conexión, si no por adb) o None."""
+    try:
+        return d.dump_hierarchy() if d is not None else adb_utils.read_ui_xml(serial)
+    except Exception:
+        return None
+
+
+class WaitCondition:
+    def __init__(self, kind, selector=None, activity=None, stable_polls=STABLE_POLLS):
+        if kind not in CONDITIONS:
+            raise ValueError(f"wait_for: condición desconocida '{kind}' (válidas: {', '.join(CONDITIONS)})")
+        if kind in ("appears", "disappears") and not selector:
+            raise ValueError(f"wait_for {kind}: falta resourceId, text o description")
+        if kind == "activity" and not activity:
+            raise ValueError("wait_for activity: falta 'activity'")
+        self.kind = kind
+        self.selector = selector
+        self.activity = activity
+        self.stable_polls = max(2, stable_polls)
+        self._last = None
+        self._same = 0
+
+    @classmethod
+    def from_step(cls, step, eval_expression):
+        """Condición de un paso wait_for (la clave 'until', por defecto 'appears')."""
+        selector = None
+        for key in ("resourceId", "text", "description"):
+            if key in step:
+                selector = {key: str(eval_expression(step[key]))}
+                break
+        activity = step.get("activity")
+        return cls(step.get("until", "appears"), selector,
+                   str(eval_expression(activity)) if activity is not None else None,
+                   int(step.get("stable_polls", STABLE_POLLS)))
+
+    def describe(self):
+        if self.kind == "activity":
+            return f"actividad {self.activity}"
+        if self.kind == "stable":
+            return "UI estable"
+        return f"{self.kind} {self.selector}"
+
+    def check(self, serial, d):
+        """Consulta el dispositivo una vez (bloqueante). True si la condición se cumple."""
+        if self.kind == "activity":
+            res = run_shell(serial, ACTIVITY_COMMAND)
+            return res.rc == 0 and self.activity in res.stdout
+        xml = read_ui(serial, d)
+        if xml is None:
+            # sin dump no se sabe nada: ni siquiera "disappears" se da por cumplida
+            self._last, self._same = None, 0
+            return False
+        if self.kind == "stable":
+            self._same = self._same + 1 if xml == self._last else 1
+            self._last = xml
+            return self._same >= self.stable_polls
+        try:
+            snap = UiHierarchy(xml)
+        except UiParseError:
+            return False
+        # el dump recién hecho sirve de snapshot a los pasos UIA siguientes
+        get_snapshot_cache().put(serial, snap)
+        return snap.exists(**self.selector) == (self.kind == "appears")
+
+
+def wait_for(serial, d, condition, timeout=WAIT_FOR_TIMEOUT, stop_event=None, initial_delay=0.0):
+    """
+    Consulta `condition` hasta que se cumple o vence `timeout`. Devuelve True
+    si se cumplió. Las esperas entre consultas crecen con backoff y se cortan
+    si se activa stop_event.
+    """
+    deadline = time.time() + timeout
+    if initial_delay:
+        time.sleep(min(initial_delay, timeout))
+    for delay in poll_delays():
+        if condition.check(serial, d):
+            return True
+        remaining = deadline - time.time()
+        if remaining <= 0 or (stop_event and stop_event.is_set()):
+            return False
+        time.sleep(min(delay, remaining))
+
+
+async def wait_for_async(serial, d, condition, timeout=WAIT_FOR_TIMEOUT, stop_event=None, initial_delay=0.0):
+    """wait_for sin bloquear el event loop (cada consulta va en un hilo)."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    if initial_delay:
+        await asyncio.sleep(min(initial_delay, timeout))
+    for delay in poll_delays():
+        if await asyncio.to_thread(condition.check, serial, d):
+            return True
+        remaining = deadline - loop.time()
+        if remaining <= 0 or (stop_event and stop_event.is_set()):
+            return False
+        await asyncio.sleep(min(delay, remaining))
+
+
+def wait_for_timeout(step, eval_expression):
+    return float(eval_expression(step.get("timeout", WAIT_FOR_TIMEOUT)))
+
+
+def record_wait_result(step, condition, met, elapsed, vars_store, log):
+    """
+    Guarda el resultado en result_var si el paso la define; si no, una
+    condición incumplida hace fallar el paso (WaitForTimeout).
+    """
+    result_var = step.get("result_var")
+    if result_var:
+        vars_store[result_var] = met
+    log(f"wait_for {condition.describe()} -> {met} en {elapsed:.2f}s")
+    if not met and not result_var:
+        raise WaitForTimeout(f"wait_for {condition.describe()}: no se cumplió en {elapsed:.1f}s")
+
+
+def settle_condition():
+    """Condición de las esperas adaptativas (una nueva por espera: guarda estado)."""
+    return WaitCondition("stable")
@@ -0,0 +1,112 @@
+# uia_pool.py
+# Caché de conexiones uiautomator2 por serial para todo el proceso.
+# u2.connect() vuelve a negociar con el agente del dispositivo (segundos);
+# aquí la conexión se reutiliza entre ejecuciones, se comprueba si lleva
+# tiempo sin usarse, se descarta si está ociosa y se rehace si falla.
+import threading
+import time
+
+# Intentar importar uiautomator2 (si no está, la app sigue funcionando con ADB)
+try:
+    import uiautomator2 as u2
+except Exception:
+    u2 = None
+
+PROBE_INTERVAL = 30.0   # sin uso durante más de esto -> probar antes de devolverla
+IDLE_TIMEOUT = 600.0    # sin uso durante más de esto -> descartarla
+
+
+class _Entry:
+    __slots__ = ("device", "last_used", "lock")
+
+    def __init__(self):
+        self.device = None
+        self.last_used = 0.0
+        self.lock = threading.Lock()
+
+
+class UiaConnectionCache:
+    def __init__(self, connect=None, probe_interval=PROBE_INTERVAL, idle_timeout=IDLE_TIMEOUT):
+        self.connect = connect or (u2.connect if u2 is not None else None)
+        self.probe_interval = probe_interval
+        self.idle_timeout = idle_timeout
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.connect is not None
+
+    @staticmethod
+    def probe(device):
+        """Comprueba que el agente responde (una llamada jsonrpc barata)."""
+        try:
+            device.info
+            return True
+        except Exception:
+            return False
+
+    def _entry(self, serial):
+        with self._lock:
+            entry = self._entries.get(serial)
+            if entry is None:
+                entry = self._entries[serial] = _Entry()
+            return entry
+
+    def get(self, serial):
+        """
+        Conexión para `serial`, reutilizada si sigue viva. Lanza la excepción
+        de u2.connect si no se puede conectar, RuntimeError si no hay uiautomator2.
+        """
+        if self.connect is None:
+            raise RuntimeError("uiautomator2 no está instalado")
+        self.evict_idle()
+        entry = self._entry(serial)
+        # un lock por serial: dos hilos no conectan a la vez al mismo dispositivo
+        with entry.lock:
+            now = time.time()
+            d = entry.device
+            if d is not None and now - entry.last_used > self.probe_interval and not self.probe(d):
+                d = None
+            if d is None:
+                entry.device = None
+                d = self.connect(serial)
+                entry.device = d
+            entry.last_used = time.time()
+            return d
+
+    def invalidate(self, serial):
+        """Descarta la conexión (p.ej. tras un error); la próxima get() reconecta."""
+        with self._lock:
+            entry = self._entries.pop(serial, None)
+        if entry is not None:
+            entry.device = None
+
+    def evict_idle(self):
+        now = time.time()
+        with self._lock:
+            idle = [s for s, e in self._entries.items()
+                    if e.device is not None and now - e.last_used > self.idle_timeout]
+            for serial in idle:
+                self._entries.pop(serial).device = None
+        return idle
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def serials(self):
+        with self._lock:
+            return [s for s, e in self._entries.items() if e.device is not None]
+
+
+_cache = UiaConnectionCache()
+
+def get_uia_cache():
+    return _cache
+
+def get_uia_device(serial):
+    return _cache.get(serial)
+
+def invalidate_uia(serial):
+    _cache.invalidate(serial)
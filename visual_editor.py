@@ -1,12 +1,257 @@
 # visual_editor.py
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog, scrolledtext
+import tkinter.font as tkfont
+import colorsys
 import json
 import threading
 import time
 import subprocess
 from adb_utils import list_devices, run_adb_cmd_raw
 from script_executor import execute_script_for_device
+from script_compiler import compile_script, ScriptCompileError
+
+
+class EdgeStore:
+    """
+    Conexiones del editor: line_id -> (origen, destino), con índices por nodo
+    de salientes y entrantes para que mover o borrar un bloque solo recorra
+    sus propias líneas. Iterar da tuplas (from_id, to_id, line_id) en orden
+    de creación, como la antigua lista de edges.
+    """
+
+    def __init__(self):
+        self._lines = {}  # line_id -> (from_id, to_id)
+        self._out = {}    # nid -> {line_id: to_id}
+        self._in = {}     # nid -> {line_id: from_id}
+
+    def __iter__(self):
+        return iter([(a, b, lid) for lid, (a, b) in self._lines.items()])
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __contains__(self, line_id):
+        return line_id in self._lines
+
+    def add(self, from_id, to_id, line_id):
+        self._lines[line_id] = (from_id, to_id)
+        self._out.setdefault(from_id, {})[line_id] = to_id
+        self._in.setdefault(to_id, {})[line_id] = from_id
+
+    def remove(self, line_id):
+        """Quita la conexión de la línea; devuelve (from_id, to_id) o None si no existía."""
+        edge = self._lines.pop(line_id, None)
+        if edge is None:
+            return None
+        a, b = edge
+        self._out[a].pop(line_id, None)
+        if not self._out[a]:
+            del self._out[a]
+        self._in[b].pop(line_id, None)
+        if not self._in[b]:
+            del self._in[b]
+        return edge
+
+    def touching(self, nid):
+        """(from_id, to_id, line_id) de las conexiones que salen o llegan a `nid`."""
+        edges = [(nid, b, lid) for lid, b in self._out.get(nid, {}).items()]
+        edges += [(a, nid, lid) for lid, a in self._in.get(nid, {}).items() if a != nid]
+        return edges
+
+    def endpoints(self, line_id):
+        """(from_id, to_id) de la línea o None."""
+        return self._lines.get(line_id)
+
+    def successors(self, nid):
+        return list(self._out.get(nid, {}).values())
+
+    def in_degree(self, nid):
+        return len(self._in.get(nid, ()))
+
+    def remove_node(self, nid):
+        """Quita todas las conexiones de `nid`; devuelve sus line_id (para borrarlas del canvas)."""
+        lines = [lid for _, _, lid in self.touching(nid)]
+        for lid in lines:
+            self.remove(lid)
+        return lines
+
+    def clear(self):
+        """Vacía el almacén; devuelve los line_id que había."""
+        lines = list(self._lines)
+        self._lines.clear()
+        self._out.clear()
+        self._in.clear()
+        return lines
+
+
+# Los bloques, líneas e índices usan coordenadas del mundo (las de zoom 1);
+# el canvas es mundo * zoom + desplazamiento (ver VisualFlowEditor.to_canvas)
+WORLD_SIZE = 3000
+# Lado (unidades del mundo) de las celdas del índice espacial: un bloque ocupa pocas celdas
+GRID_CELL = 200
+# Distancia (px de pantalla) a la que un clic todavía selecciona una conexión
+EDGE_HIT_TOLERANCE = 4
+# Por debajo de este zoom los bloques se dibujan como rectángulos simples (sin texto ni puertos)
+LOD_ZOOM = 0.75
+ZOOM_MIN, ZOOM_MAX = 0.5, 2.0
+ZOOM_STEP = 1.1
+# Margen (px de pantalla) alrededor de la zona visible que se mantiene actualizada al momento
+VIEWPORT_MARGIN = 200
+# Bloques sin puerto de salida / de entrada
+NO_OUT_PORT = ("stop", "endif", "endwhile", "else")
+NO_IN_PORT = ("start",)
+DEFAULT_BLOCK_COLOR = "#3b82f6"
+
+
+def lighten_color(color, amount=0.2):
+    """Aclara un color "#rrggbb" en `amount` (0-1) de luminosidad y saturación; otros formatos se devuelven tal cual."""
+    if not isinstance(color, str) or len(color) != 7 or color[0] != "#":
+        return color
+    try:
+        r, g, b = (int(color[i:i + 2], 16) / 255 for i in (1, 3, 5))
+    except ValueError:
+        return color
+    h, l, s = colorsys.rgb_to_hls(r, g, b)
+    r, g, b = colorsys.hls_to_rgb(h, min(1, l + amount), min(1, s + amount))
+    return "#%02x%02x%02x" % (round(r * 255), round(g * 255), round(b * 255))
+
+
+def block_styles(palette):
+    """type -> estilo del bloque (label, color, color al pasar el ratón y puertos), calculado una vez."""
+    return {
+        item["type"]: {
+            **item,
+            "hover": lighten_color(item["color"]),
+            "out_port": item["type"] not in NO_OUT_PORT,
+            "in_port": item["type"] not in NO_IN_PORT,
+        }
+        for item in palette
+    }
+
+
+class GridIndex:
+    """
+    Índice espacial de rectángulos (bloques, cajas de las líneas) en una
+    rejilla de celdas fijas: un punto o un rectángulo solo mira las celdas
+    que toca, así que el coste no crece con el número de bloques del lienzo.
+    Las claves se devuelven en orden de inserción (el de apilado del canvas).
+    """
+
+    def __init__(self, cell=GRID_CELL):
+        self.cell = cell
+        self._cells = {}  # (cx, cy) -> {clave: None} (conjunto ordenado)
+        self._rects = {}  # clave -> (x1, y1, x2, y2)
+        self._ranges = {} # clave -> celdas que ocupa (cx1, cy1, cx2, cy2)
+        self._order = {}  # clave -> nº de inserción (z-order)
+        self._next = 0
+
+    def __len__(self):
+        return len(self._rects)
+
+    def __contains__(self, key):
+        return key in self._rects
+
+    def _cell_range(self, x1, y1, x2, y2):
+        c = self.cell
+        return int(x1 // c), int(y1 // c), int(x2 // c), int(y2 // c)
+
+    @staticmethod
+    def _cells_of(cell_range):
+        cx1, cy1, cx2, cy2 = cell_range
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                yield cx, cy
+
+    def insert(self, key, rect):
+        """Añade o mueve `key` al rectángulo (x1, y1, x2, y2); las esquinas pueden venir en cualquier orden."""
+        x1, y1, x2, y2 = rect
+        rect = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        cell_range = self._cell_range(*rect)
+        old = self._ranges.get(key)
+        self._rects[key] = rect
+        if old == cell_range:
+            return  # sigue en las mismas celdas (lo habitual al arrastrar poco o hacer zoom)
+        if old is not None:
+            self._unlink(key, old)
+        else:
+            self._order[key] = self._next
+            self._next += 1
+        self._ranges[key] = cell_range
+        for cell in self._cells_of(cell_range):
+            self._cells.setdefault(cell, {})[key] = None
+
+    def _unlink(self, key, cell_range):
+        for cell in self._cells_of(cell_range):
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self._cells[cell]
+
+    def remove(self, key):
+        cell_range = self._ranges.pop(key, None)
+        if cell_range is not None:
+            self._unlink(key, cell_range)
+            del self._rects[key]
+            del self._order[key]
+
+    def clear(self):
+        self._cells.clear()
+        self._rects.clear()
+        self._ranges.clear()
+        self._order.clear()
+
+    def rect(self, key):
+        return self._rects.get(key)
+
+    def candidates_at(self, x, y):
+        """Claves cuya celda contiene el punto (sin comprobar el rectángulo), de arriba abajo."""
+        c = self.cell
+        bucket = self._cells.get((int(x // c), int(y // c)), {})
+        return sorted(bucket, key=self._order.__getitem__, reverse=True)
+
+    def at(self, x, y):
+        """La clave de más arriba cuyo rectángulo contiene el punto, o None."""
+        for key in self.candidates_at(x, y):
+            x1, y1, x2, y2 = self._rects[key]
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                return key
+        return None
+
+    def query(self, x1, y1, x2, y2):
+        """Claves cuyo rectángulo corta al dado, en orden de inserción."""
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        cell_range = cx1, cy1, cx2, cy2 = self._cell_range(x1, y1, x2, y2)
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self._cells):
+            # rectángulo enorme (zoom lejano): recorrer solo las celdas ocupadas
+            cells = [cell for cell in self._cells if cx1 <= cell[0] <= cx2 and cy1 <= cell[1] <= cy2]
+        else:
+            cells = self._cells_of(cell_range)
+        found = set()
+        for cell in cells:
+            for key in self._cells.get(cell, ()):
+                if key in found:
+                    continue
+                a1, b1, a2, b2 = self._rects[key]
+                if a1 <= x2 and x1 <= a2 and b1 <= y2 and y1 <= b2:
+                    found.add(key)
+        return sorted(found, key=self._order.__getitem__)
+
+
+def rects_intersect(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def segment_distance(px, py, x1, y1, x2, y2):
+    """Distancia del punto (px, py) al segmento (x1, y1)-(x2, y2)."""
+    dx, dy = x2 - x1, y2 - y1
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length2))
+    cx, cy = x1 + t * dx, y1 + t * dy
+    return ((px - cx) ** 2 + (py - cy) ** 2) ** 0.5
+
 
 class VisualFlowEditor(tk.Toplevel):
     BLOCK_W = 160
@@ -36,35 +281,55 @@ class VisualFlowEditor(tk.Toplevel):
         {"type": "uia_text", "label": "UIA Escribir", "color": "#ec4899"},
         {"type": "uia_exists", "label": "UIA Exists", "color": "#ec4899"},
         {"type": "uia_scroll", "label": "UIA Scroll", "color": "#ec4899"},
+        {"type": "wait_for", "label": "Esperar UI", "color": "#ec4899"},
     ]
+    STYLES = block_styles(PALETTE)
     
-    def __init__(self, master, inject_target_textwidget=None):
+    def __init__(self, master, inject_target_textwidget=None, log_cb=None):
         super().__init__(master)
         self.title("Visual Script Builder — bloques y líneas")
         self.geometry("1400x800")
         self.resizable(True, True)
 
         self.inject_target = inject_target_textwidget
+        self.log_cb = log_cb  # sumidero de logs de la ventana principal (LogSink)
 
         # estado
         self.nodes = {}
-        self.edges = []  # tuples (from_id, to_id, line_id)
+        self.edges = EdgeStore()
+        # índices espaciales: bloques (nid -> rectángulo) y líneas (line_id -> caja)
+        self.node_index = GridIndex()
+        self.edge_index = GridIndex()
+        # bloques y líneas fuera de la vista con geometría pendiente de aplicar al canvas
+        self.dirty_nodes = set()
+        self.dirty_edges = set()
+        # bloques colocados con el detalle oculto (texto y puertos sin mover)
+        self.coarse_nodes = set()
+        self._flush_pending = False
         self.dragging_node_id = None
-        self.drag_offset = (0, 0)
         self.connect_mode = False
         self.connect_source_id = None
         self.next_id = 1
         
         # selección persistente
         self.selected_node = None   # id como "n3"
+        self.selected_nodes = set() # todos los seleccionados (varios con la selección por rectángulo)
         self.selected_edge = None   # canvas item id (línea)
+        self.drag_start = None      # punto de canvas donde empezó el arrastre
+        self.drag_origins = {}      # nid -> (x, y) de los bloques arrastrados al empezar
+        self.band_start = None      # selección por rectángulo en curso
+        self.band_rect = None
 
         # drag-drop from palette helpers
         self.dragging_palette_item = None
         self.temp_preview = None
 
-        # zoom
+        # zoom: canvas = mundo * zoom_level + (view_x, view_y)
         self.zoom_level = 1.0
+        self.view_x = self.view_y = 0.0
+        # caché de fuentes de los textos de bloque (tamaño -> tkfont.Font); al hacer
+        # zoom se cambia la fuente de todos con una sola llamada
+        self.fonts = {}
 
         self.create_widgets()
         
@@ -94,7 +359,7 @@ class VisualFlowEditor(tk.Toplevel):
             "Control": ["start", "stop"],
             "ADB Actions": ["start_app", "open_link", "tap", "text", "swipe", "keyevent", "broadcast", "shell"],
             "Flow Control": ["sleep", "set_var", "math_operation", "if", "else", "endif", "while", "endwhile"],
-            "UIA Actions": ["uia_click", "uia_text", "uia_exists", "uia_scroll"]
+            "UIA Actions": ["uia_click", "uia_text", "uia_exists", "uia_scroll", "wait_for"]
         }
 
         for category, items in categories.items():
@@ -103,7 +368,7 @@ class VisualFlowEditor(tk.Toplevel):
             tk.Label(cat_frame, text=category, font=("Arial", 9, "bold")).pack(anchor=tk.W)
             
             for item_type in items:
-                item = next((i for i in self.PALETTE if i["type"] == item_type), None)
+                item = self.STYLES.get(item_type)
                 if item:
                     btn = tk.Button(cat_frame, text=item["label"], bg=item["color"], fg="white", 
                                   relief=tk.RAISED, padx=5, pady=2, width=20, anchor=tk.W)
@@ -168,7 +433,7 @@ class VisualFlowEditor(tk.Toplevel):
         tk.Button(toolbar, text="🗑️ Limpiar Todo", command=self.clear_canvas).pack(side=tk.LEFT, padx=2)
         tk.Button(toolbar, text="🎯 Alinear", command=self.align_blocks).pack(side=tk.LEFT, padx=2)
         
-        tk.Label(toolbar, text="Lienzo: Arrastra bloques • Doble clic para editar • Rueda ratón para zoom", 
+        tk.Label(toolbar, text="Lienzo: Arrastra bloques • Arrastra en vacío para seleccionar varios • Doble clic para editar • Rueda ratón para zoom", 
                 bg="#f0f0f0").pack(side=tk.LEFT, padx=10)
 
         # Canvas with scrollbars
@@ -176,12 +441,18 @@ class VisualFlowEditor(tk.Toplevel):
         canvas_frame.pack(fill=tk.BOTH, expand=True)
 
         # Create canvas
-        self.canvas = tk.Canvas(canvas_frame, bg="#1e293b", scrollregion=(0, 0, 3000, 3000))
+        self.canvas = tk.Canvas(canvas_frame, bg="#1e293b", scrollregion=(0, 0, WORLD_SIZE, WORLD_SIZE))
+        # fuentes de todos los tamaños que puede pedir el rango de zoom
+        for size in range(int(10 * ZOOM_MIN / ZOOM_STEP), int(10 * ZOOM_MAX * ZOOM_STEP) + 1):
+            self.fonts[size] = tkfont.Font(root=self, family="Arial", size=size)
         
         # Add scrollbars
         v_scrollbar = tk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.canvas.yview)
         h_scrollbar = tk.Scrollbar(canvas_frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
-        self.canvas.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        # cualquier cambio de la vista (scrollbars, scan, tamaño) pone al día lo que entra en ella
+        self.canvas.configure(yscrollcommand=lambda *a: (v_scrollbar.set(*a), self.schedule_flush()),
+                              xscrollcommand=lambda *a: (h_scrollbar.set(*a), self.schedule_flush()))
+        self.canvas.bind("<Configure>", lambda e: self.schedule_flush())
         
         # Grid layout for canvas and scrollbars
         self.canvas.grid(row=0, column=0, sticky="nsew")
@@ -201,41 +472,42 @@ class VisualFlowEditor(tk.Toplevel):
         self.canvas.bind("<Button-5>", self.on_mousewheel)  # For Linux
 
     def add_block(self, item_type, label, x, y):
+        """Crea un bloque en (x, y) en coordenadas del mundo (independientes del zoom)."""
         nid = f"n{self.next_id}"
         self.next_id += 1
         
-        # Get color from palette
-        color = next((item["color"] for item in self.PALETTE if item["type"] == item_type), "#3b82f6")
+        style = self.STYLES.get(item_type)
+        if style is None:
+            style = {"color": DEFAULT_BLOCK_COLOR, "hover": lighten_color(DEFAULT_BLOCK_COLOR),
+                     "out_port": True, "in_port": True}
+        color = style["color"]
         
-        # Apply zoom
-        x, y = x / self.zoom_level, y / self.zoom_level
+        cx, cy = self.to_canvas(x, y)
         width, height = self.BLOCK_W * self.zoom_level, self.BLOCK_H * self.zoom_level
+        port = self.PORT_SIZE * self.zoom_level
+        state = tk.NORMAL if self.zoom_level >= LOD_ZOOM else tk.HIDDEN
         
-        rect = self.canvas.create_rectangle(x, y, x + width, y + height,
+        rect = self.canvas.create_rectangle(cx, cy, cx + width, cy + height,
                                           fill=color, outline="#ffffff", width=2, 
-                                          tags=("block", nid), activefill=self.lighten_color(color))
+                                          tags=("block", nid), activefill=style["hover"])
         
-        text = self.canvas.create_text(x + width/2, y + height/2, text=label, 
-                                     fill="white", tags=("block", nid), font=("Arial", int(10 * self.zoom_level)))
+        text = self.canvas.create_text(cx + width/2, cy + height/2, text=label, state=state,
+                                     fill="white", tags=("block", nid, "label"), font=self.label_font())
         
         # Only add output port if not an end block
         out_port = None
-        if item_type not in ["stop", "endif", "endwhile", "else"]:
-            out_port = self.canvas.create_oval(x + width - self.PORT_SIZE * self.zoom_level, 
-                                             y + height/2 - (self.PORT_SIZE/2) * self.zoom_level,
-                                             x + width, 
-                                             y + height/2 + (self.PORT_SIZE/2) * self.zoom_level,
-                                             fill="#38bdf8", outline="", 
+        if style["out_port"]:
+            out_port = self.canvas.create_oval(cx + width - port, cy + height/2 - port/2,
+                                             cx + width, cy + height/2 + port/2,
+                                             fill="#38bdf8", outline="", state=state,
                                              tags=("port_out", nid))
         
         # Only add input port if not a start block
         in_port = None
-        if item_type not in ["start"]:
-            in_port = self.canvas.create_oval(x, 
-                                            y + height/2 - (self.PORT_SIZE/2) * self.zoom_level,
-                                            x + self.PORT_SIZE * self.zoom_level, 
-                                            y + height/2 + (self.PORT_SIZE/2) * self.zoom_level,
-                                            fill="#22c55e", outline="", 
+        if style["in_port"]:
+            in_port = self.canvas.create_oval(cx, cy + height/2 - port/2,
+                                            cx + port, cy + height/2 + port/2,
+                                            fill="#22c55e", outline="", state=state,
                                             tags=("port_in", nid))
         
         self.nodes[nid] = {
@@ -246,37 +518,114 @@ class VisualFlowEditor(tk.Toplevel):
             "params": {}, 
             "canvas_ids": (rect, text), 
             "ports": (out_port, in_port),
-            "color": color
+            "color": color,
         }
+        self.node_index.insert(nid, self.node_rect(nid))
         
         return nid
 
-    def lighten_color(self, color, amount=0.2):
-        """Lighten a color by amount (0-1)"""
-        try:
-            import matplotlib.colors as mc
-            import colorsys
-            c = mc.cnames[color] if color in mc.cnames else color
-            c = colorsys.rgb_to_hls(*mc.to_rgb(c))
-            return mc.to_hex((
-                c[0], 
-                min(1, c[1] + amount), 
-                min(1, c[2] + amount)
-            ))
-        except:
-            return color
+    def to_canvas(self, x, y):
+        """Coordenadas del mundo -> coordenadas de canvas (zoom y desplazamiento actuales)."""
+        return x * self.zoom_level + self.view_x, y * self.zoom_level + self.view_y
 
-    def clear_selection(self):
-        """Quita resaltado de nodo o arista seleccionada."""
-        if self.selected_node:
-            n = self.nodes.get(self.selected_node)
-            if n:
-                try:
-                    rect = n["canvas_ids"][0]
+    def to_world(self, x, y):
+        """Coordenadas de canvas -> coordenadas del mundo."""
+        return (x - self.view_x) / self.zoom_level, (y - self.view_y) / self.zoom_level
+
+    def label_font(self):
+        """Fuente de los textos de bloque para el zoom actual (de la caché: una por tamaño)."""
+        size = max(1, int(10 * self.zoom_level))
+        font = self.fonts.get(size)
+        if font is None:
+            font = self.fonts[size] = tkfont.Font(root=self, family="Arial", size=size)
+        return font
+
+    def node_rect(self, nid):
+        n = self.nodes[nid]
+        return (n["x"], n["y"], n["x"] + self.BLOCK_W, n["y"] + self.BLOCK_H)
+
+    def canvas_point(self, event):
+        """Coordenadas de canvas del evento (tienen en cuenta el scroll)."""
+        return self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+
+    def world_point(self, event):
+        """Coordenadas del mundo del evento."""
+        return self.to_world(*self.canvas_point(event))
+
+    def edge_at(self, x, y):
+        """Conexión más cercana al punto del mundo (a EDGE_HIT_TOLERANCE px de pantalla) o None."""
+        tol = EDGE_HIT_TOLERANCE / self.zoom_level
+        best, best_dist = None, tol
+        for lid in self.edge_index.query(x - tol, y - tol, x + tol, y + tol):
+            dist = segment_distance(x, y, *self.edge_coords(*self.edges.endpoints(lid)))
+            if dist <= best_dist:
+                best, best_dist = lid, dist
+        return best
+
+    def add_edge(self, a, b):
+        coords = self.edge_coords(a, b)
+        line = self.canvas.create_line(*self.line_coords(coords), fill="#94a3b8",
+                                       width=2, arrow=tk.LAST, tags=("edge",),
+                                       arrowshape=(8, 10, 5))
+        self.edges.add(a, b, line)
+        self.edge_index.insert(line, coords)
+        return line
+
+    def viewport(self):
+        """Zona visible (coordenadas del mundo) más VIEWPORT_MARGIN px de pantalla."""
+        c = self.canvas
+        x0, y0 = c.canvasx(0), c.canvasy(0)
+        m = VIEWPORT_MARGIN
+        return (*self.to_world(x0 - m, y0 - m),
+                *self.to_world(x0 + c.winfo_width() + m, y0 + c.winfo_height() + m))
+
+    def edge_coords(self, a, b):
+        """Extremos de la línea a -> b en coordenadas del mundo."""
+        return (*self.anchor_out(a), *self.anchor_in(b))
+
+    def line_coords(self, coords):
+        ax, ay, bx, by = coords
+        return (*self.to_canvas(ax, ay), *self.to_canvas(bx, by))
+
+    def schedule_flush(self):
+        """Pinta (en el próximo idle) lo pendiente que haya entrado en la vista."""
+        if not self._flush_pending and (self.dirty_nodes or self.dirty_edges):
+            self._flush_pending = True
+            self.after_idle(self.flush_visible)
+
+    def flush_visible(self, vp=None):
+        self._flush_pending = False
+        vp = vp or self.viewport()
+        if self.dirty_nodes:
+            for nid in self.node_index.query(*vp):
+                if nid in self.dirty_nodes:
+                    self.dirty_nodes.discard(nid)
+                    self.render_node(nid)
+        if self.dirty_edges:
+            for lid in self.edge_index.query(*vp):
+                if lid in self.dirty_edges:
+                    self.dirty_edges.discard(lid)
+                    a, b = self.edges.endpoints(lid)
+                    self.canvas.coords(lid, *self.line_coords(self.edge_coords(a, b)))
+
+    def _highlight_node(self, nid, on):
+        n = self.nodes.get(nid)
+        if n:
+            try:
+                rect = n["canvas_ids"][0]
+                if on:
+                    self.canvas.itemconfig(rect, outline="#fb923c", width=3)  # color resaltado
+                else:
                     self.canvas.itemconfig(rect, outline="#ffffff", width=2)
-                except Exception:
-                    pass
-            self.selected_node = None
+            except Exception:
+                pass
+
+    def clear_selection(self):
+        """Quita resaltado de nodo(s) o arista seleccionada."""
+        for nid in self.selected_nodes:
+            self._highlight_node(nid, False)
+        self.selected_nodes = set()
+        self.selected_node = None
 
         if self.selected_edge:
             try:
@@ -287,16 +636,22 @@ class VisualFlowEditor(tk.Toplevel):
 
     def select_node(self, nid):
         """Selecciona (y resalta) un nodo por su id."""
-        if nid == self.selected_node:
+        if nid == self.selected_node and len(self.selected_nodes) == 1:
             return
         self.clear_selection()
         if nid in self.nodes:
             self.selected_node = nid
-            try:
-                rect = self.nodes[nid]["canvas_ids"][0]
-                self.canvas.itemconfig(rect, outline="#fb923c", width=3)  # color resaltado
-            except Exception:
-                pass
+            self.selected_nodes = {nid}
+            self._highlight_node(nid, True)
+
+    def select_nodes(self, nids):
+        """Selección múltiple (rectángulo); el primero queda como bloque activo para editar/duplicar."""
+        self.clear_selection()
+        nids = [nid for nid in nids if nid in self.nodes]
+        self.selected_nodes = set(nids)
+        self.selected_node = nids[0] if nids else None
+        for nid in nids:
+            self._highlight_node(nid, True)
 
     def select_edge(self, lid):
         """Selecciona (y resalta) una línea (edge) por su id."""
@@ -333,8 +688,8 @@ class VisualFlowEditor(tk.Toplevel):
 
     def palette_drop(self, event):
         if not self.dragging_palette_item: return
-        x = self.winfo_pointerx() - self.canvas.winfo_rootx()
-        y = self.winfo_pointery() - self.canvas.winfo_rooty()
+        x, y = self.to_world(self.canvas.canvasx(self.winfo_pointerx() - self.canvas.winfo_rootx()),
+                             self.canvas.canvasy(self.winfo_pointery() - self.canvas.winfo_rooty()))
         it = self.dragging_palette_item
         self.add_block(it["type"], it["label"], x, y)
         if self.temp_preview:
@@ -344,84 +699,73 @@ class VisualFlowEditor(tk.Toplevel):
         self.dragging_palette_item = None
 
     def node_at(self, event):
-        items = self.canvas.find_withtag("current")
-        if items:
-            tags = self.canvas.gettags(items[0])
-            for t in tags:
-                if t.startswith("n"):
-                    return t
-        # fallback by coords
-        x, y = event.x, event.y
-        for nid, n in self.nodes.items():
-            if n["x"] <= x <= n["x"] + self.BLOCK_W * self.zoom_level and n["y"] <= y <= n["y"] + self.BLOCK_H * self.zoom_level:
-                return nid
-        return None
+        return self.node_index.at(*self.world_point(event))
 
-    def redraw_node(self, nid):
+    def redraw_node(self, nid, vp=None):
+        """
+        Pone al día la geometría del bloque y de sus líneas en los índices; al
+        canvas solo se aplica si están en la vista (si no, queda pendiente
+        para cuando se haga scroll hasta ellos).
+        """
+        vp = vp or self.viewport()
+        rect = self.node_rect(nid)
+        self.node_index.insert(nid, rect)
+        if rects_intersect(rect, vp):
+            self.dirty_nodes.discard(nid)
+            self.render_node(nid)
+        else:
+            self.dirty_nodes.add(nid)
+
+        # update lines (solo las de este bloque)
+        for (a, b, lid) in self.edges.touching(nid):
+            coords = self.edge_coords(a, b)
+            self.edge_index.insert(lid, coords)
+            if rects_intersect(self.edge_index.rect(lid), vp):
+                self.dirty_edges.discard(lid)
+                try:
+                    self.canvas.coords(lid, *self.line_coords(coords))
+                except Exception:
+                    pass
+            else:
+                self.dirty_edges.add(lid)
+
+    def render_node(self, nid):
+        """Aplica al canvas la geometría del bloque (a zoom bajo solo el rectángulo)."""
         n = self.nodes[nid]
-        x, y = n["x"], n["y"]
+        x, y = self.to_canvas(n["x"], n["y"])
         width, height = self.BLOCK_W * self.zoom_level, self.BLOCK_H * self.zoom_level
         rect, text = n["canvas_ids"]
         
         self.canvas.coords(rect, x, y, x + width, y + height)
+        if self.zoom_level < LOD_ZOOM:
+            # texto y puertos ocultos: se colocan al volver al detalle
+            self.coarse_nodes.add(nid)
+            return
+        self.coarse_nodes.discard(nid)
         self.canvas.coords(text, x + width/2, y + height/2)
         
         # Update ports
+        port = self.PORT_SIZE * self.zoom_level
         out_port, in_port = n.get("ports", (None, None))
         if out_port:
-            self.canvas.coords(
-                out_port, 
-                x + width - self.PORT_SIZE * self.zoom_level, 
-                y + height/2 - (self.PORT_SIZE/2) * self.zoom_level,
-                x + width, 
-                y + height/2 + (self.PORT_SIZE/2) * self.zoom_level
-            )
+            self.canvas.coords(out_port, x + width - port, y + height/2 - port/2, x + width, y + height/2 + port/2)
         if in_port:
-            self.canvas.coords(
-                in_port, 
-                x, 
-                y + height/2 - (self.PORT_SIZE/2) * self.zoom_level,
-                x + self.PORT_SIZE * self.zoom_level, 
-                y + height/2 + (self.PORT_SIZE/2) * self.zoom_level
-            )
-        
-        # Update text font size
-        self.canvas.itemconfig(text, font=("Arial", int(10 * self.zoom_level)))
-        
-        # update lines
-        for (a, b, lid) in list(self.edges):
-            if a == nid or b == nid:
-                ax, ay = self.anchor_out(a)
-                bx, by = self.anchor_in(b)
-                try:
-                    self.canvas.coords(lid, ax, ay, bx, by)
-                except Exception:
-                    pass
+            self.canvas.coords(in_port, x, y + height/2 - port/2, x + port, y + height/2 + port/2)
 
     def anchor_out(self, nid):
         n = self.nodes[nid]
-        width = self.BLOCK_W * self.zoom_level
-        return n["x"] + width, n["y"] + (self.BLOCK_H * self.zoom_level) / 2
+        return n["x"] + self.BLOCK_W, n["y"] + self.BLOCK_H / 2
 
     def anchor_in(self, nid):
         n = self.nodes[nid]
-        return n["x"], n["y"] + (self.BLOCK_H * self.zoom_level) / 2
+        return n["x"], n["y"] + self.BLOCK_H / 2
 
     def on_canvas_click(self, event):
-        # detectar item bajo cursor (topmost)
-        x, y = event.x, event.y
-        items = self.canvas.find_overlapping(x, y, x, y)
-        nid = None
-        edge_id = None
-        
-        if items:
-            item = items[-1]  # topmost
-            tags = self.canvas.gettags(item)
-            for t in tags:
-                if t.startswith("n"):
-                    nid = t
-                if t == "edge":
-                    edge_id = item
+        # detectar bloque / conexión bajo el cursor con los índices espaciales (en coordenadas del mundo)
+        x, y = self.world_point(event)
+        nid = self.node_index.at(x, y)
+        # las líneas se dibujan encima de los bloques: tienen prioridad salvo en modo conexión
+        edge_id = None if self.connect_mode else self.edge_at(x, y)
 
         if self.connect_mode:
             # Si estamos en modo conectar, usar nodos (no bordes)
@@ -431,12 +775,7 @@ class VisualFlowEditor(tk.Toplevel):
                     self.select_node(nid)
                     return
                 if self.connect_source_id and nid and self.connect_source_id != nid:
-                    ax, ay = self.anchor_out(self.connect_source_id)
-                    bx, by = self.anchor_in(nid)
-                    line = self.canvas.create_line(ax, ay, bx, by, fill="#94a3b8", 
-                                                 width=2, arrow=tk.LAST, tags=("edge",),
-                                                 arrowshape=(8, 10, 5))
-                    self.edges.append((self.connect_source_id, nid, line))
+                    self.add_edge(self.connect_source_id, nid)
                 self.connect_source_id = None
             return
 
@@ -445,15 +784,19 @@ class VisualFlowEditor(tk.Toplevel):
             self.select_edge(edge_id)
             return
 
-        # si clic en nodo -> seleccionar + comenzar drag
+        # si clic en nodo -> seleccionar + comenzar drag (de todo el grupo si ya estaba seleccionado)
         if nid:
-            self.select_node(nid)
+            if nid not in self.selected_nodes:
+                self.select_node(nid)
             self.dragging_node_id = nid
-            n = self.nodes[nid]
-            self.drag_offset = (event.x - n["x"], event.y - n["y"])
+            self.drag_start = (x, y)
+            self.drag_origins = {m: (self.nodes[m]["x"], self.nodes[m]["y"]) for m in self.selected_nodes}
         else:
-            # clic en vacío -> limpiar selección
+            # clic en vacío -> limpiar selección y empezar selección por rectángulo
             self.clear_selection()
+            self.band_start = (x, y)
+            cx, cy = self.canvas_point(event)
+            self.band_rect = self.canvas.create_rectangle(cx, cy, cx, cy, outline="#fb923c", dash=(4, 2))
 
     def on_canvas_double_click(self, event):
         nid = self.node_at(event)
@@ -461,35 +804,90 @@ class VisualFlowEditor(tk.Toplevel):
         self.edit_block_params(nid)
 
     def on_canvas_drag(self, event):
+        if self.band_start:
+            self.canvas.coords(self.band_rect, *self.to_canvas(*self.band_start), *self.canvas_point(event))
+            return
         if not self.dragging_node_id: return
-        dx, dy = self.drag_offset
-        n = self.nodes[self.dragging_node_id]
-        n["x"], n["y"] = event.x - dx, event.y - dy
-        self.redraw_node(self.dragging_node_id)
+        x, y = self.world_point(event)
+        dx, dy = x - self.drag_start[0], y - self.drag_start[1]
+        vp = self.viewport()
+        for nid, (ox, oy) in self.drag_origins.items():
+            n = self.nodes[nid]
+            n["x"], n["y"] = ox + dx, oy + dy
+            self.redraw_node(nid, vp)
 
-    def on_canvas_release(self, _event):
+    def on_canvas_release(self, event):
         self.dragging_node_id = None
+        self.drag_origins = {}
+        if self.band_start:
+            x, y = self.world_point(event)
+            x0, y0 = self.band_start
+            self.canvas.delete(self.band_rect)
+            self.band_start = self.band_rect = None
+            if abs(x - x0) * self.zoom_level > 2 or abs(y - y0) * self.zoom_level > 2:
+                self.select_nodes(self.node_index.query(x0, y0, x, y))
 
     def on_mousewheel(self, event):
-        # Zoom with mouse wheel
+        # Zoom with mouse wheel (alrededor del cursor)
+        x, y = self.canvas_point(event)
         if event.delta > 0 or event.num == 4:  # Scroll up or button 4 (Linux)
-            self.zoom_in()
+            self.zoom_in(x, y)
         elif event.delta < 0 or event.num == 5:  # Scroll down or button 5 (Linux)
-            self.zoom_out()
+            self.zoom_out(x, y)
 
-    def zoom_in(self):
-        if self.zoom_level < 2.0:
-            self.zoom_level *= 1.1
-            self.redraw_all()
+    def zoom_in(self, x=None, y=None):
+        if self.zoom_level < ZOOM_MAX:
+            self.zoom_by(ZOOM_STEP, x, y)
 
-    def zoom_out(self):
-        if self.zoom_level > 0.5:
-            self.zoom_level /= 1.1
-            self.redraw_all()
+    def zoom_out(self, x=None, y=None):
+        if self.zoom_level > ZOOM_MIN:
+            self.zoom_by(1 / ZOOM_STEP, x, y)
+
+    def zoom_by(self, factor, x=None, y=None):
+        """
+        Zoom alrededor del punto de canvas (x, y) (por defecto el centro de la
+        vista) con un único canvas.scale: Tk transforma todos los items sin
+        pasar por Python. Los índices y n["x"]/n["y"] están en coordenadas del
+        mundo y no cambian; solo se ajustan la transformación, la fuente de los
+        textos (una llamada para todos, por tag) y el nivel de detalle.
+        """
+        c = self.canvas
+        if x is None:
+            x = c.canvasx(c.winfo_width() / 2)
+            y = c.canvasy(c.winfo_height() / 2)
+        was_detailed = self.zoom_level >= LOD_ZOOM
+        old_font = self.label_font()
+
+        c.scale("all", x, y, factor, factor)
+        self.view_x = x + (self.view_x - x) * factor
+        self.view_y = y + (self.view_y - y) * factor
+        self.zoom_level *= factor
+        c.configure(scrollregion=(*self.to_canvas(0, 0), *self.to_canvas(WORLD_SIZE, WORLD_SIZE)))
+
+        font = self.label_font()
+        if font is not old_font:
+            c.itemconfig("label", font=font)
+        detailed = self.zoom_level >= LOD_ZOOM
+        if detailed != was_detailed:
+            state = tk.NORMAL if detailed else tk.HIDDEN
+            for tag in ("label", "port_out", "port_in"):
+                c.itemconfig(tag, state=state)
+            if detailed:
+                # los movidos con el detalle oculto tienen texto y puertos sin colocar
+                self.dirty_nodes |= self.coarse_nodes
+                self.coarse_nodes = set()
+        # al alejar entra en la vista lo que estaba pendiente alrededor
+        self.flush_visible()
 
     def redraw_all(self):
+        # índices al día para todo (solo Python); al canvas solo va lo visible
         for nid in self.nodes:
-            self.redraw_node(nid)
+            self.node_index.insert(nid, self.node_rect(nid))
+        for a, b, lid in self.edges:
+            self.edge_index.insert(lid, self.edge_coords(a, b))
+        self.dirty_nodes = set(self.nodes)
+        self.dirty_edges = set(lid for _, _, lid in self.edges)
+        self.flush_visible()
 
     def toggle_connect_mode(self):
         self.connect_mode = not self.connect_mode
@@ -649,6 +1047,38 @@ class VisualFlowEditor(tk.Toplevel):
                 first_param = next(iter(n["params"].values()), "")
                 self.update_node_label(nid, f"UIA Exists\n{first_param}")
 
+        elif t == "wait_for":
+            until = simpledialog.askstring("Esperar UI", "Hasta (appears, disappears, stable, activity):",
+                                           initialvalue=n["params"].get("until", "appears"))
+            if until is None:
+                return
+            until = until.strip() or "appears"
+            n["params"] = {k: v for k, v in n["params"].items() if k not in ("resourceId", "text", "description", "activity")}
+            n["params"]["until"] = until
+            target = ""
+            if until == "activity":
+                target = simpledialog.askstring("Esperar UI", "Actividad (paquete o paquete/.Actividad):") or ""
+                n["params"]["activity"] = target
+            elif until != "stable":
+                target = simpledialog.askstring("Esperar UI", "text=... , resourceId=... o description=...") or ""
+                if "=" in target:
+                    k, v = target.split("=", 1)
+                    n["params"][k.strip()] = v.strip()
+                    target = v.strip()
+                elif target:
+                    n["params"]["text"] = target
+            timeout = simpledialog.askfloat("Esperar UI", "Plazo máximo (s):",
+                                            initialvalue=n["params"].get("timeout", 10), minvalue=0)
+            if timeout is not None:
+                n["params"]["timeout"] = timeout
+            result_var = simpledialog.askstring("Esperar UI", "Variable para resultado (opcional; sin ella el paso falla si vence):",
+                                                initialvalue=n["params"].get("result_var", ""))
+            if result_var:
+                n["params"]["result_var"] = result_var
+            else:
+                n["params"].pop("result_var", None)
+            self.update_node_label(nid, f"Esperar UI\n{until} {target[:15]}".rstrip())
+
         elif t == "shell":
             cmd = simpledialog.askstring("Shell Command", "Comando shell:", initialvalue=n["params"].get("command",""))
             if cmd is not None:
@@ -685,22 +1115,24 @@ class VisualFlowEditor(tk.Toplevel):
         self.select_node(new_nid)
 
     def delete_selected_block(self):
-        nid = self.selected_node
-        if not nid:
-            messagebox.showinfo("Info", "Haz clic sobre un bloque para seleccionarlo y eliminarlo.")
+        nids = sorted(self.selected_nodes) or ([self.selected_node] if self.selected_node else [])
+        if not nids:
+            messagebox.showinfo("Info", "Haz clic sobre un bloque (o arrastra un rectángulo) para seleccionarlo y eliminarlo.")
             return
+        for nid in nids:
+            self.delete_block(nid)
+        self.selected_node = None
+        self.selected_nodes = set()
 
+    def delete_block(self, nid):
         # borrar edges asociados
-        for (a, b, lid) in list(self.edges):
-            if a == nid or b == nid:
-                try:
-                    self.canvas.delete(lid)
-                except:
-                    pass
-                try:
-                    self.edges.remove((a, b, lid))
-                except ValueError:
-                    pass
+        for lid in self.edges.remove_node(nid):
+            self.edge_index.remove(lid)
+            self.dirty_edges.discard(lid)
+            try:
+                self.canvas.delete(lid)
+            except:
+                pass
 
         # borrar items del nodo (rect, text, puertos)
         for item in self.canvas.find_withtag(nid):
@@ -709,26 +1141,24 @@ class VisualFlowEditor(tk.Toplevel):
             except:
                 pass
 
-        # eliminar del dict
+        # eliminar del dict y del índice
         self.nodes.pop(nid, None)
-        self.selected_node = None
+        self.node_index.remove(nid)
+        self.dirty_nodes.discard(nid)
+        self.coarse_nodes.discard(nid)
 
     def delete_selected_edge(self):
         lid = self.selected_edge
         if not lid:
             messagebox.showinfo("Info", "Haz clic sobre una conexión (línea) para seleccionarla y luego pulsa 'Borrar conexión'.")
             return
-        for e in list(self.edges):
-            if e[2] == lid:
-                try:
-                    self.canvas.delete(lid)
-                except:
-                    pass
-                try:
-                    self.edges.remove(e)
-                except ValueError:
-                    pass
-                break
+        if self.edges.remove(lid) is not None:
+            self.edge_index.remove(lid)
+            self.dirty_edges.discard(lid)
+            try:
+                self.canvas.delete(lid)
+            except:
+                pass
         self.selected_edge = None
 
     def clear_canvas(self):
@@ -739,18 +1169,23 @@ class VisualFlowEditor(tk.Toplevel):
                     self.canvas.delete(item)
                 self.nodes.pop(nid, None)
             
-            for (a, b, lid) in list(self.edges):
+            for lid in self.edges.clear():
                 try:
                     self.canvas.delete(lid)
                 except:
                     pass
-                self.edges.remove((a, b, lid))
+            self.node_index.clear()
+            self.edge_index.clear()
+            self.dirty_nodes.clear()
+            self.dirty_edges.clear()
+            self.coarse_nodes.clear()
             
             # Add start and stop blocks again
             self.add_block("start", "Start", 120, 120)
             self.add_block("stop", "Stop", 900, 120)
             
             self.selected_node = None
+            self.selected_nodes = set()
             self.selected_edge = None
 
     def align_blocks(self):
@@ -768,23 +1203,20 @@ class VisualFlowEditor(tk.Toplevel):
             col = i % grid_width
             node["x"] = start_x + col * spacing_x
             node["y"] = start_y + row * spacing_y
-            self.redraw_node(nid)
+        self.redraw_all()
 
     def topo_sort(self):
-        adj = {nid: [] for nid in self.nodes}
-        indeg = {nid: 0 for nid in self.nodes}
-        for a,b,_ in self.edges:
-            if a in adj:
-                adj[a].append(b)
-                indeg[b] += 1
-        starts = [nid for nid,v in self.nodes.items() if v["type"]=="start"] or [nid for nid in self.nodes if indeg[nid]==0]
+        starts = [nid for nid,v in self.nodes.items() if v["type"]=="start"] or \
+                 [nid for nid in self.nodes if self.edges.in_degree(nid)==0]
         order = []
         vis = set()
-        def dfs(u):
-            if u in vis: return
+        # DFS en preorden con pila explícita (flujos largos superarían el límite de recursión)
+        stack = list(reversed(starts))
+        while stack:
+            u = stack.pop()
+            if u in vis: continue
             vis.add(u); order.append(u)
-            for v in adj.get(u,[]): dfs(v)
-        for s in starts: dfs(s)
+            stack.extend(reversed(self.edges.successors(u)))
         return order
 
     def export_to_json(self):
@@ -894,6 +1326,11 @@ class VisualFlowEditor(tk.Toplevel):
             step.update(n["params"])
             steps.append(step)
         doc = {"steps": steps}
+        try:
+            program = compile_script(doc)
+        except ScriptCompileError as e:
+            messagebox.showerror("Script inválido", str(e))
+            return
         # pedir dispositivo
         devices = list_devices()
         if not devices:
@@ -907,17 +1344,14 @@ class VisualFlowEditor(tk.Toplevel):
                 messagebox.showwarning("Device", "Selecciona un dispositivo válido.")
                 return
         stop_ev = threading.Event()
-        threading.Thread(target=lambda: execute_script_for_device(serial, doc, log_cb=self._log_callback, stop_event=stop_ev), daemon=True).start()
+        threading.Thread(target=lambda: execute_script_for_device(serial, program, log_cb=self._log_callback, stop_event=stop_ev), daemon=True).start()
 
     def _log_callback(self, msg):
-        # intenta volcar al inject_target si existe (no ideal), else print
-        print(msg)
-        if self.inject_target:
-            try:
-                self.inject_target.insert(tk.END, msg + "\n")
-                self.inject_target.see(tk.END)
-            except:
-                pass
+        # se llama desde el hilo de ejecución: solo encolar en el sumidero
+        if self.log_cb:
+            self.log_cb(msg)
+        else:
+            print(msg)
 
     def start_recorder_for_device(self, serial, duration=5):
         """
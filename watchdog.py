@@ -0,0 +1,199 @@
+# watchdog.py
+# Plazos por acción y por script, y registro de dispositivos colgados.
+# Los ejecutores envuelven cada acción en Watchdog.watch(); si vence el plazo
+# un hilo vigilante mata los procesos adb del dispositivo, cierra su sesión de
+# shell y su conexión UIA (para desbloquear al hilo atascado) y lo marca como
+# no saludable: el JobScheduler deja de mandarle trabajos hasta que vuelve a
+# conectarse o pasa UNHEALTHY_COOLDOWN.
+import collections
+import itertools
+import threading
+import time
+import adb_utils
+from shell_pool import get_shell_pool
+from uia_pool import invalidate_uia
+
+# Plazo (s) por acción; un paso puede fijar el suyo con "timeout"
+ACTION_TIMEOUTS = {
+    "open_link": 30, "shell": 60, "start_app": 30, "tap": 15, "text": 15, "keyevent": 15,
+    "swipe": 15, "broadcast": 15, "uia_click": 30, "uia_text": 30, "uia_exists": 30, "uia_scroll": 30,
+    # wait_for y las esperas adaptativas: margen sobre su propio plazo (una consulta colgada)
+    "wait_for": 30,
+}
+DEFAULT_ACTION_TIMEOUT = 30.0
+# Plazo (s) de un script completo (None = sin límite)
+SCRIPT_TIMEOUT = None
+# Margen del vigilante sobre el plazo de la acción: primero debe vencer el
+# timeout propio del comando (socket, subprocess) y solo si no, actúa él
+WATCHDOG_GRACE = 5.0
+# Un dispositivo no saludable vuelve a intentarse pasado este tiempo
+UNHEALTHY_COOLDOWN = 300.0
+CHECK_INTERVAL = 0.5
+
+
+class DeviceTimeout(Exception):
+    """Una acción superó su plazo. `recorded` indica si el vigilante ya lo anotó en el registro."""
+
+    def __init__(self, msg, recorded=False):
+        super().__init__(msg)
+        self.recorded = recorded
+
+
+def action_timeout(action, step=None):
+    if step is not None and step.get("timeout") is not None:
+        return float(step["timeout"])
+    return float(ACTION_TIMEOUTS.get(action, DEFAULT_ACTION_TIMEOUT))
+
+
+class HealthRegistry:
+    """Dispositivos no saludables (serial -> (desde, motivo)) y contadores de timeouts."""
+
+    def __init__(self, cooldown=UNHEALTHY_COOLDOWN):
+        self.cooldown = cooldown
+        self.timeouts = collections.Counter()
+        self._unhealthy = {}
+        self._lock = threading.Lock()
+
+    def record_timeout(self, serial, what, unhealthy=True):
+        with self._lock:
+            self.timeouts[serial] += 1
+            if unhealthy:
+                self._unhealthy[serial] = (time.time(), f"timeout en {what}")
+
+    def mark_unhealthy(self, serial, reason):
+        with self._lock:
+            self._unhealthy[serial] = (time.time(), reason)
+
+    def mark_healthy(self, serial):
+        with self._lock:
+            return self._unhealthy.pop(serial, None) is not None
+
+    def is_healthy(self, serial):
+        with self._lock:
+            entry = self._unhealthy.get(serial)
+            if entry is None:
+                return True
+            if self.cooldown is not None and time.time() - entry[0] > self.cooldown:
+                del self._unhealthy[serial]
+                return True
+            return False
+
+    def unhealthy(self):
+        """serial -> motivo de los dispositivos marcados (sin aplicar el cooldown)."""
+        with self._lock:
+            return {serial: reason for serial, (_, reason) in self._unhealthy.items()}
+
+    def counts(self):
+        with self._lock:
+            return {"timeouts": sum(self.timeouts.values()), "unhealthy": len(self._unhealthy)}
+
+    def reset(self):
+        with self._lock:
+            self._unhealthy.clear()
+            self.timeouts.clear()
+
+
+def recover_device(serial):
+    """Libera lo que pueda tener bloqueado a un hilo sobre `serial`."""
+    adb_utils.kill_adb_children(serial)
+    get_shell_pool().abort(serial)
+    invalidate_uia(serial)
+
+
+class _Guard:
+    __slots__ = ("id", "serial", "label", "deadline", "expired")
+
+    def __init__(self, guard_id, serial, label, deadline):
+        self.id = guard_id
+        self.serial = serial
+        self.label = label
+        self.deadline = deadline
+        self.expired = False
+
+
+class Watchdog:
+    """Un hilo vigila los plazos de las acciones en curso de todos los ejecutores."""
+
+    def __init__(self, registry, grace=WATCHDOG_GRACE, interval=CHECK_INTERVAL, recover=recover_device):
+        self.registry = registry
+        self.grace = grace
+        self.interval = interval
+        self.recover = recover
+        self._ids = itertools.count(1)
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, serial, label, timeout):
+        """
+        Context manager para una acción con plazo `timeout` (+ grace). Si el
+        vigilante actuó, al salir del bloque se lanza DeviceTimeout (en lugar
+        del error que provocó liberar el dispositivo, si lo hubo).
+        """
+        return _Watch(self, serial, label, timeout)
+
+    def _add(self, serial, label, timeout):
+        guard = _Guard(next(self._ids), serial, label, time.time() + timeout + self.grace)
+        with self._lock:
+            self._active[guard.id] = guard
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+                self._thread.start()
+        return guard
+
+    def _remove(self, guard):
+        with self._lock:
+            self._active.pop(guard.id, None)
+
+    def active(self):
+        with self._lock:
+            return [(g.serial, g.label, g.deadline) for g in self._active.values()]
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.time()
+            with self._lock:
+                expired = [g for g in self._active.values() if g.deadline <= now]
+                for g in expired:
+                    del self._active[g.id]
+                    g.expired = True
+            for g in expired:
+                self.registry.record_timeout(g.serial, g.label)
+                try:
+                    self.recover(g.serial)
+                except Exception:
+                    pass
+
+
+class _Watch:
+    def __init__(self, watchdog, serial, label, timeout):
+        self.watchdog = watchdog
+        self.args = (serial, label, timeout)
+        self.guard = None
+
+    def __enter__(self):
+        self.guard = self.watchdog._add(*self.args)
+        return self.guard
+
+    def __exit__(self, exc_type, exc, tb):
+        self.watchdog._remove(self.guard)
+        if self.guard.expired:
+            raise DeviceTimeout(f"{self.guard.label}: sin respuesta, dispositivo liberado", recorded=True) from exc
+        return False
+
+
+_registry = HealthRegistry()
+_watchdog = Watchdog(_registry)
+
+def get_health_registry():
+    return _registry
+
+def get_watchdog():
+    return _watchdog
+
+def handle_timeout(serial, error):
+    """Anota un DeviceTimeout que no registró el vigilante (venció el timeout del propio comando)."""
+    if not getattr(error, "recorded", False):
+        _registry.record_timeout(serial, str(error))
+        recover_device(serial)